@@ -1,19 +1,37 @@
 
+import numbers
 import numpy as np
 
-from sklearn.utils import check_random_state
-from scipy.stats import chi
-from sklearn.utils.random import sample_without_replacement
-import scipy.sparse as sp
-
-try:
-    from sklearn.utils import check_array
-except ImportError:
-    from sklearn.utils import check_arrays
-
-    def check_array(*args, **kwargs):
-        X, = check_arrays(*args, **kwargs)
-        return X
+from hadamard import fwht2
+from bundle import save_bundle, load_bundle
+from lazyjit import jit, prange
+
+# scipy, sklearn and numba are imported where they are first needed, so that
+# short-lived scripts (make_params.py) start quickly
+
+def check_array(*args, **kwargs):
+    try:
+        from sklearn.utils import check_array as _check_array
+    except ImportError:
+        from sklearn.utils import check_arrays
+
+        def _check_array(*args, **kwargs):
+            X, = check_arrays(*args, **kwargs)
+            return X
+    return _check_array(*args, **kwargs)
+
+def check_random_state(seed):
+    """ sklearn.utils.check_random_state, without importing sklearn """
+    if seed is None or seed is np.random:
+        return np.random.mtrand._rand
+    if isinstance(seed, (numbers.Integral, np.integer)):
+        return np.random.RandomState(seed)
+    if isinstance(seed, np.random.RandomState):
+        return seed
+    raise ValueError('%r cannot be used to seed a numpy.random.RandomState'
+                     ' instance' % seed)
+
+__version__ = '0.1'
 
 """
 Python code for Fastfood algorithm
@@ -50,31 +68,42 @@ def sparse_random_matrix(n_components, n_features, density='auto',random_state=N
         return 1 / np.sqrt(n_components),  components
 
     else:
-        # Generate location of non zero elements
-        indices = []
-        offset = 0
-        indptr = [offset]
-        for i in xrange(n_components):
-            # find the indices of the non-zero components for row i
-            n_nonzero_i = rng.binomial(n_features, density)
-            indices_i = sample_without_replacement(n_features, n_nonzero_i,
-                                                   random_state=rng)
-            indices.append(indices_i)
-            offset += n_nonzero_i
-            indptr.append(offset)
-
-        indices = np.concatenate(indices)
+        # number of non zero elements per row, and their locations: the first
+        # n_nonzero[i] columns of a random permutation of row i (all rows at once)
+        n_nonzero = rng.binomial(n_features, density, size=n_components)
+        order = np.argsort(rng.rand(n_components, n_features), axis=1)
+        keep = np.arange(n_features) < n_nonzero.reshape(-1, 1)
+        indices = np.sort(np.where(keep, order, n_features), axis=1)[keep]
 
         # Among non zero components the probability of the sign is 50%/50%
         data = rng.binomial(1, 0.5, size=np.size(indices)) * 2 - 1
 
-        # build the CSR structure by concatenating the rows
-        components = sp.csr_matrix((data, indices, indptr),
-                                   shape=(n_components, n_features))
-
-        components = components.toarray()
+        # G is small (k x d), fit keeps it dense and records the non-zero
+        # lanes instead (see Fastfood.sparse_G)
+        components = np.zeros((n_components, n_features), dtype=data.dtype)
+        components[np.repeat(np.arange(n_components), n_nonzero), indices] = data
         return np.sqrt(1 / density) / np.sqrt(n_components), components
 
+def iter_row_blocks(X, chunk_size):
+    '''
+    Split X into blocks of at most chunk_size rows. X is an array/memmap
+    (sliced, nothing is copied) or an iterable of row blocks.
+    '''
+    if hasattr(X, 'shape'):
+        for i in xrange(0, X.shape[0], chunk_size):
+            yield X[i:i+chunk_size]
+    else:
+        for block in X:
+            block = np.atleast_2d(block)
+            for i in xrange(0, block.shape[0], chunk_size):
+                yield block[i:i+chunk_size]
+
+def issparse(X):
+    '''
+    scipy.sparse matrix test, without importing scipy
+    '''
+    return hasattr(X, 'tocsr') and hasattr(X, 'nnz')
+
 def l2norm_along_axis1(X):
 
     return np.sqrt(np.einsum('ij,ij->i', X, X))
@@ -86,18 +115,30 @@ def HadamardMatrix(n=4):
     # make sure n is a power of 2
     assert (1 and ((n & (n - 1)) == 0) )
 
-    k = int(np.log2(n)-1)
-    h = np.array([[1, 1], [1, -1]])
-
-    for i in range(k):
-        row1 = np.hstack((h,h))
-        row2 = np.hstack((h, h*-1))
-        h = np.vstack((row1, row2))
+    # sylvester construction, each quadrant filled in place
+    h = np.empty((n, n), dtype=int)
+    h[0, 0] = 1
+    s = 1
+    while s < n:
+        h[:s, s:2*s] = h[:s, :s]
+        h[s:2*s, :s] = h[:s, :s]
+        h[s:2*s, s:2*s] = -h[:s, :s]
+        s *= 2
 
     return h
 
+def hadamard_rows(rows, d):
+    '''
+    rows of the (d x d) Sylvester Hadamard matrix without building it,
+    H[i, j] = (-1)^popcount(i & j)
+    '''
+    x = np.bitwise_and(np.reshape(rows, (-1, 1)), np.arange(d))
+    parity = np.zeros(x.shape, dtype=int)
+    while x.any():
+        parity ^= x & 1
+        x >>= 1
+    return 1 - 2*parity
 
-from numba import jit
 
 @jit(nopython=True)
 def fht(array_):
@@ -118,17 +159,18 @@ def fht(array_):
                 array_[i] += array_[j]
                 array_[j] = temp - array_[j]
 
-@jit(nopython=True)
 def is_power_of_two(input_integer):
     """ Test if an integer is a power of two. """
     if input_integer == 1:
         return False
     return input_integer != 0 and ((input_integer & (input_integer - 1)) == 0)
 
+_is_power_of_two = jit(nopython=True)(is_power_of_two)
+
 @jit(nopython=True)
 def fht2(array_):
     """ Two dimensional row-wise FHT. """
-    if not is_power_of_two(array_.shape[1]):
+    if not _is_power_of_two(array_.shape[1]):
         raise ValueError('Length of rows for fht2 must be a power of two')
 
     # loop through the dataset
@@ -136,6 +178,54 @@ def fht2(array_):
         fht(array_[x])
 
 
+def _gather_lanes_numpy(src, idx, g, lanes, dst, inplace):
+    """ NumPy fallback for gather_lanes, src[:, idx] is a copy either way """
+    w = src[:, idx] * g
+    dst[...] = 0.
+    dst[:, lanes] = w
+
+@jit(nopython=True, parallel=True, fallback=_gather_lanes_numpy)
+def gather_lanes(src, idx, g, lanes, dst, inplace):
+    """
+    dst = 0, then dst[:, lanes] = src[:, idx]*g, zero lanes are skipped.
+    inplace when dst is src (each row is copied first)
+    """
+    for r in prange(src.shape[0]):
+        row = src[r].copy() if inplace else src[r]
+        dst[r] = 0.
+        for t in xrange(lanes.shape[0]):
+            dst[r, lanes[t]] = row[idx[t]] * g[t]
+
+
+def _scatter_B_numpy(data, indices, indptr, B, out):
+    """
+    NumPy fallback for scatter_B. bincount adds in CSR order, so duplicates
+    are summed as the kernel does
+    """
+    m, n = out.shape
+    k, d = B.shape
+    rows = np.repeat(np.arange(m), np.diff(indptr))
+    cols = np.arange(k) * d + indices[:, np.newaxis]
+    at = (rows[:, np.newaxis] * n + cols).ravel()
+    w = (B[:, indices].T * data[:, np.newaxis]).ravel()
+    out[...] = np.bincount(at, weights=w, minlength=m*n).reshape((m, n))
+
+@jit(nopython=True, parallel=True, fallback=_scatter_B_numpy)
+def scatter_B(data, indices, indptr, B, out):
+    """
+    out[r] = B * x_r for every stack, flattened (m x k*d), from the CSR rows
+    of x. Only the non-zero entries are touched, duplicates are summed
+    """
+    k, d = B.shape
+    for r in prange(out.shape[0]):
+        out[r] = 0.
+        for p in xrange(indptr[r], indptr[r+1]):
+            j = indices[p]
+            v = data[p]
+            for i in xrange(k):
+                out[r, i*d + j] += B[i, j] * v
+
+
 class Fastfood( object ):
 
     def __init__( self, 
@@ -154,6 +244,10 @@ class Fastfood( object ):
         self.tradeoff = tradeoff
         self.verbose = verbose
         self.rng = check_random_state(self.random_state)
+        self._hw = {}
+        self._sparse = None
+        self.stats = None
+        self.cosine = ('exact', 512, False)
 
         assert (self.density <= 1.)
 
@@ -190,21 +284,43 @@ class Fastfood( object ):
 
     @staticmethod
     def fast_walsh_hadamard(result):
-        fht2(result)
+        # batched, multi-core engine. matches fht2 bit for bit (see hadamard.py)
+        fwht2(result)
 
     def apply_approximate_gaussian_matrix(self, B, G, P, X):
         """ Create mapping of all x_i by applying B, G and P step-wise """
         num_examples = X.shape[0]
-
-        result = np.multiply(B, X.reshape((1, num_examples, 1, self.d)))
+        st = self.stats
+        t = st.start() if st else 0
+
+        if issparse(X):
+            # scatter the non-zeros, X is never densified
+            X = X.tocsr()
+            result = np.empty((num_examples, self.n))
+            scatter_B(X.data.astype(np.float64), X.indices, X.indptr,
+                      np.asarray(B, dtype=np.float64), result)
+        else:
+            result = np.multiply(B, X.reshape((1, num_examples, 1, self.d)))
         result = result.reshape((num_examples*self.k, self.d))
+        if st: t = st.lap('B', t, num_examples, result.nbytes)
         Fastfood.fast_walsh_hadamard(result)
+        if st: t = st.lap('FWHT1', t, num_examples)
         result = result.reshape((num_examples, -1))
-        np.take(result, P, axis=1, mode='wrap', out=result)
-        np.multiply(np.ravel(G), result.reshape(num_examples, self.n),
-                    out=result)
+        sparse = self.sparse_G() if (G is self.G and P is self.P) else None
+        if sparse is not None:
+            # ternary G: only the non-zero lanes are gathered and scaled
+            lanes, idx, g = sparse
+            gather_lanes(result, idx, g, lanes, result, True)
+            if st: t = st.lap('P', t, num_examples)
+        else:
+            np.take(result, P, axis=1, mode='wrap', out=result)
+            if st: t = st.lap('P', t, num_examples)
+            np.multiply(np.ravel(G), result.reshape(num_examples, self.n),
+                        out=result)
+            if st: t = st.lap('G', t, num_examples)
         result = result.reshape(num_examples*self.k, self.d)
         Fastfood.fast_walsh_hadamard(result)
+        if st: st.lap('FWHT2', t, num_examples)
         return result
 
     def scale_transformed_data(self, S, VX):
@@ -228,13 +344,49 @@ class Fastfood( object ):
             X - decimal (instead of radians)
             U - hardware version of U will also change (2*pi coefficient)
             """
+            if self.cosine[0] != 'exact':
+                from cosine import cos_cycles
+                return cos_cycles(X, np.ravel(self.U), np.sqrt(2. / X.shape[1]),
+                                  *self.cosine)
             np.cos(2*np.pi*(X + self.U), X) # np.cos(X + self.U, X)
             return X * np.sqrt(2. / X.shape[1])
 
+    def set_cosine(self, backend='exact', lut_size=512, interpolate=False):
+        """
+        Cosine used by phi (tradeoff='mem'), see cosine.py
+            exact   - np.cos, float64
+            lut     - lut_size point table as in the hardware, truncated
+                      phase or linear interpolation
+            poly    - float32 polynomial
+        """
+        from cosine import BACKENDS
+        if backend not in BACKENDS:
+            raise ValueError('unknown cosine backend: %s'%backend)
+        if backend != 'exact' and self.tradeoff != 'mem':
+            raise ValueError('approximate cosine needs tradeoff=mem')
+        self.cosine = (backend, lut_size, interpolate)
+
+    def phi_error(self, X):
+        """ max and mean |feature error| of the cosine backend against exact """
+        approx = self.transform(X)
+        backend = self.cosine
+        self.cosine = ('exact', 512, False)
+        try:
+            e = np.abs(approx - self.transform(X))
+        finally:
+            self.cosine = backend
+        return { 'max' : float(e.max()), 'mean' : float(e.mean()) }
+
 
 
-    def fit(self, gType=1 ):
+    def fit(self, gType=1, procedural=False, n_jobs=None ):
+        """
+        Draw B, G, P, S and U. With procedural every stack is derived from
+        (seed, stack) only and can be regenerated anywhere (see procedural.py),
+        n_jobs then spreads the stacks over a process pool
+        """
         self.T = gType
+        self.procedural = procedural
         if self.verbose:
             print "Gaussian Matrix: "
             print "----------------"
@@ -249,6 +401,11 @@ class Fastfood( object ):
                 raise Exception
             print s
         
+        if procedural:
+            from procedural import ProceduralFastfood
+            ProceduralFastfood.from_model(self, gType).fill(self, n_jobs)
+            return
+
         # --- Software Diagonal Matrices ---   
         self.B = self.rng.randint( 2, size=(self.k, self.d) )*2 -1
 
@@ -265,6 +422,15 @@ class Fastfood( object ):
         self.P = np.hstack([(i*self.d)+self.rng.permutation(self.d)
                             for i in range(self.k)])
 
+        # apply_approximate_gaussian_matrix permutes with an in-place np.take,
+        # which can read entries it has already overwritten. Pi is the column
+        # mapping that take actually applies, for use by out-of-place paths
+        self.Pi = np.arange(self.n).reshape(1,-1)
+        np.take(self.Pi, self.P, axis=1, mode='wrap', out=self.Pi)
+        self.Pi = np.ravel(self.Pi)
+
+        from scipy.stats import chi
+
         np.random.seed(seed=23)
         self.S = np.multiply(1 / l2norm_along_axis1(coeff*self.G)
                                  .reshape((-1, 1)),
@@ -282,57 +448,438 @@ class Fastfood( object ):
         self.Vg - after the gaussian
         self.Vf - after the 2nd Hadamard
         self.H  - hadamard matrix 
+
+        these are only built when first used (see hw_matrix), so a software
+        only fit doesn't pay for the (n x d) matrices
         '''
-        B = self.B
         if self.pad>0:
-            B[:, -self.pad:] *= 0
-        H = HadamardMatrix(n=self.d)
-
-        # for each k in B, multiply the array elementwise with each row of H and vstack rows
-        V = np.vstack( [np.multiply( B[i], H) for i in range(self.k) ] )
-        # apply permutation to inidces (n indices for n_dicts)
-        p = np.arange(self.n).reshape(1,-1)
-        np.take(p, self.P, axis=1, mode='wrap', out=p)
-        p = np.ravel(p)
-        # then apply permutation of the indices to V. need to transpose because np.take works on cols
-        self.Vp = np.take( V.T, p, axis=1, mode='wrap' ).T
-
-        self.Vg = np.multiply( np.ravel(self.G), self.Vp.T ).T
-
-        # reshape H(d, d, 1)
-        H = H.reshape(H.shape[0], H.shape[1], 1)
-
-        # multiply combination of inputs after G with hadamard transform
-        Vh = np.vstack( [ np.multiply( self.Vg.reshape(self.k,self.d,self.d)[i], H ) for i in range(self.k) ] )
-        # simplify the expression, so it's represented as a multiple of the input (i.e. 0 + x2 -4x3 + x4)
-        Vf = np.zeros( shape=(self.d*self.k,self.d) )
-        for i in range(self.d*self.k):
-            for j in range(self.d):
-                Vf[i] += Vh[i][j]
-        self.Vf = Vf
-        self.H = HadamardMatrix(n=self.d)
-
-        # remove zero columns
+            self.B[:, -self.pad:] *= 0
+        self._hw = {}
+        self._sparse = None
+
+    def stack_seed(self):
+        """ seed the stacks appended by grow are derived from """
+        if isinstance(self.random_state, numbers.Integral):
+            return int(self.random_state)
+        if getattr(self, '_stack_seed', None) is None:
+            self._stack_seed = int(self.rng.randint(2**31 - 1))
+        return self._stack_seed
+
+    def grow(self, n_stacks=1):
+        """
+        Append n_stacks stacks (d dicts each) to a fitted model. The existing
+        stacks are left as they are. Stack i draws its B, G, P and U from
+        RandomState([seed, i]), so the result doesn't depend on how the growth
+        was split. S takes row i of the same chi(d) stream (seed 23) that fit
+        uses, i.e. the rows a fit with k stacks would have drawn.
+
+        The amplitude of phi depends on n, see extend_features for bringing
+        existing features up to date. Returns the first new stack
+        """
+        k0, d = self.k, self.d
+        k = k0 + n_stacks
+        seed = self.stack_seed()
+
+        if getattr(self, 'procedural', False):
+            from procedural import ProceduralFastfood
+            stacks = ProceduralFastfood.from_model(self).stacks(k0, k)
+            return self._append_stacks(
+                np.vstack([ s['B'] for s in stacks ]),
+                np.vstack([ s['G'] for s in stacks ]),
+                np.hstack([ i*d + s['P'] for i, s in zip(xrange(k0, k), stacks) ]),
+                np.vstack([ s['S'] for s in stacks ]),
+                np.hstack([ s['U'] for s in stacks ]))
+
+        B, G, P, U = [], [], [], []
+        for i in xrange(k0, k):
+            rng = np.random.RandomState([seed, i])
+            B.append(rng.randint(2, size=d)*2 - 1)
+            if self.T == 0:
+                coeff, g = 1, rng.normal(size=(1, d))
+            elif self.T == 1:
+                coeff, g = sparse_random_matrix(1, d, density=1., random_state=rng)
+            else:
+                coeff, g = sparse_random_matrix(1, d, density=self.density,
+                                                random_state=rng)
+            G.append(g[0])
+            P.append(i*d + rng.permutation(d))
+            U.append(rng.uniform(0, 2 * np.pi, size=d))
+        B = np.array(B)
+        G = np.array(G)
         if self.pad>0:
-            self.Vp = self.Vp[:,:-self.pad]
-            self.Vg = self.Vg[:,:-self.pad]
-            self.Vf = self.Vf[:,:-self.pad]
+            B[:, -self.pad:] *= 0
 
+        from scipy.stats import chi
+
+        # as in fit. coeff cancels (S = chi/|G|), the single stack one is
+        # used so that S doesn't depend on k
+        np.random.seed(seed=23)
+        S = np.multiply(1 / l2norm_along_axis1(coeff*G).reshape((-1, 1)),
+                        chi.rvs(d, size=(k, d))[k0:])
+        S = S*coeff
+        return self._append_stacks(B, G, np.hstack(P), S, np.hstack(U))
+
+    def _append_stacks(self, B, G, P, S, U):
+        """ add the rows of B, G, S and the lanes of P (global) and U """
+        k0, d = self.k, self.d
+        k = k0 + B.shape[0]
+        self.B = np.vstack([self.B, B])
+        self.G = np.vstack([self.G, G])
+        self.S = np.vstack([self.S, S])
+        self.P = np.hstack([self.P, P])
+        self.U = np.hstack([self.U, U])
+
+        # take only reads within a stack, so the existing part of Pi is kept
+        Pi = np.arange(k*d).reshape(1,-1)
+        np.take(Pi, self.P, axis=1, mode='wrap', out=Pi)
+        self.Pi = np.ravel(Pi)
+
+        self.k, self.n = k, k*d
+        self.n_dicts = self.n
+        self.S_hw = (1 / (self.sigma * np.sqrt(self.d)) ) * self.S
+        self.U_hw = 2*np.pi*self.U
+        self.A_hw = np.sqrt( 2./self.n )
+        self._hw = {}
+        self._sparse = None
+        return k0
+
+    def transform_stacks(self, X, lo, hi=None):
+        """
+        Features of stacks [lo, hi) only, the same values as the matching
+        columns of transformSW(X). For tradeoff accuracy the cos columns of
+        those stacks come first, then the sin columns
+        """
+        hi = self.k if hi is None else hi
+        assert (X.shape[1] == self.d_orig)
+        assert (0 <= lo < hi <= self.k)
+        m, d = X.shape[0], self.d
+        cols = slice(lo*d, hi*d)
+        n = (hi - lo)*d
+
+        X_padded = X if issparse(X) else self.pad_with_zeros(X)
+        if issparse(X_padded):
+            X_padded = X_padded.tocsr()
+            w0 = np.empty((m, n))
+            scatter_B(X_padded.data.astype(np.float64), X_padded.indices,
+                      X_padded.indptr, np.asarray(self.B[lo:hi], dtype=np.float64),
+                      w0)
+        else:
+            w0 = np.multiply(self.B[lo:hi], X_padded.reshape((m, 1, d)))
+        w0 = w0.reshape((m*(hi - lo), d))
+        Fastfood.fast_walsh_hadamard(w0)
+        w1 = np.take(w0.reshape((m, n)), np.ravel(self.Pi)[cols] - lo*d, axis=1)
+        np.multiply(np.ravel(self.G)[cols], w1, out=w1)
+        Fastfood.fast_walsh_hadamard(w1.reshape((m*(hi - lo), d)))
+
+        VX = (1 / (self.sigma * np.sqrt(self.d)) * np.multiply(np.ravel(self.S)[cols], w1))
+        if self.tradeoff == 'accuracy':
+            out = np.empty((m, 2*n))
+            np.cos(VX, out=out[:, :n])
+            np.sin(VX, out=out[:, n:])
+            out /= np.sqrt(self.n)
+            return out
+        from cosine import cos_cycles
+        return cos_cycles(VX, np.ravel(self.U)[cols], np.sqrt(2. / self.n),
+                          *self.cosine)
+
+    def extend_features(self, phi, X, k0):
+        """
+        Bring phi = transformSW(X) of the model with k0 stacks up to the grown
+        model: the existing columns are rescaled to the new n (the amplitude
+        depends on n) and only the new stacks are transformed
+        """
+        n0 = k0*self.d
+        new = self.transform_stacks(X, k0)
+        scale = np.sqrt(float(n0) / self.n)
+        if self.tradeoff == 'accuracy':
+            n1 = self.n - n0
+            return np.hstack([phi[:, :n0] * scale, new[:, :n1],
+                              phi[:, n0:] * scale, new[:, n1:]])
+        return np.hstack([phi * scale, new])
+
+    def hw_matrix(self, name):
+        """ build (once) and return the hardware matrix H, Vp, Vg or Vf """
+        if name not in self._hw:
+            if name == 'H':
+                M = HadamardMatrix(n=self.d)
+            elif name == 'Vp':
+                M = self.build_Vp()
+            elif name == 'Vg':
+                M = self.build_Vg()
+            elif name == 'Vf':
+                M = self.build_Vf()
+            else:
+                raise ValueError('unknown hardware matrix: %s'%name)
+            # remove zero columns
+            if name != 'H' and self.pad>0:
+                M = M[:,:-self.pad]
+            self._hw[name] = M
+        return self._hw[name]
+
+    def sparse_G(self):
+        """
+        (lanes, idx, g) for ternary G: the flat indices of its non-zero
+        entries, the source column (Pi) feeding each one and its value.
+        None for the dense gTypes
+        """
+        if self.T != 2:
+            return None
+        if self._sparse is None:
+            lanes = np.flatnonzero(np.ravel(self.G))
+            self._sparse = (lanes, np.ravel(self.Pi)[lanes],
+                            np.ravel(self.G)[lanes].astype(np.float64))
+        return self._sparse
+
+    @property
+    def H(self):
+        return self.hw_matrix('H')
+
+    @property
+    def Vp(self):
+        return self.hw_matrix('Vp')
+
+    @property
+    def Vg(self):
+        return self.hw_matrix('Vg')
+
+    @property
+    def Vf(self):
+        return self.hw_matrix('Vf')
+
+    def build_Vp(self, rows=None):
+        """ P.H.B as rows over the inputs, including the padding columns """
+        # row r of the (k*d x d) stack [B[0]*H; B[1]*H; ...] is B[r/d]*H[r%d].
+        # the permutation picks row Pi[j] for output j
+        Pi = self.Pi if rows is None else np.ravel(self.Pi)[rows]
+        return np.multiply( hadamard_rows(Pi % self.d, self.d),
+                            self.B[Pi // self.d] )
+
+    def build_Vg(self):
+        """ G.P.H.B, for ternary G only the non-zero rows are computed """
+        sparse = self.sparse_G()
+        if sparse is None:
+            return np.multiply( np.ravel(self.G), self.build_Vp().T ).T
+        lanes = sparse[0]
+        Vp = self.build_Vp(rows=lanes)
+        Vg = np.zeros((self.n, self.d), dtype=Vp.dtype)
+        Vg[lanes] = np.multiply( np.ravel(self.G)[lanes], Vp.T ).T
+        return Vg
+
+    def build_Vf(self):
+        """ H.G.P.H.B as rows over the inputs, including the padding columns """
+        # within stack i, Vf_i = H.Vg_i, i.e. a FWHT down the columns of Vg_i
+        Vg = self.build_Vg()
+        Vf = Vg.reshape(self.k, self.d, self.d).transpose(0, 2, 1)
+        Vf = np.ascontiguousarray(Vf, dtype=np.float64)
+        Fastfood.fast_walsh_hadamard(Vf.reshape(self.k*self.d, self.d))
+        return Vf.transpose(0, 2, 1).reshape(self.k*self.d, self.d)
+
+
+    def enable_stats(self, stats=None):
+        """
+        Record per-stage time, rows and allocations of every transform (see
+        stagestats.py). Returns the StageStats
+        """
+        if stats is None:
+            from stagestats import StageStats
+            stats = StageStats()
+        self.stats = stats
+        return stats
+
+    def disable_stats(self):
+        self.stats = None
 
     def transformSW(self, X):
         
         assert (X.shape[1] == self.d_orig)
+        m = X.shape[0]
+        st = self.stats
+        t = st.start() if st else 0
 
-        X_padded = self.pad_with_zeros(X) #pad if X dim not power of 2
+        # pad if X dim not power of 2. scipy.sparse X (CSR/CSC) is used as
+        # is, B's padding columns are zero
+        X_padded = X if issparse(X) else self.pad_with_zeros(X)
+        # sparse X is not copied, nothing allocated
+        if st: st.lap('pad', t, m, 0 if issparse(X) else X_padded.nbytes)
 
         HGPHBX = self.apply_approximate_gaussian_matrix(self.B,
                                                         self.G,
                                                         self.P,
                                                         X_padded)
+        t = st.start() if st else 0
         VX = self.scale_transformed_data(self.S, HGPHBX)
+        # the product and the scaled copy
+        if st: t = st.lap('S', t, m, 2*VX.nbytes)
         phi = self.phi(VX)
+        # mem: X + U, 2*pi*(.), and the scaled copy. accuracy: cos|sin out
+        if st: st.lap('phi', t, m, (3 if self.tradeoff == 'mem' else 2)*VX.nbytes)
+        return phi
+
+    def n_outputs(self):
+        """ number of feature columns produced by phi """
+        return 2*self.n if self.tradeoff == 'accuracy' else self.n
+
+    def chunk_buffers(self, chunk_size):
+        """
+        Allocate the working set for transform_chunk. Reused across chunks, so
+        memory depends on chunk_size only.
+        """
+        return { 'X'   : np.zeros((chunk_size, self.d)),
+                 'W0'  : np.empty((chunk_size, self.n)),
+                 'W1'  : np.empty((chunk_size, self.n)),
+                 'phi' : np.empty((chunk_size, self.n_outputs())) }
+
+    def transform_chunk(self, X, buf, out=None):
+        """
+        transformSW for one block of rows using the preallocated buffers. Same
+        operations (and same results) as transformSW, done in place.
+        Returns a view into buf['phi'], or out (m x n_outputs) if given.
+        """
+        m = X.shape[0]
+        assert (X.shape[1] == self.d_orig)
+        assert (m <= buf['X'].shape[0])
+        st = self.stats
+        t = st.start() if st else 0
+
+        # B, H
+        w0 = buf['W0'][:m]
+        if issparse(X):
+            X = X.tocsr()
+            scatter_B(X.data.astype(np.float64), X.indices, X.indptr,
+                      np.asarray(self.B, dtype=np.float64), w0)
+        else:
+            # pad: columns d_orig..d stay zero
+            x = buf['X'][:m]
+            x[:, :self.d_orig] = X
+            if st: t = st.lap('pad', t, m)
+            np.multiply(self.B, x.reshape((m, 1, self.d)),
+                        out=w0.reshape((m, self.k, self.d)))
+        if st: t = st.lap('B', t, m)
+        Fastfood.fast_walsh_hadamard(w0.reshape((m*self.k, self.d)))
+        if st: t = st.lap('FWHT1', t, m)
+
+        # P, G, H
+        w1 = buf['W1'][:m]
+        sparse = self.sparse_G()
+        if sparse is not None:
+            # ternary G: only the non-zero lanes are gathered and scaled
+            lanes, idx, g = sparse
+            gather_lanes(w0, idx, g, lanes, w1, False)
+            if st: t = st.lap('P', t, m)
+        else:
+            # mode='raise' would buffer the output, Pi is always in range
+            np.take(w0, self.Pi, axis=1, out=w1, mode='clip')
+            if st: t = st.lap('P', t, m)
+            np.multiply(np.ravel(self.G), w1, out=w1)
+            if st: t = st.lap('G', t, m)
+        Fastfood.fast_walsh_hadamard(w1.reshape((m*self.k, self.d)))
+        if st: t = st.lap('FWHT2', t, m)
+
+        # S
+        phi = buf['phi'][:m] if out is None else out
+        vx = w1 if self.tradeoff == 'accuracy' else phi
+        np.multiply(np.ravel(self.S), w1, out=vx)
+        vx *= 1 / (self.sigma * np.sqrt(self.d))
+        if st: t = st.lap('S', t, m)
+
+        # phi
+        if self.tradeoff == 'accuracy':
+            np.cos(vx, out=phi[:, :self.n])
+            np.sin(vx, out=phi[:, self.n:])
+            phi /= np.sqrt(self.n)
+        elif self.cosine[0] != 'exact':
+            from cosine import cos_cycles
+            cos_cycles(phi, np.ravel(self.U), np.sqrt(2. / self.n), *self.cosine)
+        else:
+            phi += self.U
+            phi *= 2*np.pi
+            np.cos(phi, out=phi)
+            phi *= np.sqrt(2. / self.n)
+        if st: st.lap('phi', t, m)
         return phi
 
+    def transformSW_iter(self, X, chunk_size=1024):
+        """
+        Streaming transformSW. X can be an array, an np.memmap or any iterable
+        of row blocks. Yields one feature block per chunk of at most chunk_size
+        rows. The blocks are views into a reused buffer, copy them if they are
+        needed after the next iteration.
+        """
+        buf = self.chunk_buffers(chunk_size)
+        for block in iter_row_blocks(X, chunk_size):
+            yield self.transform_chunk(block, buf)
+
+    def transform(self, X, out=None, workspace=None):
+        """
+        transformSW(X) without temporaries. workspace comes from
+        chunk_buffers(rows) and is reused across calls (X can have more rows,
+        it is then done in workspace sized blocks), the features are written
+        straight into out. With both given a call allocates nothing.
+        Returns out
+        """
+        m = X.shape[0]
+        if workspace is None:
+            workspace = self.chunk_buffers(m)
+        if out is None:
+            out = np.empty((m, self.n_outputs()))
+        assert (out.shape == (m, self.n_outputs()))
+
+        step = workspace['X'].shape[0]
+        if m <= step:
+            return self.transform_chunk(X, workspace, out=out) if m else out
+        for lo in xrange(0, m, step):
+            hi = min(lo + step, m)
+            self.transform_chunk(X[lo:hi], workspace, out=out[lo:hi])
+        return out
+
+    def transformSW_stream(self, X, out=None, chunk_size=1024):
+        """
+        Streaming transformSW that writes into out (an array or np.memmap of
+        shape (m, n_outputs)). Peak memory is set by chunk_size.
+        """
+        if out is None:
+            if not hasattr(X, 'shape'):
+                raise ValueError('out is required when X is an iterator')
+            out = np.empty((X.shape[0], self.n_outputs()))
+
+        # features go straight into out, no intermediate copy
+        buf = self.chunk_buffers(chunk_size)
+        row = 0
+        for block in iter_row_blocks(X, chunk_size):
+            self.transform_chunk(block, buf, out=out[row:row+block.shape[0]])
+            row += block.shape[0]
+
+        assert (row == out.shape[0])
+        if isinstance(out, np.memmap):
+            out.flush()
+        return out
+
+    def transformSW_parallel(self, X, out=None, n_jobs=None, shard_size=16384):
+        """
+        transformSW(X) sharded over a process pool (see sharded.py), results
+        are identical to the serial path
+        """
+        from sharded import ShardedTransform
+        with ShardedTransform(self, n_jobs=n_jobs, shard_size=shard_size) as st:
+            return st.transform(X, out=out)
+
+    def predict(self, X, alpha, out=None):
+        """
+        transformSW(X) . alpha^T, alpha is (outputs x n_outputs). The features
+        are computed stack by stack and summed into the outputs straight
+        away, phi is never stored (see readout.py)
+        """
+        from readout import predict
+        return predict(self, X, alpha, out=out)
+
+    def row_predictor(self, alpha):
+        """
+        Compiled single sample predictor, p(x) = phi(x) . alpha^T with no
+        allocation per call (see readout.RowPredictor)
+        """
+        from readout import RowPredictor
+        return RowPredictor(self, alpha)
+
     def transformHW(self, X, task='Vf'):
         # we don't need to pad with zeros (already truncated)
         if self.verbose:
@@ -359,6 +906,72 @@ class Fastfood( object ):
         phi = self.phi(VX)
         return phi
 
+    def save(self, filename, hw=True, extra=None, seed=None,
+             bitWidth=0, fracWidth=0):
+        """
+        Write the fitted parameters to a binary bundle (see bundle.py).
+        hw also stores the H, Vp (PHB) and Vg (GPHB) matrices, extra is a
+        dict of additional arrays (eg. ALPHA, X)
+        """
+        arrays = { 'B' : self.B, 'G' : self.G, 'P' : self.P, 'Pi' : self.Pi,
+                   'S' : self.S, 'U' : self.U, 'S_hw' : self.S_hw,
+                   'U_hw' : self.U_hw }
+        if hw:
+            for name in ['H', 'Vp', 'Vg']:
+                arrays[name] = self.hw_matrix(name)
+        if self.T == 2:
+            # non-zero taps of ternary G (the multipliers the hardware needs)
+            lanes = self.sparse_G()[0]
+            arrays['G_lanes'] = lanes.astype(np.uint32)
+            arrays['G_taps'] = np.ravel(self.G)[lanes].astype(np.int8)
+        if extra is not None:
+            arrays.update(extra)
+
+        if seed is None:
+            seed = self.random_state if isinstance(self.random_state, int) else -1
+
+        save_bundle(filename, arrays, d=self.d, n=self.n, k=self.k,
+                    d_orig=self.d_orig, gType=self.T, tradeoff=self.tradeoff,
+                    seed=seed, sigma=self.sigma, density=self.density,
+                    bitWidth=bitWidth, fracWidth=fracWidth)
+
+    def compact(self):
+        """ bit-packed / narrow-int copy of the parameters (see compact.py) """
+        from compact import CompactFastfood
+        return CompactFastfood.from_model(self)
+
+    @staticmethod
+    def load(filename, mmap=True, verbose=False):
+        """
+        Fitted Fastfood from a bundle written by save. With mmap the
+        parameters stay in the (read-only) file mapping
+        """
+        meta, arrays = load_bundle(filename, mmap=mmap)
+        if 'PROC' in arrays:
+            from procedural import ProceduralFastfood
+            return ProceduralFastfood.from_meta(meta).materialize(verbose=verbose)
+        if 'Bbits' in arrays:
+            from compact import CompactFastfood
+            return CompactFastfood(meta, arrays).expand(verbose=verbose)
+
+        f = Fastfood(sigma=meta['sigma'],
+                     n_features=meta['d_orig'],
+                     n_dicts=meta['n'],
+                     sparsity=1-meta['density'],
+                     random_state=None if meta['seed'] < 0 else meta['seed'],
+                     tradeoff=meta['tradeoff'],
+                     verbose=verbose)
+        assert ((f.d, f.n, f.k) == (meta['d'], meta['n'], meta['k']))
+
+        f.T = meta['gType']
+        for name in ['B', 'G', 'P', 'Pi', 'S', 'U', 'S_hw', 'U_hw']:
+            setattr(f, name, arrays[name])
+        f.A_hw = np.sqrt( 2./f.n )
+        for name in ['H', 'Vp', 'Vg']:
+            if name in arrays:
+                f._hw[name] = arrays[name]
+        return f
+
 
 
 def testHardwareRepresentation():
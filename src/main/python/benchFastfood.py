@@ -0,0 +1,252 @@
+
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import time
+
+import numpy as np
+
+from Fastfood import Fastfood, fht2, __version__
+from hadamard import fwht2
+
+"""
+Throughput benchmark of the Fastfood hot paths over a (d, n, batch) grid
+
+    fht2, fwht2             - (batch*k x d) Hadamard block
+    gaussian                - apply_approximate_gaussian_matrix
+    transformSW             - the whole software transform
+    transformHW_{Vp,Vg,Vf}  - hardware representations (matrices prebuilt)
+    phi                     - cosine features of a (batch x n) block
+    fit                     - per (d, n), batch is 0
+    rbf, nystroem           - sklearn RBFSampler / Nystroem transform with
+                              n components, as in testFeatures.py
+
+    Every (d, n, batch) case runs in a forked child, so peak RSS (ru_maxrss)
+    is per case. Reported: best-of-repeats seconds, samples/s, ns per output
+    feature (seconds / (batch*n)) and peak RSS. Cases whose (batch x n)
+    block is over max_elems are skipped.
+
+    With a baseline results file, every case whose ns/feature went up by
+    more than threshold (default 10%) is listed and the exit code is 1.
+
+    latency: per-event (single row) prediction phi(x).alpha^T through
+    RowPredictor (readout.py) for each cosine backend, and transformSW plus
+    dot for comparison. Every call is timed, p50/p99/p999 in microseconds
+    (time.time resolution, ~0.25us).
+
+run:    python benchFastfood.py [quick|full] [results.json] [baseline.json] [threshold]
+        python benchFastfood.py latency [d] [n]
+"""
+
+GRIDS = {
+    'quick' : { 'd' : [16, 64, 256], 'n' : [128, 1024, 4096],
+                'batch' : [1, 100, 10000] },
+    'full'  : { 'd' : [16, 32, 64, 128, 256, 512, 1024],
+                'n' : [128, 512, 2048, 8192, 16384],
+                'batch' : [1, 10, 100, 1000, 10000, 100000] },
+}
+
+TASKS = ['Vp', 'Vg', 'Vf']
+MAX_ELEMS = 1 << 27       # largest (batch x n) block, 1GB in float64
+MAX_BASELINE_N = 4096     # Nystroem's fit is O(n^3)
+MIN_TIME = 0.2            # seconds per measurement
+
+
+def timeit(fn, setup=None, min_time=MIN_TIME, repeat=3):
+    """ best time of one call. setup() makes fresh (in-place) arguments """
+    best = np.inf
+    for _ in xrange(repeat):
+        n_calls = 0
+        elapsed = 0.
+        while elapsed < min_time / repeat or n_calls == 0:
+            args = setup() if setup is not None else ()
+            t0 = time.time()
+            fn(*args)
+            dt = time.time() - t0
+            elapsed += dt
+            n_calls += 1
+            best = min(best, dt)
+    return best
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.
+
+def _model(d, n, seed=41):
+    f = Fastfood(sigma=11.47, n_features=d, n_dicts=n, random_state=seed)
+    f.fit( gType=1 )
+    return f
+
+def _case(d, n, batch, baselines):
+    """ all ops of one (d, n, batch) case, run in the child """
+    rng = np.random.RandomState(0)
+    f = _model(d, n)
+    X = rng.randn(batch, d)
+    Xp = f.pad_with_zeros(X)
+    VX = rng.rand(batch, f.n)
+    block = rng.randn(batch*f.k, f.d)
+    for task in TASKS:
+        f.hw_matrix(task)
+
+    ops = [
+        ('fht2', lambda a: fht2(a), lambda: (block.copy(),)),
+        ('fwht2', lambda a: fwht2(a), lambda: (block.copy(),)),
+        ('gaussian', lambda: f.apply_approximate_gaussian_matrix(f.B, f.G, f.P, Xp), None),
+        ('transformSW', lambda: f.transformSW(X), None),
+        ('phi', lambda a: f.phi(a), lambda: (VX.copy(),)),
+    ]
+    for task in TASKS:
+        ops.append(('transformHW_' + task,
+                    lambda task=task: f.transformHW(X, task=task), None))
+
+    if baselines and n <= MAX_BASELINE_N:
+        from sklearn.kernel_approximation import RBFSampler, Nystroem
+        gamma = 1. / (2 * f.sigma**2)
+        train = rng.randn(max(n, 1000), d)
+        rbf = RBFSampler(gamma=gamma, n_components=n, random_state=1).fit(train)
+        nys = Nystroem(gamma=gamma, n_components=n, random_state=1).fit(train)
+        ops.append(('rbf', lambda: rbf.transform(X), None))
+        ops.append(('nystroem', lambda: nys.transform(X), None))
+
+    results = []
+    for name, fn, setup in ops:
+        rss0 = peak_rss_mb()
+        t = timeit(fn, setup)
+        results.append(dict(op=name, d=d, n=n, batch=batch, seconds=t,
+                            samples_per_s=batch / t,
+                            ns_per_feature=1e9 * t / (batch * n),
+                            peak_rss_mb=peak_rss_mb(),
+                            rss_growth_mb=peak_rss_mb() - rss0))
+    return results
+
+def _fit_case(d, n):
+    t = timeit(lambda: _model(d, n), repeat=1)
+    return [dict(op='fit', d=d, n=n, batch=0, seconds=t, samples_per_s=0.,
+                 ns_per_feature=1e9 * t / n, peak_rss_mb=peak_rss_mb(),
+                 rss_growth_mb=0.)]
+
+def _child(queue, fn, args):
+    try:
+        queue.put(fn(*args))
+    except Exception as e:
+        queue.put(e)
+
+def isolated(fn, *args):
+    """ fn(*args) in a forked child """
+    queue = multiprocessing.Queue()
+    p = multiprocessing.Process(target=_child, args=(queue, fn, args))
+    p.start()
+    out = queue.get()
+    p.join()
+    if isinstance(out, Exception):
+        raise out
+    return out
+
+def bench(grid='quick', baselines=True, max_elems=MAX_ELEMS, verbose=True):
+    g = GRIDS[grid] if isinstance(grid, str) else grid
+
+    # compile the kernels once, the children inherit them
+    _model(16, 32).transformSW(np.ones((2, 16)))
+    fht2(np.ones((2, 16)))
+
+    results = []
+    for d in g['d']:
+        for n in g['n']:
+            if n < d:
+                continue
+            results += isolated(_fit_case, d, n)
+            for batch in g['batch']:
+                if batch * n > max_elems:
+                    continue
+                case = isolated(_case, d, n, batch, baselines)
+                results += case
+                if verbose:
+                    for r in case:
+                        print "%-16s d=%-5d n=%-6d batch=%-7d %12.1f samples/s %9.2f ns/feature %8.1f MB"%(
+                            r['op'], r['d'], r['n'], r['batch'], r['samples_per_s'],
+                            r['ns_per_feature'], r['peak_rss_mb'])
+
+    meta = { 'version' : __version__, 'numpy' : np.__version__,
+             'python' : platform.python_version(), 'machine' : platform.machine(),
+             'cpus' : multiprocessing.cpu_count(), 'grid' : grid,
+             'jit' : os.environ.get('FASTFOOD_JIT', '1'), 'time' : time.time() }
+    return { 'meta' : meta, 'results' : results }
+
+def latency(d=64, n=128, n_events=100000, outputs=1, verbose=True):
+    """ per-event latency percentiles of the single row predictors """
+    from readout import RowPredictor
+    rng = np.random.RandomState(0)
+    f = _model(d, n)
+    alpha = rng.randn(outputs, f.n_outputs())
+    X = rng.randn(n_events, d)
+    t = np.empty(n_events)
+
+    def reference(x):
+        return np.dot(f.transformSW(x.reshape(1, -1)), alpha.T)
+
+    cases = []
+    for backend in ['exact', 'lut', 'poly']:
+        f.set_cosine(backend)
+        cases.append(('row_' + backend, RowPredictor(f, alpha), n_events))
+    f.set_cosine('exact')
+    cases.append(('transformSW_dot', reference, n_events // 20))
+
+    results = []
+    for name, fn, m in cases:
+        for i in xrange(min(m, 1000)):
+            fn(X[i])
+        for i in xrange(m):
+            x = X[i]
+            t0 = time.time()
+            fn(x)
+            t[i] = time.time() - t0
+        us = 1e6 * t[:m]
+        r = dict(op=name, d=d, n=f.n, batch=1, events=m,
+                 p50_us=np.percentile(us, 50), p99_us=np.percentile(us, 99),
+                 p999_us=np.percentile(us, 99.9), mean_us=us.mean())
+        results.append(r)
+        if verbose:
+            print "%-16s d=%-5d n=%-6d p50 %8.2f us  p99 %8.2f us  p999 %8.2f us  mean %8.2f us"%(
+                name, d, f.n, r['p50_us'], r['p99_us'], r['p999_us'], r['mean_us'])
+    return results
+
+def _key(r):
+    return (r['op'], r['d'], r['n'], r['batch'])
+
+def regressions(results, baseline, threshold=0.1):
+    """ cases of results that are slower than in baseline by > threshold """
+    base = dict((_key(r), r) for r in baseline['results'])
+    slow = []
+    for r in results['results']:
+        b = base.get(_key(r))
+        if b is not None and r['ns_per_feature'] > (1 + threshold) * b['ns_per_feature']:
+            slow.append((r, r['ns_per_feature'] / b['ns_per_feature'] - 1))
+    return slow
+
+
+
+if __name__ == "__main__":
+
+    if len(sys.argv) > 1 and sys.argv[1] == 'latency':
+        latency(*[int(a) for a in sys.argv[2:4]])
+        sys.exit(0)
+
+    grid = sys.argv[1] if len(sys.argv) > 1 else 'quick'
+    results = bench(grid)
+
+    if len(sys.argv) > 2:
+        with open(sys.argv[2], 'w') as f:
+            json.dump(results, f, indent=1, sort_keys=True)
+
+    if len(sys.argv) > 3:
+        with open(sys.argv[3]) as f:
+            baseline = json.load(f)
+        threshold = float(sys.argv[4]) if len(sys.argv) > 4 else 0.1
+        slow = regressions(results, baseline, threshold)
+        for r, change in slow:
+            print "SLOWER %-16s d=%-5d n=%-6d batch=%-7d +%.0f%%"%(
+                r['op'], r['d'], r['n'], r['batch'], 100*change)
+        print "%d regressions over %.0f%%"%(len(slow), 100*threshold)
+        sys.exit(1 if slow else 0)
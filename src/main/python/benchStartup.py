@@ -0,0 +1,84 @@
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+
+"""
+Startup benchmark: import-to-first-transform latency of a fresh interpreter,
+which is what every make_params.py call from a scala tester pays
+
+    cold    - empty numba cache, kernels are compiled
+    cached  - kernels loaded from the on-disk cache
+    numpy   - FASTFOOD_JIT=0, NumPy fallback kernels, numba never imported
+
+run:    python benchStartup.py [n_runs] [results.json]
+"""
+
+CHILD = '''
+import time
+t0 = time.time()
+import numpy as np
+from Fastfood import Fastfood
+t1 = time.time()
+f = Fastfood(sigma=11.47, n_features=8, n_dicts=16, random_state=41)
+f.fit( gType=1 )
+t2 = time.time()
+f.transformSW( np.ones((10, 8)) )
+t3 = time.time()
+print("%f %f %f" % (t1 - t0, t2 - t1, t3 - t2))
+'''
+
+def run(env):
+    here = os.path.dirname(os.path.abspath(__file__))
+    out = subprocess.check_output([sys.executable, '-W', 'ignore', '-c', CHILD],
+                                  cwd=here, env=env)
+    return [float(x) for x in out.split()]
+
+def bench(n_runs=5):
+    results = {}
+    base = dict(os.environ)
+
+    cache = tempfile.mkdtemp()
+    try:
+        cold = []
+        for _ in xrange(n_runs):
+            shutil.rmtree(cache)
+            os.makedirs(cache)
+            cold.append(run(dict(base, NUMBA_CACHE_DIR=cache)))
+        results['cold'] = cold
+        results['cached'] = [run(dict(base, NUMBA_CACHE_DIR=cache)) for _ in xrange(n_runs)]
+    finally:
+        shutil.rmtree(cache)
+    results['numpy'] = [run(dict(base, FASTFOOD_JIT='0')) for _ in xrange(n_runs)]
+
+    summary = {}
+    for mode, times in results.items():
+        t = np.median(np.array(times), axis=0)
+        summary[mode] = { 'import' : t[0], 'fit' : t[1], 'transform' : t[2],
+                          'total' : float(np.sum(t)) }
+    return summary
+
+
+
+if __name__ == "__main__":
+
+    n_runs = 5
+    if len(sys.argv) > 1:
+        n_runs = int( sys.argv[1] )
+
+    summary = bench(n_runs)
+
+    print "%-8s %10s %10s %10s %10s"%("mode", "import", "fit", "transform", "total")
+    for mode in ['cold', 'cached', 'numpy']:
+        s = summary[mode]
+        print "%-8s %9.3fs %9.3fs %9.3fs %9.3fs"%(mode, s['import'], s['fit'],
+                                                 s['transform'], s['total'])
+
+    if len(sys.argv) > 2:
+        with open(sys.argv[2], 'w') as f:
+            json.dump(summary, f, indent=2, sort_keys=True)
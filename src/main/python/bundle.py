@@ -0,0 +1,115 @@
+
+import numpy as np
+import struct
+
+"""
+Binary parameter bundle (.ffb)
+    - replaces the CSV dump in make_params.py (CSV is still available there)
+    - fixed little-endian header, an array directory, then raw arrays
+    - load_bundle memory-maps the file, arrays are zero-copy views
+    - read on the scala side by utils.ffBundle
+
+Layout (version 1, all little-endian):
+
+    offset  size
+    0       8       magic "FFBUNDLE"
+    8       4       version
+    12      4       number of arrays
+    16      4       d
+    20      4       n
+    24      4       k
+    28      4       d_orig (input dimension before padding)
+    32      4       gType
+    36      4       tradeoff (0 = mem, 1 = accuracy)
+    40      8       seed (-1 if the model was built from a RandomState)
+    48      8       sigma
+    56      8       density
+    64      4       bitWidth (0 = float parameters)
+    68      4       fracWidth
+    72      56      reserved
+    128     64*N    directory, one entry per array:
+                        16  name (ascii, zero padded)
+                        8   dtype (numpy dtype.str, eg. "<f8", "|i1")
+                        8   offset of the data from the start of the file
+                        4   ndim (<= 3)
+                        4   reserved
+                        24  shape (3 x uint64)
+    ...             C-ordered array data, each starting on a 64 byte boundary
+"""
+
+MAGIC = b'FFBUNDLE'
+VERSION = 1
+ALIGN = 64
+
+HEADER = struct.Struct('<8sIIIIIIiiqddII56x')
+ENTRY = struct.Struct('<16s8sQII3Q')
+
+TRADEOFF = ['mem', 'accuracy']
+
+def _align(x):
+    return (x + ALIGN - 1) // ALIGN * ALIGN
+
+def save_bundle(filename, arrays, d=0, n=0, k=0, d_orig=0, gType=0,
+                tradeoff='mem', seed=-1, sigma=0., density=1.,
+                bitWidth=0, fracWidth=0):
+    '''
+    Write the dict of arrays and the model description to filename
+    '''
+    names = sorted(arrays.keys())
+    data = []
+    offset = _align(HEADER.size + ENTRY.size*len(names))
+    entries = []
+    for name in names:
+        a = np.asarray(arrays[name])
+        assert (a.ndim <= 3), "Error: %s has more than 3 dimensions"%name
+        assert (len(name) <= 16), "Error: array name %s is too long"%name
+        a = np.ascontiguousarray(a, dtype=a.dtype.newbyteorder('<'))
+        shape = list(a.shape) + [0]*(3 - a.ndim)
+        entries.append(ENTRY.pack(name.encode('ascii'), a.dtype.str.encode('ascii'),
+                                  offset, a.ndim, 0, *shape))
+        data.append((offset, a))
+        offset = _align(offset + a.nbytes)
+
+    with open(filename, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(names), d, n, k, d_orig, gType,
+                            TRADEOFF.index(tradeoff), seed, sigma, density,
+                            bitWidth, fracWidth))
+        for e in entries:
+            f.write(e)
+        for off, a in data:
+            f.seek(off)
+            f.write(a.tobytes())
+        f.truncate(offset)
+
+def load_bundle(filename, mmap=True):
+    '''
+    Read a bundle. Returns (meta, arrays). With mmap=True the arrays are
+    read-only views into a memory map of the file
+    '''
+    if mmap:
+        buf = np.memmap(filename, dtype=np.uint8, mode='r')
+    else:
+        buf = np.fromfile(filename, dtype=np.uint8)
+
+    head = HEADER.unpack(buf[:HEADER.size].tobytes())
+    if head[0] != MAGIC:
+        raise ValueError('%s is not a parameter bundle'%filename)
+    if head[1] != VERSION:
+        raise ValueError('unsupported bundle version %d'%head[1])
+
+    meta = dict(zip(['d', 'n', 'k', 'd_orig', 'gType', 'tradeoff', 'seed',
+                     'sigma', 'density', 'bitWidth', 'fracWidth'], head[3:]))
+    meta['version'] = head[1]
+    meta['tradeoff'] = TRADEOFF[meta['tradeoff']]
+
+    arrays = {}
+    for i in xrange(head[2]):
+        pos = HEADER.size + i*ENTRY.size
+        e = ENTRY.unpack(buf[pos:pos+ENTRY.size].tobytes())
+        name = str(e[0].rstrip(b'\0').decode('ascii'))
+        dtype = np.dtype(e[1].rstrip(b'\0').decode('ascii'))
+        shape = tuple(e[5:5+e[3]])
+        nbytes = int(np.prod(shape))*dtype.itemsize
+        arrays[name] = buf[e[2]:e[2]+nbytes].view(dtype).reshape(shape)
+
+    return meta, arrays
@@ -0,0 +1,136 @@
+
+import hashlib
+import json
+import os
+
+from Fastfood import Fastfood, __version__
+from bundle import load_bundle
+
+"""
+Content-addressed on-disk cache of fitted Fastfood models
+    - entries are bundles (see bundle.py) named by a hash of the constructor
+      and fit arguments, the seed, __version__ and the library source
+    - a sidecar .json records what the entry was built from. an entry whose
+      sidecar, size or header doesn't check out is stale and is dropped
+    - least recently used entries are evicted once the cache is over max_bytes
+
+    The directory is $FASTFOOD_CACHE, or ~/.cache/fastfood
+"""
+
+# every module a cached fit or make_params export runs through
+SOURCES = ['Fastfood.py', 'hadamard.py', 'bundle.py', 'make_params.py',
+           'dataset.py', 'compact.py', 'procedural.py', 'lazyjit.py',
+           'cosine.py']
+
+def code_digest():
+    """ hash of the library source, so edits invalidate old entries """
+    h = hashlib.sha1()
+    here = os.path.dirname(os.path.abspath(__file__))
+    for name in SOURCES:
+        with open(os.path.join(here, name), 'rb') as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+def file_stamp(filename):
+    """ (path, size, mtime) of an input file, for keys that depend on data """
+    st = os.stat(filename)
+    return [os.path.abspath(filename), st.st_size, int(st.st_mtime)]
+
+
+class ModelCache( object ):
+
+    def __init__( self, directory=None, max_bytes=2*1024**3 ):
+        if directory is None:
+            directory = os.environ.get('FASTFOOD_CACHE',
+                            os.path.join(os.path.expanduser('~'), '.cache', 'fastfood'))
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.code = code_digest()
+
+        if not os.path.exists( self.directory ):
+            os.makedirs( self.directory )
+
+    def key(self, **params):
+        """ hash of the parameters, the library version and its source """
+        desc = { 'params' : params, 'version' : __version__, 'code' : self.code }
+        return hashlib.sha1(json.dumps(desc, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + '.ffb')
+
+    def _drop(self, key):
+        for ext in ['.ffb', '.json']:
+            try:
+                os.remove(os.path.join(self.directory, key + ext))
+            except OSError:
+                pass
+
+    def get(self, key):
+        """ path of a valid entry for key, or None """
+        fname = self.path(key)
+        if not os.path.exists(fname):
+            return None
+        try:
+            with open(os.path.join(self.directory, key + '.json')) as f:
+                info = json.load(f)
+            assert (info['key'] == key)
+            assert (info['size'] == os.path.getsize(fname))
+            load_bundle(fname, mmap=True)
+        except Exception:
+            # stale, partial or corrupt
+            self._drop(key)
+            return None
+
+        # most recently used
+        os.utime(fname, None)
+        return fname
+
+    def put(self, key, save, **params):
+        """
+        Store an entry. save(filename) writes the bundle, params are kept in
+        the sidecar for reference. Returns the path of the entry
+        """
+        fname = self.path(key)
+        tmp = '%s.%d.tmp'%(fname, os.getpid())
+        save(tmp)
+        info = { 'key' : key, 'size' : os.path.getsize(tmp), 'params' : params,
+                 'version' : __version__ }
+        with open(tmp + '.json', 'w') as f:
+            json.dump(info, f, sort_keys=True)
+
+        # sidecar first, so a bundle is never visible without one
+        os.rename(tmp + '.json', os.path.join(self.directory, key + '.json'))
+        os.rename(tmp, fname)
+        self.evict()
+        return fname
+
+    def evict(self):
+        """ remove least recently used entries until under max_bytes """
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.ffb'):
+                st = os.stat(os.path.join(self.directory, name))
+                entries.append((st.st_mtime, st.st_size, name[:-4]))
+        entries.sort()
+        total = sum(e[1] for e in entries)
+        # always keep the newest entry
+        for mtime, size, key in entries[:-1]:
+            if total <= self.max_bytes:
+                break
+            self._drop(key)
+            total -= size
+
+    def fit(self, gType=1, **kwargs):
+        """
+        Fastfood(**kwargs).fit(gType), loaded from the cache when possible.
+        random_state has to be an int seed to be cacheable
+        """
+        assert isinstance(kwargs.get('random_state'), int), \
+            "Error: caching needs an int random_state"
+        key = self.key(gType=gType, **kwargs)
+        fname = self.get(key)
+        if fname is None:
+            f = Fastfood(**kwargs)
+            f.fit(gType=gType)
+            fname = self.put(key, f.save, gType=gType, **kwargs)
+        return Fastfood.load(fname, verbose=kwargs.get('verbose', False))
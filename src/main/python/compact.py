@@ -0,0 +1,202 @@
+
+import numpy as np
+
+from Fastfood import Fastfood
+from bundle import save_bundle, load_bundle
+from hadamard import fwht
+from lazyjit import jit, prange
+
+"""
+Compact Fastfood parameters
+    - B                 sign bits, np.packbits per stack (k x d/8 uint8)
+    - G, gType 1        sign bits, like B
+    - G, gType 2        int8 (-1, 0, +1)
+    - G, gType 0        float64 (gaussian, stored as is)
+    - P, Pi             uint16 when n <= 65536, uint32 otherwise
+    - S, U              float64
+    - H, Vp, Vg, Vf     never stored, H[i, j] = (-1)^popcount(i & j)
+
+    At d=1024, n=16384 a bundle is 0.33MB against 1.05MB for the dense
+    software parameters, or ~270MB with the hardware matrices of save(hw=True).
+
+    transform() runs on the compact form directly (one compiled pass per
+    row, rows in parallel) and gives the same features as transformSW.
+    expand() rebuilds the dense Fastfood, Fastfood.load() does that for
+    compact bundles automatically.
+"""
+
+
+def pack_signs(x):
+    """ (k x d) +/-1 (or 0 for -1) as packed bits, 1 = positive """
+    return np.packbits(np.asarray(x) > 0, axis=1)
+
+def unpack_signs(bits, d):
+    """ inverse of pack_signs, int64 +/-1 """
+    return np.unpackbits(bits, axis=1)[:, :d].astype(np.int64)*2 - 1
+
+def index_dtype(n):
+    return np.uint16 if n <= (1 << 16) else np.uint32
+
+
+@jit(nopython=True)
+def _sign(bits, i, j):
+    return (bits[i, j >> 3] >> (7 - (j & 7))) & 1
+
+@jit(nopython=True, parallel=True)
+def _transform(X, bbits, gkind, gbits, g8, gf, Pi, S, U, d, scale,
+               accuracy, out):
+    m, d_orig = X.shape
+    k = bbits.shape[0]
+    n = k*d
+    amp = np.sqrt(2. / n)
+    norm = np.sqrt(float(n))
+    for r in prange(m):
+        w0 = np.zeros(n)
+        w1 = np.empty(n)
+        # B (padding stays zero), H
+        for i in xrange(k):
+            for j in xrange(d_orig):
+                if _sign(bbits, i, j):
+                    w0[i*d + j] = X[r, j]
+                else:
+                    w0[i*d + j] = -X[r, j]
+            fwht(w0[i*d:(i+1)*d])
+        # P, G
+        for j in xrange(n):
+            i = j // d
+            jj = j - i*d
+            if gkind == 2 and g8[i, jj] == 0:
+                # zero lane of ternary G, nothing to gather
+                w1[j] = 0.
+                continue
+            v = w0[Pi[j]]
+            if gkind == 1:
+                if not _sign(gbits, i, jj):
+                    v = -v
+            elif gkind == 2:
+                v = v * g8[i, jj]
+            else:
+                v = v * gf[i, jj]
+            w1[j] = v
+        # H, S, phi
+        for i in xrange(k):
+            fwht(w1[i*d:(i+1)*d])
+        for j in xrange(n):
+            v = scale * (S[j] * w1[j])
+            if accuracy:
+                out[r, j] = np.cos(v) / norm
+                out[r, n + j] = np.sin(v) / norm
+            else:
+                out[r, j] = np.cos(2*np.pi*(v + U[j])) * amp
+
+
+class CompactFastfood( object ):
+
+    def __init__( self, meta, arrays ):
+        """ meta as in load_bundle, arrays are the compact parameters """
+        self.meta = meta
+        for name in ['d', 'n', 'k', 'd_orig', 'gType', 'tradeoff', 'sigma',
+                     'density', 'seed']:
+            setattr(self, name, meta[name])
+        self.arrays = arrays
+
+    @staticmethod
+    def from_model(ff):
+        """ compact copy of a fitted Fastfood """
+        idx = index_dtype(ff.n)
+        arrays = { 'Bbits' : pack_signs(ff.B[:, :ff.d_orig]),
+                   'P' : np.ravel(ff.P).astype(idx),
+                   'Pi' : np.ravel(ff.Pi).astype(idx),
+                   'S' : np.asarray(ff.S, dtype=np.float64),
+                   'U' : np.asarray(ff.U, dtype=np.float64) }
+        if ff.T == 1:
+            arrays['Gbits'] = pack_signs(ff.G)
+        elif ff.T == 2:
+            arrays['G8'] = np.asarray(ff.G, dtype=np.int8)
+        else:
+            arrays['G'] = np.asarray(ff.G, dtype=np.float64)
+
+        seed = ff.random_state if isinstance(ff.random_state, int) else -1
+        meta = { 'd' : ff.d, 'n' : ff.n, 'k' : ff.k, 'd_orig' : ff.d_orig,
+                 'gType' : ff.T, 'tradeoff' : ff.tradeoff, 'sigma' : ff.sigma,
+                 'density' : ff.density, 'seed' : seed }
+        return CompactFastfood(meta, arrays)
+
+    @property
+    def nbytes(self):
+        return sum(a.nbytes for a in self.arrays.values())
+
+    def n_outputs(self):
+        return 2*self.n if self.tradeoff == 'accuracy' else self.n
+
+    def G(self):
+        """ dense G, as fit makes it """
+        a = self.arrays
+        if 'Gbits' in a:
+            return unpack_signs(a['Gbits'], self.d)
+        if 'G8' in a:
+            return a['G8'].astype(np.int64)
+        return np.asarray(a['G'])
+
+    def B(self):
+        """ dense B, padding columns zero """
+        B = np.zeros((self.k, self.d), dtype=np.int64)
+        B[:, :self.d_orig] = unpack_signs(self.arrays['Bbits'], self.d_orig)
+        return B
+
+    def transform(self, X, out=None):
+        """ transformSW(X) straight from the compact parameters """
+        X = np.ascontiguousarray(X, dtype=np.float64)
+        assert (X.shape[1] == self.d_orig)
+        if out is None:
+            out = np.empty((X.shape[0], self.n_outputs()))
+        assert (out.shape == (X.shape[0], self.n_outputs()))
+
+        a = self.arrays
+        gkind = 1 if 'Gbits' in a else (2 if 'G8' in a else 0)
+        empty_bits = np.zeros((self.k, 0), dtype=np.uint8)
+        _transform(X, a['Bbits'], gkind,
+                   a.get('Gbits', empty_bits),
+                   a.get('G8', np.zeros((self.k, 0), dtype=np.int8)),
+                   a.get('G', np.zeros((self.k, 0))),
+                   a['Pi'], np.ravel(a['S']), np.ravel(a['U']), self.d,
+                   1 / (self.sigma * np.sqrt(self.d)),
+                   self.tradeoff == 'accuracy', out)
+        return out
+
+    def expand(self, verbose=False):
+        """ the dense Fastfood """
+        f = Fastfood(sigma=self.sigma, n_features=self.d_orig, n_dicts=self.n,
+                     sparsity=1-self.density,
+                     random_state=None if self.seed < 0 else self.seed,
+                     tradeoff=self.tradeoff, verbose=verbose)
+        assert ((f.d, f.n, f.k) == (self.d, self.n, self.k))
+        a = self.arrays
+        f.T = self.gType
+        f.B = self.B()
+        f.G = self.G()
+        f.P = a['P'].astype(np.int64)
+        f.Pi = a['Pi'].astype(np.int64)
+        f.S = np.array(a['S'])
+        f.U = np.array(a['U'])
+        f.S_hw = (1 / (f.sigma * np.sqrt(f.d)) ) * f.S
+        f.U_hw = 2*np.pi*f.U
+        f.A_hw = np.sqrt( 2./f.n )
+        return f
+
+    def save(self, filename, extra=None, bitWidth=0, fracWidth=0):
+        arrays = dict(self.arrays)
+        if extra is not None:
+            arrays.update(extra)
+        save_bundle(filename, arrays, d=self.d, n=self.n, k=self.k,
+                    d_orig=self.d_orig, gType=self.gType,
+                    tradeoff=self.tradeoff, seed=self.seed, sigma=self.sigma,
+                    density=self.density, bitWidth=bitWidth,
+                    fracWidth=fracWidth)
+
+    @staticmethod
+    def load(filename, mmap=True):
+        meta, arrays = load_bundle(filename, mmap=mmap)
+        names = ['Bbits', 'Gbits', 'G8', 'G', 'P', 'Pi', 'S', 'U']
+        return CompactFastfood(meta, dict((k, v) for k, v in arrays.items()
+                                          if k in names))
@@ -0,0 +1,110 @@
+
+import numpy as np
+
+from lazyjit import jit, prange
+
+"""
+Cosine backends for Fastfood.phi (tradeoff='mem')
+    phi = amp * cos(2*pi*(v + U)), the argument is in cycles
+
+    exact   - np.cos in float64 (the default, what transformSW always did)
+    lut     - table of cos(2*pi*i/size) over one cycle, indexed by the
+              truncated phase like the hardware LUT (parallel/lut.scala,
+              cosTab.txt), or linearly interpolated between entries
+    poly    - range reduced to [-1/2, 1/2) cycles, then an even polynomial
+              evaluated in float32
+
+    Worst-case errors of cos itself (see error()):
+        lut 512             ~1.2e-2     (hardware resolution)
+        lut 512, interp     ~1.9e-5
+        poly                ~7e-7       (float32 rounding)
+
+    Scaled by amp = sqrt(2/n) in the features. golden.py remains the
+    bit-accurate fixed-point model of the datapath.
+"""
+
+BACKENDS = ['exact', 'lut', 'poly']
+
+
+def lut_table(size):
+    """ cos over one cycle, size+1 entries (the last one closes the cycle) """
+    assert (size & (size - 1)) == 0, "Error: LUT size is not a power of 2"
+    return np.cos(2*np.pi*np.arange(size + 1) / float(size))
+
+def _poly_coeffs(degree=7):
+    """ least squares fit of cos(2*pi*r) in powers of r^2 over [-1/2, 1/2] """
+    r = np.linspace(0, 0.5, 4097)
+    A = np.vander(r*r, degree, increasing=True)
+    c = np.linalg.lstsq(A, np.cos(2*np.pi*r), rcond=None)[0]
+    return c[::-1].astype(np.float32)    # Horner order
+
+POLY = _poly_coeffs()
+
+
+@jit(nopython=True)
+def cos_lut1(t, tab, interpolate):
+    """ cos(2*pi*t) from the table """
+    size = tab.shape[0] - 1
+    s = t * size
+    f = np.floor(s)
+    i = np.int64(f) & (size - 1)
+    if interpolate:
+        return tab[i] + (s - f) * (tab[i + 1] - tab[i])
+    return tab[i]
+
+@jit(nopython=True)
+def cos_poly1(t, c):
+    """ cos(2*pi*t), float32 polynomial """
+    q = np.float32(t - np.floor(t + 0.5))
+    q2 = q * q
+    y = c[0]
+    for p in xrange(1, c.shape[0]):
+        y = y * q2 + c[p]
+    return y
+
+@jit(nopython=True, parallel=True)
+def _cos_lut(x, U, tab, amp, interpolate):
+    """ in place: x = amp*cos(2*pi*(x + U)) from the table """
+    for r in prange(x.shape[0]):
+        for j in xrange(x.shape[1]):
+            x[r, j] = amp * cos_lut1(x[r, j] + U[j], tab, interpolate)
+
+@jit(nopython=True, parallel=True)
+def _cos_poly(x, U, c, amp):
+    """ in place: x = amp*cos(2*pi*(x + U)), float32 polynomial """
+    for r in prange(x.shape[0]):
+        for j in xrange(x.shape[1]):
+            x[r, j] = amp * cos_poly1(x[r, j] + U[j], c)
+
+
+def cos_cycles(x, U, amp, backend='exact', lut_size=512, interpolate=False):
+    """ x (m x n) <- amp*cos(2*pi*(x + U)) in place, returns x """
+    if backend == 'exact':
+        x += U
+        x *= 2*np.pi
+        np.cos(x, out=x)
+        x *= amp
+    elif backend == 'lut':
+        _cos_lut(x, np.ascontiguousarray(U, dtype=np.float64),
+                 table(lut_size), amp, interpolate)
+    elif backend == 'poly':
+        _cos_poly(x, np.ascontiguousarray(U, dtype=np.float64), POLY, amp)
+    else:
+        raise ValueError('unknown cosine backend: %s'%backend)
+    return x
+
+_tables = {}
+
+def table(size):
+    """ lut_table(size), built once """
+    if size not in _tables:
+        _tables[size] = lut_table(size)
+    return _tables[size]
+
+def error(backend, lut_size=512, interpolate=False, n_points=1 << 20):
+    """ max and mean |cos error| over phases uniform in [0, 1) cycles """
+    t = (np.arange(n_points) + 0.5) / n_points
+    x = t.reshape(1, -1).copy()
+    cos_cycles(x, np.zeros(n_points), 1., backend, lut_size, interpolate)
+    e = np.abs(x[0] - np.cos(2*np.pi*t))
+    return { 'max' : float(e.max()), 'mean' : float(e.mean()) }
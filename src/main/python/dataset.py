@@ -0,0 +1,181 @@
+
+import hashlib
+import json
+import multiprocessing
+import os
+
+import numpy as np
+
+"""
+CSV datasets with a binary cache
+    - the first load parses the CSV in chunks (split at line boundaries), in
+      parallel worker processes that write straight into a .npy file
+    - the .npy is kept next to the CSV (or in $FASTFOOD_CACHE/datasets if the
+      directory isn't writable), with a sidecar .json recording the CSV's
+      size and mtime and the parse options. a changed CSV is re-parsed
+    - later loads memory-map the .npy, nothing is parsed or copied until the
+      rows are used. iter_rows/read_rows stream row ranges the same way
+
+    Values are parsed with pandas' round-trip float parser when available
+    (np.loadtxt otherwise), so the result equals np.loadtxt(filename,
+    delimiter=",", usecols=usecols): columns in usecols order, a single
+    column (or row) squeezed the way loadtxt does. With mmap the result is
+    a read-only np.memmap, np.array() it or pass mmap=False for a writable
+    copy.
+"""
+
+CHUNK_BYTES = 32*1024*1024
+
+
+def _options(usecols, delimiter, dtype):
+    return { 'usecols' : None if usecols is None else [int(c) for c in usecols],
+             'delimiter' : delimiter, 'dtype' : np.dtype(dtype).str }
+
+def _stamp(filename):
+    st = os.stat(filename)
+    return { 'size' : st.st_size, 'mtime' : st.st_mtime }
+
+def cache_path(filename, usecols=None, delimiter=',', dtype=np.float64):
+    """ .npy cache for a CSV and parse options (its sidecar is .json) """
+    opts = json.dumps(_options(usecols, delimiter, dtype), sort_keys=True)
+    tag = hashlib.sha1(opts.encode('utf-8')).hexdigest()[:8]
+    filename = os.path.abspath(filename)
+    directory, name = os.path.split(filename)
+    if not os.access(directory, os.W_OK):
+        directory = os.path.join(os.environ.get('FASTFOOD_CACHE',
+                        os.path.join(os.path.expanduser('~'), '.cache', 'fastfood')),
+                        'datasets', hashlib.sha1(directory.encode('utf-8')).hexdigest()[:8])
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+    return os.path.join(directory, '%s.%s.npy'%(name, tag))
+
+def _chunks(filename, chunk_bytes):
+    """ (offset, length, n_rows) of each chunk, split after a newline """
+    chunks = []
+    with open(filename, 'rb') as f:
+        offset = 0
+        while True:
+            data = f.read(chunk_bytes)
+            if not data:
+                break
+            data += f.readline()
+            n_rows = sum(1 for line in data.split(b'\n') if line.strip())
+            chunks.append((offset, len(data), n_rows))
+            offset += len(data)
+    return chunks
+
+def _parse(data, usecols, delimiter, dtype):
+    try:
+        import pandas as pd
+    except ImportError:
+        return np.loadtxt(data.splitlines(), delimiter=delimiter,
+                          usecols=usecols, dtype=dtype, ndmin=2)
+    import io
+    df = pd.read_csv(io.BytesIO(data), sep=delimiter, header=None,
+                     usecols=None if usecols is None else sorted(set(usecols)),
+                     float_precision='round_trip')
+    if usecols is not None:
+        # pandas returns the columns in file order
+        df = df[usecols]
+    return df.values.astype(dtype)
+
+def _parse_chunk(args):
+    """ worker: parse one chunk into rows [row, row+n_rows) of the .npy """
+    filename, out, offset, length, row, n_rows, usecols, delimiter, dtype = args
+    with open(filename, 'rb') as f:
+        f.seek(offset)
+        data = f.read(length)
+    x = _parse(data, usecols, delimiter, dtype)
+    assert (x.shape[0] == n_rows), "Error: broken lines in " + filename
+    y = np.load(out, mmap_mode='r+')
+    y[row:row+n_rows] = x
+    y.flush()
+
+def _build(filename, npy, usecols, delimiter, dtype, n_jobs, chunk_bytes):
+    chunks = _chunks(filename, chunk_bytes)
+    n_rows = sum(c[2] for c in chunks)
+    with open(filename, 'rb') as f:
+        n_cols = _parse(f.readline(), usecols, delimiter, dtype).shape[1]
+
+    tmp = '%s.%d.tmp'%(npy, os.getpid())
+    np.lib.format.open_memmap(tmp, mode='w+', dtype=dtype,
+                              shape=(n_rows, n_cols)).flush()
+    jobs = []
+    row = 0
+    for offset, length, n in chunks:
+        jobs.append((filename, tmp, offset, length, row, n, usecols, delimiter, dtype))
+        row += n
+
+    if n_jobs is None:
+        n_jobs = multiprocessing.cpu_count()
+    n_jobs = min(n_jobs, len(jobs))
+    try:
+        if n_jobs > 1:
+            pool = multiprocessing.Pool(n_jobs)
+            try:
+                pool.map(_parse_chunk, jobs)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            for job in jobs:
+                _parse_chunk(job)
+    except Exception:
+        os.remove(tmp)
+        raise
+
+    info = { 'source' : os.path.abspath(filename), 'stamp' : _stamp(filename),
+             'options' : _options(usecols, delimiter, dtype),
+             'shape' : [n_rows, n_cols] }
+    with open(tmp + '.json', 'w') as f:
+        json.dump(info, f, sort_keys=True)
+    os.rename(tmp, npy)
+    os.rename(tmp + '.json', npy[:-4] + '.json')
+
+def _valid(filename, npy, usecols, delimiter, dtype):
+    try:
+        with open(npy[:-4] + '.json') as f:
+            info = json.load(f)
+        return (info['stamp'] == _stamp(filename) and
+                info['options'] == _options(usecols, delimiter, dtype) and
+                os.path.exists(npy))
+    except (IOError, OSError, ValueError, KeyError):
+        return False
+
+def _load(filename, usecols=None, delimiter=',', dtype=np.float64,
+          mmap=True, n_jobs=None, chunk_bytes=CHUNK_BYTES):
+    """ the cached (rows x cols) array, built or refreshed first if needed """
+    if usecols is not None:
+        usecols = list(usecols)
+    npy = cache_path(filename, usecols, delimiter, dtype)
+    if not _valid(filename, npy, usecols, delimiter, dtype):
+        _build(filename, npy, usecols, delimiter, dtype, n_jobs, chunk_bytes)
+    return np.load(npy, mmap_mode='r' if mmap else None)
+
+def _rows(x):
+    """ a single column as a vector, like loadtxt """
+    return x[:, 0] if x.shape[1] == 1 else x
+
+def load_csv(filename, usecols=None, delimiter=',', dtype=np.float64,
+             mmap=True, n_jobs=None, chunk_bytes=CHUNK_BYTES):
+    """
+    The CSV as np.loadtxt returns it, (rows x cols) with the size one
+    dimensions squeezed. With mmap it is memory-mapped read-only from the
+    .npy cache (an in-memory, writable copy otherwise)
+    """
+    x = _load(filename, usecols, delimiter, dtype, mmap, n_jobs, chunk_bytes)
+    if x.size == 1:
+        # a memmap can't be 0-d
+        return np.array(x).reshape(())
+    return np.squeeze(x)
+
+def read_rows(filename, start=0, stop=None, **kwargs):
+    """ rows [start, stop) as an array, only those rows are read """
+    return np.array(_rows(_load(filename, **kwargs)[start:stop]))
+
+def iter_rows(filename, start=0, stop=None, chunk_size=4096, **kwargs):
+    """ rows [start, stop) in blocks of chunk_size rows (read-only views) """
+    x = _rows(_load(filename, **kwargs))
+    stop = x.shape[0] if stop is None else min(stop, x.shape[0])
+    for lo in xrange(start, stop, chunk_size):
+        yield x[lo:min(lo + chunk_size, stop)]
@@ -2,11 +2,13 @@ import numpy as np
 import matplotlib.pyplot as plt
 import sys
 
+from dataset import load_csv
+
 filename = "../../../test_results_18.csv"
 if len(sys.argv)==2 :
 	filename = sys.argv[1]
 
-data = np.loadtxt(filename, delimiter=",")
+data = load_csv(filename)
 length = len(data)*0.8
 
 # data
@@ -0,0 +1,238 @@
+
+import json
+import os
+import shutil
+import SocketServer
+import socket
+import struct
+import sys
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from Fastfood import Fastfood
+from cache import ModelCache
+from make_params import export_params, XFILE
+
+"""
+Long-lived parameter / feature service
+    - one python process answers every request of a test session, so the
+      interpreter start-up, imports, numba kernels and fitted models are paid
+      for once instead of once per tester
+    - models are kept warm, keyed by (n_dicts, n_features, gType, seed, sigma)
+      and built through export_params, so they are exactly the bundles that
+      make_params.py writes
+    - serves stdin/stdout (--stdio, what the scala testers use, see
+      utils.ffService) or a unix socket (any number of clients)
+
+Frames (little-endian), same layout in both directions:
+
+    4       header length
+    ...     header, a JSON object
+    8       body length
+    ...     body, raw bytes
+
+Requests (header keys, the model keys default to those of make_params.py):
+
+    op          ping | params | transformSW | transformHW | quit
+    n_dicts, n_features, gType, seed, sigma
+    path        params: copy the bundle there instead of sending it back
+    shape       transform: shape of X, the body is C-ordered X as dtype
+    dtype       transform: dtype of X (default "<f8")
+    task        transformHW: Vp | Vg | Vf (default Vf)
+
+Responses have status "ok" (with shape and dtype when the body is an array)
+or "error" and a message. status is always the first key of the header. The body of params is the bundle itself (see
+bundle.py) unless a path was given.
+
+run:    python ffservice.py --stdio
+        python ffservice.py socket_path
+"""
+
+HEAD = struct.Struct('<I')
+BODY = struct.Struct('<Q')
+
+DEFAULTS = { 'gType' : 1, 'seed' : 41, 'sigma' : 11.47 }
+
+
+def _read(f, n):
+    data = b''
+    while len(data) < n:
+        chunk = f.read(n - len(data))
+        if not chunk:
+            raise EOFError
+        data += chunk
+    return data
+
+def read_frame(f):
+    """ (header dict, body bytes), EOFError when the stream is closed """
+    n, = HEAD.unpack(_read(f, HEAD.size))
+    header = json.loads(_read(f, n).decode('utf-8'))
+    n, = BODY.unpack(_read(f, BODY.size))
+    return header, _read(f, n)
+
+def write_frame(f, header, body=b''):
+    """
+    status goes first, so a reply starts with {"status": "ok" or
+    {"status": "error" (utils.ffService only checks that prefix)
+    """
+    items = sorted(header.items(), key=lambda kv: (kv[0] != 'status', kv[0]))
+    head = json.dumps(OrderedDict(items), separators=(', ', ': ')).encode('utf-8')
+    f.write(HEAD.pack(len(head)) + head + BODY.pack(len(body)))
+    f.write(body)
+    f.flush()
+
+
+class FeatureService( object ):
+
+    def __init__( self, cache=None, xfile=XFILE ):
+        self.cache = cache if cache is not None else ModelCache()
+        self.xfile = xfile
+        self.models = {}
+        self.lock = threading.Lock()
+
+    def model(self, req):
+        """ (cached bundle path, warm Fastfood) for the request's parameters """
+        key = tuple(req.get(name, DEFAULTS.get(name)) for name in
+                    ['n_dicts', 'n_features', 'gType', 'seed', 'sigma'])
+        with self.lock:
+            if key not in self.models:
+                nd, nf, gt, seed, sigma = key
+                fname = export_params(nd, nf, gt, None, seed=seed,
+                                      sigma=sigma, xfile=self.xfile,
+                                      cache=self.cache)
+                self.models[key] = (fname, Fastfood.load(fname))
+            return self.models[key]
+
+    def handle(self, req, body):
+        """ (response header, response body) for one request """
+        op = req.get('op')
+        if op == 'ping':
+            return { 'status' : 'ok', 'pid' : os.getpid() }, b''
+
+        if op == 'params':
+            fname, f = self.model(req)
+            if 'path' in req:
+                shutil.copyfile(fname, req['path'])
+                return { 'status' : 'ok', 'path' : req['path'] }, b''
+            with open(fname, 'rb') as fh:
+                return { 'status' : 'ok' }, fh.read()
+
+        if op in ['transformSW', 'transformHW']:
+            fname, f = self.model(req)
+            X = np.frombuffer(body, dtype=req.get('dtype', '<f8'))
+            X = X.reshape(req['shape']).astype(np.float64)
+            if op == 'transformSW':
+                phi = f.transformSW(X)
+            else:
+                with self.lock:
+                    # builds (and caches) the hw matrix once
+                    f.hw_matrix(req.get('task', 'Vf'))
+                phi = f.transformHW(X, task=req.get('task', 'Vf'))
+            phi = np.ascontiguousarray(phi, dtype='<f8')
+            return { 'status' : 'ok', 'shape' : list(phi.shape),
+                     'dtype' : '<f8' }, phi.tobytes()
+
+        raise ValueError('unknown op: %s'%op)
+
+    def serve(self, rfile, wfile):
+        """ answer requests until quit or end of stream """
+        while True:
+            try:
+                req, body = read_frame(rfile)
+            except EOFError:
+                return
+            if req.get('op') == 'quit':
+                write_frame(wfile, { 'status' : 'ok' })
+                return
+            try:
+                header, data = self.handle(req, body)
+            except Exception as e:
+                header, data = { 'status' : 'error',
+                                 'message' : '%s: %s'%(type(e).__name__, e) }, b''
+            write_frame(wfile, header, data)
+
+
+class _Handler( SocketServer.StreamRequestHandler ):
+
+    def handle(self):
+        self.server.service.serve(self.rfile, self.wfile)
+
+class _UnixServer( SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer ):
+    daemon_threads = True
+
+
+def serve_stdio(service=None):
+    """ serve stdin/stdout. anything printed goes to stderr instead """
+    rfile = os.fdopen(os.dup(sys.stdin.fileno()), 'rb')
+    wfile = os.fdopen(os.dup(sys.stdout.fileno()), 'wb')
+    sys.stdout = sys.stderr
+    os.dup2(sys.stderr.fileno(), 1)
+    (service or FeatureService()).serve(rfile, wfile)
+
+def serve_unix(path, service=None):
+    if os.path.exists(path):
+        os.remove(path)
+    server = _UnixServer(path, _Handler)
+    server.service = service or FeatureService()
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        os.remove(path)
+
+
+class FeatureClient( object ):
+    """ python side of the protocol, over a unix socket or a pair of files """
+
+    def __init__( self, path=None, rfile=None, wfile=None ):
+        if path is not None:
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.sock.connect(path)
+            rfile = self.sock.makefile('rb')
+            wfile = self.sock.makefile('wb')
+        self.rfile = rfile
+        self.wfile = wfile
+
+    def request(self, body=b'', **req):
+        write_frame(self.wfile, req, body)
+        header, data = read_frame(self.rfile)
+        if header['status'] != 'ok':
+            raise RuntimeError(header['message'])
+        return header, data
+
+    def _array(self, op, X, **req):
+        X = np.ascontiguousarray(X, dtype='<f8')
+        header, data = self.request(X.tobytes(), op=op, shape=list(X.shape),
+                                    dtype='<f8', **req)
+        return np.frombuffer(data, dtype=header['dtype']).reshape(header['shape'])
+
+    def params(self, path=None, **req):
+        """ bundle bytes, or None once it is copied to path """
+        if path is not None:
+            self.request(op='params', path=path, **req)
+            return None
+        return self.request(op='params', **req)[1]
+
+    def transformSW(self, X, **req):
+        return self._array('transformSW', X, **req)
+
+    def transformHW(self, X, task='Vf', **req):
+        return self._array('transformHW', X, task=task, **req)
+
+    def close(self):
+        try:
+            self.request(op='quit')
+        finally:
+            self.rfile.close()
+            self.wfile.close()
+
+
+
+if __name__ == "__main__":
+
+    if len(sys.argv) > 1 and sys.argv[1] != '--stdio':
+        serve_unix(sys.argv[1])
+    else:
+        serve_stdio()
@@ -1,9 +1,17 @@
 
+import sys
+
 import numpy as np
 from scipy.stats import chi
 
+from genTables import writeC, writeTable
+
 """
 Python code for generating Fastfood parameters for FPGA
+
+run:    python genParams.py [mem]
+
+mem also writes the per PE BRAM initialisation files (params/mem)
 """
 
 d = 1024
@@ -12,20 +20,14 @@ k = n/d
 sigma = 11.47
 npts = 256
 fb = 9
+bw = 18
+p = 128 # number of PEs, for the per PE memory files
 
 rng = np.random.RandomState(seed=41)
 
 def l2norm_along_axis1(X):
     return np.sqrt(np.einsum('ij,ij->i', X, X))
 
-def toFixed(x, fb):
-    v = (1<<fb)
-    if( x>=0 ):
-        return int( x * v +0.5 )
-    else:
-        return int( x*v -0.5 )
-
-
 # generate parameters
 
 B = rng.randint( 2, size=(k, d) )*2 -1
@@ -50,31 +52,12 @@ np.savetxt("params/S.csv", S, delimiter=",")
 np.savetxt("params/alpha.csv", alpha, delimiter=",")
 """
 
-f = open('params/B.txt', 'w')
-for i in range(B.shape[0]):
-    for j in range(B.shape[1]):
-        estr = "B[%d][%d] = (PRECTYPE) %d\n"%(i, j, toFixed(B[i][j], fb))
-        f.write(estr)
-f.close()
-
-f = open('params/G.txt', 'w')
-for i in range(G.shape[0]):
-    for j in range(G.shape[1]):
-        estr = "G[%d][%d] = (PRECTYPE) %d\n"%(i, j, toFixed(G[i][j], fb))
-        f.write(estr)
-f.close()
-
-f = open('params/S.txt', 'w')
-for i in range(S.shape[0]):
-    for j in range(S.shape[1]):
-        estr = "S[%d][%d] = (PRECTYPE) %d\n"%(i, j, toFixed(S[i][j], fb))
-        f.write(estr)
-f.close()
-
-f = open('cosTab.txt', 'w')
-for i,x in enumerate(cos):
-    estr = "COS_LUT[%d] = (PRECTYPE) %d\n"%(i, toFixed(x, fb))
-    f.write(estr)
-
-f.close()
+writeC('params/B.txt', 'B', B, fb)
+writeC('params/G.txt', 'G', G, fb)
+writeC('params/S.txt', 'S', S, fb)
+writeC('cosTab.txt', 'COS_LUT', cos, fb)
 
+# BRAM initialisation ($readmemh, $readmemb, .coe), n/p dicts per PE
+if 'mem' in sys.argv[1:]:
+    for name, x in [('G', G), ('S', S), ('alpha', alpha)]:
+        writeTable('params/mem', name, x, fb, bw, n_parts=p)
@@ -0,0 +1,160 @@
+
+import numpy as np
+import os
+
+"""
+Bulk generation of FPGA parameter tables
+    - whole arrays are converted to fixed point in one step: x*(1<<fb),
+      rounded half away from zero
+    - C initialiser lists ("B[i][j] = (PRECTYPE) v"), $readmemh/$readmemb files
+      and Xilinx .coe files are built as character arrays, with no per-element
+      formatting. C lists are built in blocks of lines, so memory stays bounded
+    - tables can be split per PE (n/p consecutive dicts each, the order used by
+      the systolic PE/BramSreg memories) or per stack (d dicts each)
+    - sparse tables (ternary G) can be written as their non-zero taps only,
+      a values table plus a table of the lanes they belong to
+"""
+
+HEX = np.frombuffer(b'0123456789abcdef', dtype=np.uint8)
+
+
+def toFixed(x, fb):
+    """ x*(1<<fb) rounded half away from zero """
+    x = np.asarray(x, dtype=np.float64) * (1 << fb)
+    return np.trunc(np.where(x >= 0, x + 0.5, x - 0.5)).astype(np.int64)
+
+def toWords(q, bitWidth):
+    """ two's complement bit patterns of the fixed point values """
+    return np.asarray(q, dtype=np.int64).ravel() & ((1 << bitWidth) - 1)
+
+def partition(x, n_parts):
+    """ split the flattened table into n_parts equal, consecutive blocks """
+    x = np.ravel(x)
+    assert (x.size % n_parts == 0), "Error: table does not split evenly"
+    return x.reshape(n_parts, -1)
+
+def _digits(words, n_digits, base):
+    """ (len(words) x n_digits) character array, most significant first """
+    shift = int(np.log2(base))
+    pos = shift*np.arange(n_digits - 1, -1, -1, dtype=np.int64)
+    return HEX[(words.reshape(-1, 1) >> pos) & (base - 1)]
+
+def _lines(chars, sep=b'\n'):
+    """ join the rows of a character array, one per line """
+    sep = np.frombuffer(sep, dtype=np.uint8)
+    out = np.empty((chars.shape[0], chars.shape[1] + sep.size), dtype=np.uint8)
+    out[:, :chars.shape[1]] = chars
+    out[:, chars.shape[1]:] = sep
+    return out
+
+def _decimal(v):
+    """
+    (chars, widths): decimal form of the values right aligned in a character
+    array, '-' in front of negatives. widths[r] characters of row r are used
+    """
+    v = np.asarray(v, dtype=np.int64).ravel()
+    a = np.abs(v)
+    n_digits = len(str(int(a.max()))) if a.size else 1
+    pos = 10**np.arange(n_digits - 1, -1, -1, dtype=np.int64)
+    chars = np.empty((v.size, n_digits + 1), dtype=np.uint8)
+    chars[:, 1:] = HEX[(a.reshape(-1, 1) // pos) % 10]
+    widths = np.maximum((a.reshape(-1, 1) >= pos).sum(axis=1), 1)
+    neg = np.flatnonzero(v < 0)
+    chars[neg, n_digits - widths[neg]] = ord('-')
+    widths[neg] += 1
+    return chars, widths
+
+def _text(s, n_rows):
+    """ the same string on every row, as a (chars, widths) field """
+    chars = np.frombuffer(s.encode('ascii'), dtype=np.uint8)
+    return np.tile(chars, (n_rows, 1)), np.full(n_rows, chars.size)
+
+def _join(fields):
+    """ concatenate the (chars, widths) fields row by row, rows in order """
+    chars = np.hstack([ c for c, w in fields ])
+    keep = np.hstack([ np.arange(c.shape[1]) >= c.shape[1] - w.reshape(-1, 1)
+                       for c, w in fields ])
+    return chars[keep].tobytes()
+
+def linesC(name, q, block=1 << 16):
+    """ formatC in blocks of at most block lines """
+    q = np.asarray(q, dtype=np.int64)
+    for lo in range(0, q.size, block):
+        hi = min(lo + block, q.size)
+        head = name + '['
+        fields = []
+        for i in np.unravel_index(np.arange(lo, hi), q.shape):
+            fields += [ _text(head, hi - lo), _decimal(i) ]
+            head = ']['
+        fields += [ _text('] = (PRECTYPE) ', hi - lo),
+                    _decimal(q.ravel()[lo:hi]), _text('\n', hi - lo) ]
+        yield _join(fields)
+
+def formatC(name, q):
+    """ C initialiser lines for a 1-D or 2-D table of fixed point ints """
+    return b''.join(linesC(name, q))
+
+def formatMem(q, bitWidth, base=16):
+    """ $readmemh (base 16) or $readmemb (base 2) contents """
+    n_digits = bitWidth if base == 2 else (bitWidth + 3) // 4
+    chars = _digits(toWords(q, bitWidth), n_digits, base)
+    return _lines(chars).tobytes()
+
+def formatCoe(q, bitWidth, base=16):
+    """ Xilinx .coe memory initialisation file """
+    n_digits = bitWidth if base == 2 else (bitWidth + 3) // 4
+    chars = _lines(_digits(toWords(q, bitWidth), n_digits, base), b',\n')
+    chars[-1, -2] = ord(';')
+    head = "memory_initialization_radix=%d;\nmemory_initialization_vector=\n"%base
+    return head.encode('ascii') + chars.tobytes()
+
+def writeC(filename, name, x, fb):
+    with open(filename, 'wb') as f:
+        for lines in linesC(name, toFixed(x, fb)):
+            f.write(lines)
+
+def writeTable(directory, name, x, fb, bitWidth, n_parts=1,
+               formats=('hex', 'bin', 'coe')):
+    """
+    Write the table x as memory initialisation files, one file per part
+    (directory/name_<i>.hex, .bin, .coe). Returns the list of files
+    """
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+
+    files = []
+    for i, part in enumerate(partition(toFixed(x, fb), n_parts)):
+        base = os.path.join(directory, "%s_%d"%(name, i))
+        for fmt in formats:
+            if fmt == 'hex':
+                data = formatMem(part, bitWidth, 16)
+            elif fmt == 'bin':
+                data = formatMem(part, bitWidth, 2)
+            elif fmt == 'coe':
+                data = formatCoe(part, bitWidth)
+            else:
+                raise ValueError('unknown table format: %s'%fmt)
+            with open(base + '.' + fmt, 'wb') as f:
+                f.write(data)
+            files.append(base + '.' + fmt)
+    return files
+
+def nonzeroTaps(x):
+    """ (lanes, values) of the non-zero entries of the flattened table """
+    x = np.ravel(x)
+    lanes = np.flatnonzero(x)
+    return lanes, x[lanes]
+
+def writeTaps(directory, name, x, fb, bitWidth, formats=('hex', 'bin', 'coe')):
+    """
+    Write only the non-zero entries of x: directory/name_taps_0.* holds the
+    values, directory/name_lanes_0.* their flat indices (unsigned, just wide
+    enough). Returns (number of taps, list of files)
+    """
+    lanes, taps = nonzeroTaps(x)
+    laneWidth = max(1, int(np.ceil(np.log2(max(np.size(x), 2)))))
+    files = writeTable(directory, name + '_taps', taps, fb, bitWidth,
+                       formats=formats)
+    files += writeTable(directory, name + '_lanes', lanes, 0, laneWidth,
+                        formats=formats)
+    return len(lanes), files
@@ -0,0 +1,238 @@
+
+import numpy as np
+import sys
+from time import time
+
+from Fastfood import Fastfood
+
+"""
+Bit-accurate fixed-point model of the parallel/ Chisel datapath (FF)
+    - whole batches at once, instead of one sample per tester step
+    - GPHBx  : +/-x accumulate from the binary GPHB ram (stream.binary)
+    - HAD    : log2(d) add/sub stages per stack
+    - LUT    : x*S (Fixed *), then the cosine table indexed by the top bits
+    - OUT    : alpha*phi (Fixed *) and the adder tree
+
+    Numerics follow Chisel's Fixed:
+    - every register is bitWidth wide, so + and - wrap (two's complement).
+      modular addition doesn't depend on the adder tree shape
+    - *  rounds half up:  (a*b + 2^(f-1)) >> f
+    - *% truncates:        (a*b) >> f
+    - constants go through utils.toFixed, which truncates towards zero
+    - the testers read S, U, ALPHA and X from the binary bundle as exact
+      doubles. csv=True models the older "%10.12f" CSV files instead
+
+    FF and TRAIN build every GPHBx with out.direct on the one bit GPHB ram
+    the testers load (FastFoodTest.GPHB(false): the bit ((Vg+1)/2).toInt).
+    That is the Fastfood model for binary G only. A ternary zero is stored
+    as 0 and read as -x, a normal G loses its magnitude, and G itself is
+    never multiplied in. The golden model does the same.
+
+    compare() splits the error into
+    - model: a float64 run of the hardware datapath against transformSW's
+      HGPHBX, i.e. what the ram encoding costs (zero for binary G)
+    - quantisation: the fixed-point datapath against that float64 run
+    Both use the LUT's A*cos(pi*x + U_hw) phase convention (the __main__
+    example in Fastfood.py), transformSW's phi uses cos(2*pi*(x + U)).
+
+run:    python golden.py [dataset.csv] [n_dicts] [bitWidth] [fracWidth]
+"""
+
+
+def toFixed(x, fracWidth):
+    """ utils.toFixed: x * 2^fracWidth truncated towards zero """
+    return np.trunc(np.asarray(x, dtype=np.float64) * (1 << fracWidth)).astype(np.int64)
+
+def fromFixed(x, fracWidth):
+    return np.asarray(x, dtype=np.float64) / (1 << fracWidth)
+
+def wrap(x, bitWidth):
+    """ keep the low bitWidth bits, as a signed value """
+    half = np.int64(1) << (bitWidth - 1)
+    return ((x + half) & ((half << 1) - 1)) - half
+
+def mul(a, b, bitWidth, fracWidth):
+    """ Fixed * (rounding) """
+    p = np.multiply(a, b, dtype=np.int64)
+    return wrap((p + (np.int64(1) << (fracWidth - 1))) >> fracWidth, bitWidth)
+
+def mulTrunc(a, b, bitWidth, fracWidth):
+    """ Fixed *% (truncating) """
+    p = np.multiply(a, b, dtype=np.int64)
+    return wrap(p >> fracWidth, bitWidth)
+
+def csvRound(x):
+    """ value as read back from a "%10.12f" CSV written by make_params.py """
+    x = np.asarray(x, dtype=np.float64)
+    return np.array([float('%10.12f'%v) for v in x.ravel()]).reshape(x.shape)
+
+def cosTable(A, b, fracWidth, n=512):
+    """ LUT.cosTable for every phase in b, shape (len(b), n) """
+    lw = int(np.log2(n))
+    x = np.arange(n) / float(1 << (lw - 1))
+    tab = A*np.cos(np.pi*x.reshape(1, -1) + np.reshape(b, (-1, 1)))
+    return toFixed(tab, fracWidth)
+
+
+class ParallelFF( object ):
+
+    def __init__( self,
+                  ff,
+                  alpha,
+                  bitWidth=24,
+                  fracWidth=16,
+                  lutSize=512,
+                  csv=False ):
+        """
+        ff      - fitted Fastfood model (the one make_params.py exports)
+        alpha   - readout weights (1 x n)
+        """
+        self.ff = ff
+        self.bitWidth = bitWidth
+        self.fracWidth = fracWidth
+        self.lutSize = lutSize
+        self.csv = csv
+
+        lutFracWidth = int(np.log2(lutSize)) - 1
+        assert ((lutSize & (lutSize - 1)) == 0)
+        assert (fracWidth >= lutFracWidth)
+        # products are formed in int64
+        assert (bitWidth <= 32)
+        self.shift = fracWidth - lutFracWidth
+
+        rd = csvRound if csv else np.asarray
+
+        # GPHB ram: 1 -> +x, 0 -> -x, written as ((Vg+1)/2).toInt. a ternary
+        # zero reads as 0, so the hardware subtracts it
+        bits = np.trunc((rd(ff.Vg) + 1) / 2.).astype(np.int64) & 1
+        self.ram = np.where(bits == 1, 1, -1)
+
+        self.S = toFixed(rd(np.ravel(ff.S_hw)), fracWidth)
+        self.U = rd(np.ravel(ff.U_hw))
+        self.amp = np.sqrt(2.0/ff.n)
+        self.tab = cosTable(self.amp, self.U, fracWidth, lutSize)
+        self.alpha_f = rd(np.ravel(alpha))
+        self.alpha = toFixed(self.alpha_f, fracWidth)
+
+    def quantise(self, X):
+        if self.csv:
+            X = csvRound(X)
+        return toFixed(X, self.fracWidth)
+
+    def gphbx(self, Xq):
+        """ layer 1: one +/-x accumulator per dict """
+        # exact in float64 while bitWidth + log2(d) < 53
+        acc = np.dot(Xq.astype(np.float64), self.ram.T.astype(np.float64))
+        # out.direct: the accumulator is the output
+        return wrap(acc.astype(np.int64), self.bitWidth)
+
+    def had(self, v):
+        """ layer 2: hadamard transform of every stack """
+        m = v.shape[0]
+        v = np.ascontiguousarray(v, dtype=np.int64)
+        Fastfood.fast_walsh_hadamard(v.reshape(m*self.ff.k, self.ff.d))
+        return wrap(v, self.bitWidth)
+
+    def lut(self, v):
+        """ layer 3: scale by S, then look up A*cos(pi*x + U) """
+        x = mul(v, self.S, self.bitWidth, self.fracWidth)
+        idx = (x >> self.shift) & (self.lutSize - 1)
+        return self.tab[np.arange(self.ff.n), idx]
+
+    def out(self, phi):
+        """ layer 4: readout dot product """
+        p = mul(phi, self.alpha, self.bitWidth, self.fracWidth)
+        return wrap(np.sum(p, axis=1), self.bitWidth)
+
+    def forward(self, X):
+        """ every stage of the datapath, as fixed-point integers """
+        stages = {}
+        stages['X'] = self.quantise(X)
+        stages['GPHBX'] = self.gphbx(stages['X'])
+        stages['HGPHBX'] = self.had(stages['GPHBX'])
+        stages['phi'] = self.lut(stages['HGPHBX'])
+        stages['ypred'] = self.out(stages['phi'])
+        return stages
+
+    def predict(self, X):
+        return fromFixed(self.forward(X)['ypred'], self.fracWidth)
+
+    def _float(self, HGPHBX):
+        """ LUT and OUT in float64 """
+        ff = self.ff
+        VX = HGPHBX.reshape(-1, ff.n) * np.ravel(ff.S_hw)
+        phi = self.amp * np.cos(np.pi*VX + np.ravel(ff.U_hw))
+        return { 'HGPHBX' : HGPHBX.reshape(-1, ff.n),
+                 'phi' : phi,
+                 'ypred' : np.dot(phi, self.alpha_f) }
+
+    def reference(self, X):
+        """ float64 run of the hardware datapath (same ram) """
+        ff = self.ff
+        X = csvRound(X) if self.csv else X
+        v = np.dot(X, self.ram.T.astype(np.float64))
+        Fastfood.fast_walsh_hadamard(v.reshape(-1, ff.d))
+        return self._float(v)
+
+    def model(self, X):
+        """ float64 Fastfood, from transformSW's HGPHBX """
+        ff = self.ff
+        X = csvRound(X) if self.csv else X
+        return self._float(ff.apply_approximate_gaussian_matrix(
+                               ff.B, ff.G, ff.P, ff.pad_with_zeros(X)))
+
+    def compare(self, X):
+        """
+        max/mean absolute error per stage, { 'quantisation' : fixed point
+        against reference(), 'model' : reference() against model() }
+        """
+        hw = self.forward(X)
+        ref = self.reference(X)
+        sw = self.model(X)
+        err = { 'quantisation' : {}, 'model' : {} }
+        for key in ['HGPHBX', 'phi', 'ypred']:
+            e = np.abs(fromFixed(hw[key], self.fracWidth) - ref[key])
+            err['quantisation'][key] = (np.max(e), np.mean(e))
+            e = np.abs(ref[key] - sw[key])
+            err['model'][key] = (np.max(e), np.mean(e))
+        return err
+
+
+
+if __name__ == "__main__":
+
+    """
+    Push a dataset through the fixed-point model and report the error
+    """
+
+    fname = "../../../datasets/mg30_30_50k.csv"
+    nd = 128
+    bw = 24
+    fw = 16
+    if len(sys.argv) > 1:
+        fname = sys.argv[1]
+    if len(sys.argv) > 2:
+        nd = int( sys.argv[2] )
+    if len(sys.argv) > 3:
+        bw = int( sys.argv[3] )
+        fw = int( sys.argv[4] )
+
+    data = np.loadtxt( fname, delimiter="," )
+    inputs = data[:, 1:]
+
+    rng = np.random.RandomState(seed=41)
+    f = Fastfood(sigma=11.47, n_features=inputs.shape[1], n_dicts=nd,
+                 random_state=rng)
+    f.fit( gType=1 )
+    alpha = rng.normal(size=( 1, f.n ))
+
+    model = ParallelFF(f, alpha, bitWidth=bw, fracWidth=fw)
+    t1 = time()
+    ypred = model.predict( inputs )
+    t2 = time()
+    print "%d samples in %.3fs"%(len(ypred), t2-t1)
+
+    for kind, err in sorted(model.compare( inputs ).items()):
+        print "%s:"%kind
+        for key, (emax, emean) in sorted(err.items()):
+            print " %-8s max = %.3e  mean = %.3e"%(key, emax, emean)
@@ -0,0 +1,163 @@
+
+import numpy as np
+
+from lazyjit import jit, prange
+
+"""
+Batched Fast Walsh-Hadamard Transform
+
+    - replaces the row-by-row "fht2" loop in Fastfood.py with a single call over
+      the whole (rows x d) block
+    - rows are spread across all cores (numba prange, see NUMBA_NUM_THREADS)
+    - butterflies are fused into radix-8/4/2 passes, so each element is loaded
+      and stored once per 3 (or 2) stages instead of once per stage
+    - stages whose pairs fit inside BLOCK elements are run block-by-block so the
+      working set stays in L1
+
+    The stages are applied in the same order as "fht" (largest stride first) and
+    every output is produced by the same sequence of adds/subs, so the result is
+    bit for bit identical to fht2 in float64. float32 input is transformed in
+    float32.
+
+    The kernels are compiled on first use and cached on disk (see lazyjit.py).
+    Without numba, fwht/fwht2 fall back to a vectorised NumPy version with the
+    same stage order (also bit for bit identical).
+"""
+
+BLOCK = 2048 # elements per cache block (16KB in float64)
+
+
+@jit(nopython=True)
+def _radix2(a, lo, hi, h):
+    """ one stage with half-size h over a[lo:hi] """
+    for base in xrange(lo, hi, 2*h):
+        for i in xrange(base, base+h):
+            x0 = a[i]
+            x1 = a[i+h]
+            a[i] = x0 + x1
+            a[i+h] = x0 - x1
+
+@jit(nopython=True)
+def _radix4(a, lo, hi, h):
+    """ two stages (h, h/2) over a[lo:hi] """
+    q = h >> 1
+    for base in xrange(lo, hi, 2*h):
+        for i in xrange(base, base+q):
+            x0 = a[i]
+            x1 = a[i+q]
+            x2 = a[i+2*q]
+            x3 = a[i+3*q]
+            # stage h
+            y0 = x0 + x2
+            y2 = x0 - x2
+            y1 = x1 + x3
+            y3 = x1 - x3
+            # stage h/2
+            a[i] = y0 + y1
+            a[i+q] = y0 - y1
+            a[i+2*q] = y2 + y3
+            a[i+3*q] = y2 - y3
+
+@jit(nopython=True)
+def _radix8(a, lo, hi, h):
+    """ three stages (h, h/2, h/4) over a[lo:hi] """
+    q = h >> 2
+    for base in xrange(lo, hi, 2*h):
+        for i in xrange(base, base+q):
+            x0 = a[i]
+            x1 = a[i+q]
+            x2 = a[i+2*q]
+            x3 = a[i+3*q]
+            x4 = a[i+4*q]
+            x5 = a[i+5*q]
+            x6 = a[i+6*q]
+            x7 = a[i+7*q]
+            # stage h
+            y0 = x0 + x4
+            y4 = x0 - x4
+            y1 = x1 + x5
+            y5 = x1 - x5
+            y2 = x2 + x6
+            y6 = x2 - x6
+            y3 = x3 + x7
+            y7 = x3 - x7
+            # stage h/2
+            z0 = y0 + y2
+            z2 = y0 - y2
+            z1 = y1 + y3
+            z3 = y1 - y3
+            z4 = y4 + y6
+            z6 = y4 - y6
+            z5 = y5 + y7
+            z7 = y5 - y7
+            # stage h/4
+            a[i] = z0 + z1
+            a[i+q] = z0 - z1
+            a[i+2*q] = z2 + z3
+            a[i+3*q] = z2 - z3
+            a[i+4*q] = z4 + z5
+            a[i+5*q] = z4 - z5
+            a[i+6*q] = z6 + z7
+            a[i+7*q] = z6 - z7
+
+@jit(nopython=True)
+def _stages(a, lo, hi, bit, last):
+    """ apply stages bit, bit/2, ..., last over a[lo:hi] """
+    while bit >= last:
+        if bit >= 4*last:
+            _radix8(a, lo, hi, bit)
+            bit >>= 3
+        elif bit >= 2*last:
+            _radix4(a, lo, hi, bit)
+            bit >>= 2
+        else:
+            _radix2(a, lo, hi, bit)
+            bit >>= 1
+
+def _fwht2_numpy(array_):
+    """ NumPy fallback for fwht2, one vectorised pass per stage """
+    length = array_.shape[1]
+    if length < 2 or (length & (length - 1)) != 0:
+        raise ValueError('Length of rows for fwht2 must be a power of two')
+
+    a = np.ascontiguousarray(array_)
+    bit = length >> 1
+    while bit >= 1:
+        v = a.reshape(a.shape[0], -1, 2, bit)
+        temp = v[:, :, 0, :].copy()
+        v[:, :, 0, :] += v[:, :, 1, :]
+        np.subtract(temp, v[:, :, 1, :], out=v[:, :, 1, :])
+        bit >>= 1
+
+    if a is not array_:
+        array_[...] = a
+
+def _fwht_numpy(array_):
+    _fwht2_numpy(array_[np.newaxis])
+
+@jit(nopython=True, fallback=_fwht_numpy)
+def fwht(array_):
+    """ In-place FWHT of a single row (same ordering as fht). """
+    length = array_.shape[0]
+    blk = BLOCK if length > BLOCK else length
+    bit = length >> 1
+
+    # strided stages, pairs span more than one block
+    if bit >= blk:
+        _stages(array_, 0, length, bit, blk)
+        bit = blk >> 1
+
+    # remaining stages, one cache block at a time
+    if bit >= 1:
+        for lo in xrange(0, length, blk):
+            _stages(array_, lo, lo+blk, bit, 1)
+
+@jit(nopython=True, parallel=True, fallback=_fwht2_numpy)
+def fwht2(array_):
+    """ In-place row-wise FWHT of a (rows x d) block. Rows run in parallel. """
+    length = array_.shape[1]
+    if length < 2 or (length & (length - 1)) != 0:
+        raise ValueError('Length of rows for fwht2 must be a power of two')
+
+    for x in prange(array_.shape[0]):
+        fwht(array_[x])
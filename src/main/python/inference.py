@@ -0,0 +1,365 @@
+
+import collections
+import os
+import SocketServer
+import socket
+import sys
+import threading
+from timeit import default_timer as clock
+
+import numpy as np
+
+from Fastfood import Fastfood
+from bundle import load_bundle
+from ffservice import FeatureClient, read_frame, write_frame
+from readout import Predictor
+
+"""
+Micro-batching inference server
+    - serves phi(X) . ALPHA^T of a fitted Fastfood and its readout weights,
+      loaded from a bundle (Fastfood.save(..., extra={'ALPHA' : alpha}))
+    - every connection is a producer, its requests go into one queue and a
+      single worker runs them as batches through the fused predict (see
+      readout.py)
+    - a batch is closed when it has max_batch rows or when the deadline
+      (max_wait after its first request) passes. The wait is adaptive: it is
+      only taken while requests arrive faster than max_wait (EWMA of the
+      gaps), a lone request is run straight away
+    - backpressure: at max_queue queued rows producers block (up to
+      queue_timeout, then the request fails with "busy"), they stop reading
+      their sockets and the clients stall in turn
+    - stats: counters, queue depth, batch size histogram (powers of two) and
+      p50/p99/p999 latency (queued to answered) over the last requests
+    - swap: a new bundle is loaded off the worker and replaces the model
+      between batches, queued requests are served by the new model, none
+      are dropped. The input width has to stay the same
+
+    Python 2 has no asyncio, connections are threads (SocketServer) that only
+    parse frames and wait, the batching worker is one more thread.
+
+Protocol: the frames of ffservice.py, ops
+
+    ping | stats | quit
+    predict     shape, dtype as for transformSW, the body is X (rows x d)
+    swap        path of the new bundle
+
+run:    python inference.py bundle.ffb socket_path|host:port [max_batch] [max_wait_ms]
+"""
+
+N_LATENCIES = 100000  # latencies kept for the percentiles
+
+
+def load_model(path):
+    """ (Fastfood, ALPHA) from a bundle """
+    meta, arrays = load_bundle(path)
+    if 'ALPHA' not in arrays:
+        raise ValueError('%s has no ALPHA (readout weights)'%path)
+    return Fastfood.load(path), np.array(arrays['ALPHA'], dtype=np.float64)
+
+
+class _Request( object ):
+
+    __slots__ = ['X', 'y', 'error', 't0', 'done']
+
+    def __init__( self, X ):
+        self.X = X
+        self.y = None
+        self.error = None
+        self.t0 = clock()
+        self.done = threading.Event()
+
+
+class MicroBatcher( object ):
+
+    def __init__( self, ff, alpha, max_batch=64, max_wait=0.0005,
+                  max_queue=4096, queue_timeout=1. ):
+        """
+        ff, alpha       - fitted Fastfood and readout weights (outputs x
+                          n_outputs)
+        max_batch       - rows per batch
+        max_wait        - seconds a batch may wait for more rows
+        max_queue       - queued rows before producers block
+        queue_timeout   - seconds a producer blocks before "busy"
+        """
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.predictor = Predictor(ff, alpha)
+        self.model = ff
+        self.swaps = 0
+        # compile before the first request
+        self.predictor(np.zeros((1, ff.d_orig)))
+
+        self.queue = collections.deque()
+        self.depth = 0                  # queued rows
+        self.lock = threading.Lock()
+        self.cond = threading.Condition(self.lock)     # queue not empty
+        self.space = threading.Condition(self.lock)    # queue has room
+        self.gap = max_wait * 10        # EWMA of the inter-arrival time
+        self.last = clock()
+
+        self.counters = collections.Counter()
+        self.batches = collections.Counter()
+        self.latencies = np.zeros(N_LATENCIES)
+        self.n_latencies = 0
+        self.t_start = clock()
+
+        self.running = True
+        self.worker = threading.Thread(target=self._run)
+        self.worker.daemon = True
+        self.worker.start()
+
+    def submit(self, X):
+        """ queue X, returns the request (wait on request.done) """
+        X = np.atleast_2d(np.asarray(X, dtype=np.float64))
+        if X.shape[0] == 0:
+            raise ValueError('X has no rows')
+        if X.shape[1] != self.predictor.d_orig:
+            raise ValueError('X has %d columns, the model %d'%(
+                X.shape[1], self.predictor.d_orig))
+        req = _Request(X)
+        with self.cond:
+            deadline = req.t0 + self.queue_timeout
+            while self.depth + X.shape[0] > self.max_queue and self.depth > 0:
+                left = deadline - clock()
+                if left <= 0:
+                    self.counters['rejected'] += 1
+                    raise RuntimeError('busy: %d rows queued'%self.depth)
+                self.space.wait(left)
+            self.gap = 0.9*self.gap + 0.1*(req.t0 - self.last)
+            self.last = req.t0
+            self.queue.append(req)
+            self.depth += X.shape[0]
+            self.counters['requests'] += 1
+            self.counters['rows'] += X.shape[0]
+            self.cond.notify()
+        return req
+
+    def predict(self, X):
+        """ submit and wait, (rows x outputs) """
+        req = self.submit(X)
+        req.done.wait()
+        if req.error is not None:
+            raise req.error
+        return req.y
+
+    def _take(self):
+        """ the next batch of requests, None when stopped """
+        with self.cond:
+            # no timeout: a timed wait polls in python 2
+            while not self.queue and self.running:
+                self.cond.wait()
+            if not self.running:
+                return None
+            # adaptive deadline: only wait for more while they are coming in
+            if self.gap < self.max_wait:
+                deadline = self.queue[0].t0 + self.max_wait
+                while self.depth < self.max_batch and self.running:
+                    left = deadline - clock()
+                    if left <= 0:
+                        break
+                    self.cond.wait(left)
+            batch, rows = [], 0
+            while self.queue and (not batch or
+                                  rows + self.queue[0].X.shape[0] <= self.max_batch):
+                req = self.queue.popleft()
+                batch.append(req)
+                rows += req.X.shape[0]
+            self.depth -= rows
+            self.space.notify_all()
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._take()
+            if batch is None:
+                return
+            try:
+                self._serve(batch)
+            except Exception as e:
+                # the worker must not die, nobody else answers the queue
+                for req in batch:
+                    if not req.done.is_set():
+                        req.error = e
+                        req.done.set()
+
+    def _serve(self, batch):
+        """ predict one batch and answer its requests """
+        predictor = self.predictor
+        rows = [ req.X.shape[0] for req in batch ]
+        try:
+            X = batch[0].X if len(batch) == 1 else np.vstack([ r.X for r in batch ])
+            y = predictor(X)
+            lo = 0
+            for req, m in zip(batch, rows):
+                req.y = y[lo:lo + m]
+                lo += m
+        except Exception as e:
+            for req in batch:
+                req.error = e
+        t = clock()
+        for req in batch:
+            req.done.set()
+        self._record(batch, sum(rows), t)
+
+    def _record(self, batch, rows, t):
+        with self.cond:
+            self.counters['batches'] += 1
+            if batch[0].error is not None:
+                self.counters['errors'] += len(batch)
+            # next power of two, rows >= 1
+            self.batches[1 << (rows - 1).bit_length()] += 1
+            for req in batch:
+                self.latencies[self.n_latencies % N_LATENCIES] = t - req.t0
+                self.n_latencies += 1
+
+    def swap(self, path):
+        """ replace the model by the bundle at path, between two batches """
+        ff, alpha = load_model(path)
+        predictor = Predictor(ff, alpha)
+        if predictor.d_orig != self.predictor.d_orig:
+            raise ValueError('%s takes %d inputs, the served model %d'%(
+                path, predictor.d_orig, self.predictor.d_orig))
+        # compile / warm up before going live
+        predictor(np.zeros((1, predictor.d_orig)))
+        with self.cond:
+            self.predictor = predictor
+            self.model = ff
+            self.swaps += 1
+
+    def stats(self):
+        with self.cond:
+            n = min(self.n_latencies, N_LATENCIES)
+            us = 1e6 * self.latencies[:n]
+            elapsed = clock() - self.t_start
+            out = dict(self.counters)
+            out.update({ 'queue_rows' : self.depth,
+                         'queue_requests' : len(self.queue),
+                         'batch_sizes' : dict((str(k), v) for k, v in
+                                              sorted(self.batches.items())),
+                         'swaps' : self.swaps,
+                         'uptime_s' : elapsed,
+                         'rows_per_s' : self.counters['rows'] / elapsed,
+                         'max_batch' : self.max_batch,
+                         'max_wait_s' : self.max_wait,
+                         'n_dicts' : self.model.n })
+            for q in [50, 99, 99.9]:
+                out['p%g_us'%q] = float(np.percentile(us, q)) if n else 0.
+            return out
+
+    def close(self):
+        with self.cond:
+            self.running = False
+            self.cond.notify_all()
+        self.worker.join()
+
+
+class _Handler( SocketServer.StreamRequestHandler ):
+
+    def handle(self):
+        batcher = self.server.batcher
+        while True:
+            try:
+                req, body = read_frame(self.rfile)
+            except EOFError:
+                return
+            op = req.get('op')
+            if op == 'quit':
+                write_frame(self.wfile, { 'status' : 'ok' })
+                return
+            try:
+                header, data = { 'status' : 'ok' }, b''
+                if op == 'predict':
+                    X = np.frombuffer(body, dtype=req.get('dtype', '<f8'))
+                    y = batcher.predict(X.reshape(req['shape']))
+                    y = np.ascontiguousarray(y, dtype='<f8')
+                    header.update(shape=list(y.shape), dtype='<f8')
+                    data = y.tobytes()
+                elif op == 'stats':
+                    header['stats'] = batcher.stats()
+                elif op == 'swap':
+                    batcher.swap(req['path'])
+                elif op == 'ping':
+                    header['pid'] = os.getpid()
+                else:
+                    raise ValueError('unknown op: %s'%op)
+            except Exception as e:
+                header, data = { 'status' : 'error',
+                                 'message' : '%s: %s'%(type(e).__name__, e) }, b''
+            write_frame(self.wfile, header, data)
+
+class _UnixServer( SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer ):
+    daemon_threads = True
+
+class _TCPServer( SocketServer.ThreadingMixIn, SocketServer.TCPServer ):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def parse_address(address):
+    """ "host:port" -> (host, port), anything else is a unix socket path """
+    if isinstance(address, tuple):
+        return address
+    host, sep, port = address.rpartition(':')
+    if sep and port.isdigit() and '/' not in address:
+        return (host or '127.0.0.1', int(port))
+    return address
+
+def make_server(address, batcher):
+    """ threaded server on a unix socket path or a (host, port) """
+    address = parse_address(address)
+    if isinstance(address, tuple):
+        server = _TCPServer(address, _Handler)
+    else:
+        if os.path.exists(address):
+            os.remove(address)
+        server = _UnixServer(address, _Handler)
+    server.batcher = batcher
+    return server
+
+def serve(path, address, **options):
+    ff, alpha = load_model(path)
+    batcher = MicroBatcher(ff, alpha, **options)
+    server = make_server(address, batcher)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        batcher.close()
+        if not isinstance(server.server_address, tuple):
+            os.remove(server.server_address)
+
+
+class InferenceClient( FeatureClient ):
+    """ client of the inference server, unix socket path or (host, port) """
+
+    def __init__( self, address ):
+        address = parse_address(address)
+        if isinstance(address, tuple):
+            self.sock = socket.create_connection(address)
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            FeatureClient.__init__(self, rfile=self.sock.makefile('rb'),
+                                   wfile=self.sock.makefile('wb'))
+        else:
+            FeatureClient.__init__(self, path=address)
+
+    def predict(self, X):
+        return self._array('predict', X)
+
+    def stats(self):
+        return self.request(op='stats')[0]['stats']
+
+    def swap(self, path):
+        self.request(op='swap', path=path)
+
+
+
+if __name__ == "__main__":
+
+    options = {}
+    if len(sys.argv) > 3:
+        options['max_batch'] = int(sys.argv[3])
+    if len(sys.argv) > 4:
+        options['max_wait'] = float(sys.argv[4]) / 1e3
+    serve(sys.argv[1], sys.argv[2], **options)
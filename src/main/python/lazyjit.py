@@ -0,0 +1,74 @@
+
+import os
+
+"""
+Lazily compiled, disk-cached numba kernels
+    - numba is imported on the first kernel call instead of at module import,
+      so scripts that never transform (or only export) don't pay for it
+    - kernels are compiled with cache=True, later processes load the machine
+      code from __pycache__ (or $NUMBA_CACHE_DIR) instead of recompiling
+    - without numba, or with FASTFOOD_JIT=0, the kernel's fallback is called
+      (the plain Python function if it has none)
+
+    Kernels may call other kernels and use prange from this module, they are
+    swapped for the compiled dispatchers / numba.prange on first use.
+"""
+
+ENABLED = os.environ.get('FASTFOOD_JIT', '1') != '0'
+
+_numba = []
+
+def numba():
+    """ the numba module, or None if it is disabled or not installed """
+    if not _numba:
+        mod = None
+        if ENABLED:
+            try:
+                import numba as mod
+            except ImportError:
+                pass
+        _numba.append(mod)
+    return _numba[0]
+
+def prange(*args):
+    """ placeholder for numba.prange, a plain range when not compiled """
+    return xrange(*args)
+
+
+class LazyKernel( object ):
+
+    def __init__( self, fn, options, fallback=None ):
+        self.fn = fn
+        self.options = options
+        self.fallback = fallback
+        self.kernel = None
+        self.__name__ = fn.__name__
+        self.__doc__ = fn.__doc__
+
+    def compile(self):
+        """ the numba dispatcher, or the fallback """
+        if self.kernel is None:
+            nb = numba()
+            if nb is None:
+                self.kernel = self.fallback or self.fn
+            else:
+                g = self.fn.__globals__
+                # resolve the kernels and prange this one refers to first
+                for name in self.fn.__code__.co_names:
+                    obj = g.get(name)
+                    if isinstance(obj, LazyKernel):
+                        g[name] = obj.compile()
+                    elif obj is prange:
+                        g[name] = nb.prange
+                self.kernel = nb.jit(cache=True, **self.options)(self.fn)
+        return self.kernel
+
+    def __call__(self, *args):
+        return self.compile()(*args)
+
+
+def jit(fallback=None, **options):
+    """ numba.jit(cache=True, **options), compiled on first call """
+    def wrap(fn):
+        return LazyKernel(fn, options, fallback)
+    return wrap
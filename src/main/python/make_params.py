@@ -1,52 +1,110 @@
 import numpy as np
 import sys
 import os
+import shutil
 
 from Fastfood import Fastfood
+from bundle import load_bundle
+from cache import ModelCache, file_stamp
+from dataset import load_csv
 
 '''
 Script for producing S, G, H, PHB, GPHB matrices
 
-run:	python make_params.py n_dicts n_feats gType folder
+run:	python make_params.py n_dicts n_feats gType folder [csv]
 
 When called from scala, use folder = /.tmp
+
+Writes a binary bundle, folder/params.ffb (see bundle.py). Add csv to also
+write the old per-matrix CSV files (slow for large n_dicts). Bundles are kept
+in the model cache (see cache.py), so repeated runs skip the fit. The scala
+testers normally get the same bundle from ffservice.py instead.
 '''
 
-nd = int( sys.argv[1] )
-nf = int( sys.argv[2] )
-gt = int( sys.argv[3] )
-folder = sys.argv[4]
+XFILE = "../exanicFastfood/artificialNovMod.csv"
+
+def export_params(nd, nf, gt, directory, seed=41, sigma=11.47, xfile=XFILE,
+                  csv=False, cache=None):
+	"""
+	Fit (or fetch from the cache) and write directory/params.ffb, plus the
+	CSV files with csv=True. Returns the path of the cached bundle, nothing is
+	written for directory=None
+	"""
+	if directory is None:
+		csv = False
+	elif not os.path.exists( directory ):
+		os.makedirs(directory)
+
+	# fitted + exported bundles are cached by (nd, nf, gt, seed, sigma, data, code)
+	if cache is None:
+		cache = ModelCache()
+	params = dict(n_dicts=nd, n_features=nf, gType=gt, sigma=sigma, seed=seed,
+	              data=file_stamp(xfile))
+	key = cache.key(**params)
+	fname = cache.get(key)
+
+	if fname is None:
+		rng = np.random.RandomState(seed=seed)
+		f = Fastfood(sigma=sigma, n_features=nf, n_dicts=nd, random_state=rng)
+		f.fit( gType=gt )
+
+		alpha = rng.normal(size=( 1, f.n ))
+		print alpha
+
+		#X = np.random.randn(10, nf)
+		X = load_csv(xfile, usecols = range(3, 11) )
+
+		fname = cache.put(key, lambda fn: f.save(fn, extra={ 'ALPHA' : alpha, 'X' : X },
+		                                         seed=seed), **params)
+
+	if directory is not None:
+		shutil.copyfile(fname, directory+"/params.ffb")
+
+	if csv:
+		f = Fastfood.load(fname)
+		meta, arrays = load_bundle(fname)
+		alpha = arrays['ALPHA']
+		X = arrays['X']
 
-directory = os.getcwd()+folder
+		# save matrices as csv files
+		np.savetxt(directory+"/GPHB.csv", f.Vg, delimiter=",", fmt="%10.5f")
+		np.savetxt(directory+"/PHB.csv", f.Vp, delimiter=",", fmt="%.f")
+		np.savetxt(directory+"/H.csv", f.H, delimiter=",", fmt="%.f")
+		np.savetxt(directory+"/G.csv", f.G, delimiter=",", fmt="%10.12f")
+		np.savetxt(directory+"/S.csv", f.S_hw, delimiter=",", fmt="%10.12f")
+		np.savetxt(directory+"/U.csv", f.U_hw, delimiter=",", fmt="%10.12f")
+		np.savetxt(directory+"/B.csv", f.B, delimiter=",", fmt="%.f")
+		np.savetxt(directory+"/ALPHA.csv", alpha, delimiter=",", fmt="%10.12f")
+		np.savetxt(directory+"/X.csv", X, delimiter=",", fmt="%10.12f")
 
-if not os.path.exists( directory ):
-	os.makedirs(directory)
+		if gt == 2:
+			# ternary G: only the non-zero taps (lane, value) and their GPHB rows
+			lanes = f.sparse_G()[0]
+			print "ternary G: %d of %d taps are non-zero"%(len(lanes), f.n)
+			np.savetxt(directory+"/Gtaps.csv", np.column_stack([lanes, np.ravel(f.G)[lanes]]),
+			           delimiter=",", fmt="%d")
+			np.savetxt(directory+"/GPHBtaps.csv", np.column_stack([lanes, f.Vg[lanes]]),
+			           delimiter=",", fmt="%.f")
 
+	return fname
 
-rng = np.random.RandomState(seed=41)
-f = Fastfood(sigma=11.47, n_features=nf, n_dicts=nd, random_state=rng)
-f.fit( gType=gt )
 
-alpha = rng.normal(size=( 1, f.n ))
-print alpha
 
-# save matrices as csv files
-np.savetxt(directory+"/GPHB.csv", f.Vg, delimiter=",", fmt="%10.5f")
-np.savetxt(directory+"/PHB.csv", f.Vp, delimiter=",", fmt="%.f")
-np.savetxt(directory+"/H.csv", f.H, delimiter=",", fmt="%.f")
-np.savetxt(directory+"/G.csv", f.G, delimiter=",", fmt="%10.12f")
-np.savetxt(directory+"/S.csv", f.S_hw, delimiter=",", fmt="%10.12f")
-np.savetxt(directory+"/U.csv", f.U_hw, delimiter=",", fmt="%10.12f")
-np.savetxt(directory+"/B.csv", f.B, delimiter=",", fmt="%.f")
-np.savetxt(directory+"/ALPHA.csv", alpha, delimiter=",", fmt="%10.12f")
+if __name__ == "__main__":
 
-#X = np.random.randn(10, nf)
-X = np.loadtxt("../exanicFastfood/artificialNovMod.csv", delimiter=",", 
-        usecols = range(3, 11) )
+	nd = int( sys.argv[1] )
+	nf = int( sys.argv[2] )
+	gt = int( sys.argv[3] )
+	folder = sys.argv[4]
+	csv = len(sys.argv) > 5 and sys.argv[5] == "csv"
 
-np.savetxt(directory+"/X.csv", X, delimiter=",", fmt="%10.12f")
+	directory = os.getcwd()+folder
+	fname = export_params(nd, nf, gt, directory, csv=csv)
 
-GPHBX = np.dot(X, f.Vg.T).reshape(f.k, -1 ,f.d)
-HGPHBX = np.vstack( [ np.dot(GPHBX[i], f.H) ] for i in range(f.k) )
-print GPHBX.shape, HGPHBX.shape
+	f = Fastfood.load(fname)
+	meta, arrays = load_bundle(fname)
+	X = arrays['X']
 
+	GPHBX = np.dot(X, f.Vg.T).reshape(f.k, -1 ,f.d)
+	HGPHBX = np.vstack( [ np.dot(GPHBX[i], f.H) ] for i in range(f.k) )
+	print GPHBX.shape, HGPHBX.shape
@@ -0,0 +1,159 @@
+
+import numpy as np
+
+from golden import toFixed, fromFixed, mul, wrap
+from lazyjit import jit
+
+"""
+Online readout training, one compiled loop over the whole chunk
+    - float mode: normalised LMS, w += eta * e*x / (eps + x.x)
+    - fixed mode: the TRAIN register pipeline of parallel/train.scala
+        err      = y - ypred                (wraps at bitWidth)
+        etaError = eta *% err               (truncating)
+        update   = etaError *% kernel       (truncating)
+        weights  = weights + update         (wraps)
+      with ypred from OUT (alpha*phi rounded, wrapped sum). The hardware is
+      not normalised, eta defaults to 1.0 as in TRAIN
+    - batch_size > 1 computes the errors of a mini-batch against the same
+      weights and applies the mean (float) or summed (fixed) update
+
+    partial_fit can be called on successive chunks of a stream, the a-priori
+    error of every sample is kept in errors_ (float, also in fixed mode).
+"""
+
+
+@jit(nopython=True)
+def _nlms(phi, y, w, eta, eps, batch, normalise, err):
+    n, m = phi.shape
+    upd = np.zeros(m)
+    for lo in xrange(0, n, batch):
+        hi = min(lo + batch, n)
+        for j in xrange(m):
+            upd[j] = 0.
+        for i in xrange(lo, hi):
+            yp = 0.
+            nrm = eps
+            for j in xrange(m):
+                yp += w[j]*phi[i, j]
+                nrm += phi[i, j]*phi[i, j]
+            e = y[i] - yp
+            err[i] = e
+            if normalise:
+                e = e / nrm
+            for j in xrange(m):
+                upd[j] += e*phi[i, j]
+        s = eta / (hi - lo)
+        for j in xrange(m):
+            w[j] += s*upd[j]
+
+@jit(nopython=True)
+def _wrap(x, bitWidth):
+    half = np.int64(1) << (bitWidth - 1)
+    return ((x + half) & ((half << 1) - 1)) - half
+
+@jit(nopython=True)
+def _lms_fixed(phi, y, w, eta, batch, bitWidth, fracWidth, err):
+    n, m = phi.shape
+    rnd = np.int64(1) << (fracWidth - 1)
+    upd = np.zeros(m, dtype=np.int64)
+    for lo in xrange(0, n, batch):
+        hi = min(lo + batch, n)
+        for j in xrange(m):
+            upd[j] = 0
+        for i in xrange(lo, hi):
+            # OUT: rounding multiply, adder tree. sums are modular, so one
+            # wrap at the end gives the same result as wrapping every register
+            yp = np.int64(0)
+            for j in xrange(m):
+                yp += (w[j]*phi[i, j] + rnd) >> fracWidth
+            e = _wrap(y[i] - yp, bitWidth)
+            err[i] = e
+            etaError = _wrap((eta*e) >> fracWidth, bitWidth)
+            for j in xrange(m):
+                upd[j] += (etaError*phi[i, j]) >> fracWidth
+        for j in xrange(m):
+            w[j] = _wrap(w[j] + upd[j], bitWidth)
+
+
+class OnlineRegressor( object ):
+
+    def __init__( self,
+                  n_inputs,
+                  eta=None,
+                  batch_size=1,
+                  normalise=True,
+                  eps=1e-8,
+                  fixed=False,
+                  bitWidth=18,
+                  fracWidth=10,
+                  alpha=None ):
+        """
+        n_inputs    - number of features (n_dicts)
+        eta         - step size, 1e-2 (float) or 1.0 (fixed) by default
+        fixed       - bit-accurate TRAIN model, normalise and eps are unused
+        alpha       - initial weights (zeros by default)
+        """
+        self.n_inputs = n_inputs
+        self.eta = eta if eta is not None else (1.0 if fixed else 1e-2)
+        self.batch_size = batch_size
+        self.normalise = normalise
+        self.eps = eps
+        self.fixed = fixed
+        self.bitWidth = bitWidth
+        self.fracWidth = fracWidth
+        self.n_updates = 0
+        self.errors_ = np.zeros(0)
+
+        alpha = np.zeros(n_inputs) if alpha is None else np.ravel(alpha)
+        assert (alpha.size == n_inputs), "Error: alpha has the wrong size"
+        if fixed:
+            self.w = toFixed(alpha, fracWidth)
+        else:
+            self.w = np.array(alpha, dtype=np.float64)
+
+    @property
+    def alpha(self):
+        """ weights as floats, (1 x n_inputs) like the readout alpha """
+        w = fromFixed(self.w, self.fracWidth) if self.fixed else self.w
+        return w.reshape(1, -1)
+
+    def _quantise(self, x):
+        """ integer arrays are taken as fixed point already (eg. golden.py) """
+        x = np.asarray(x)
+        if np.issubdtype(x.dtype, np.integer):
+            return np.ascontiguousarray(x, dtype=np.int64)
+        return toFixed(x, self.fracWidth)
+
+    def partial_fit(self, phi, y):
+        """ one pass over the rows of phi, in order """
+        phi = np.atleast_2d(phi)
+        y = np.ravel(y)
+        assert (phi.shape == (y.size, self.n_inputs)), "Error: phi/y shape mismatch"
+
+        if self.fixed:
+            err = np.empty(y.size, dtype=np.int64)
+            _lms_fixed(self._quantise(phi), self._quantise(y), self.w,
+                       np.int64(toFixed(self.eta, self.fracWidth)),
+                       self.batch_size, self.bitWidth, self.fracWidth, err)
+            self.errors_ = fromFixed(err, self.fracWidth)
+        else:
+            self.errors_ = np.empty(y.size)
+            _nlms(np.ascontiguousarray(phi, dtype=np.float64),
+                  np.ascontiguousarray(y, dtype=np.float64), self.w,
+                  float(self.eta), float(self.eps), self.batch_size,
+                  self.normalise, self.errors_)
+
+        self.n_updates += y.size
+        return self
+
+    def fit(self, phi, y, n_epochs=1):
+        for _ in xrange(n_epochs):
+            self.partial_fit(phi, y)
+        return self
+
+    def predict(self, phi):
+        phi = np.atleast_2d(phi)
+        if self.fixed:
+            p = mul(self._quantise(phi), self.w, self.bitWidth, self.fracWidth)
+            return fromFixed(wrap(np.sum(p, axis=1), self.bitWidth), self.fracWidth)
+        return np.dot(phi, self.w)
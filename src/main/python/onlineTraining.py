@@ -6,7 +6,8 @@ from time import time
 from sklearn import svm
 from sklearn.metrics import mean_squared_error
 from Fastfood import Fastfood
-import pandas as pd
+from online import OnlineRegressor
+from dataset import load_csv
 
 """
 Test Mackey-Glass using features extracted from chisel fasfood/parallel  
@@ -14,10 +15,10 @@ Test Mackey-Glass using features extracted from chisel fasfood/parallel
 
 # The mackey-glass dataset
 fname = "../../../datasets/mg30_30_50k.csv"
-X = pd.read_csv( fname, index_col=False, header=None )
+X = load_csv( fname )
 
-targets = X[0].values
-inputs = X.drop(X.columns[[0]], axis=1).values
+targets = X[:, 0]
+inputs = X[:, 1:]
 
 data_train = inputs[:30000]
 data_test = inputs[30000:]
@@ -40,33 +41,21 @@ phi_test = f.transformSW( data_test )
 
 
 # input from chisel features
-inputs = np.loadtxt( "../../../datasets/chiselFF_train_mg.csv", delimiter=',' )
+inputs = load_csv( "../../../datasets/chiselFF_train_mg.csv" )
 phi_train = inputs[:30000]
 phi_test = inputs[30000:]
 
 alpha = rng.normal(size=(1, phi_train.shape[1]))
 eta = 1e-2
 
-# train
-for i,x in enumerate(phi_train):
-	x = x.reshape(1,-1)
-	y_pred = np.dot( alpha, x.T )
-	y = targets_train[i]
-
-	err = y-y_pred
-	dJ = np.dot( err, x.reshape(1,-1) )/np.dot( x, x.T )
-	
-	alpha = alpha + eta*dJ
-	
-# test
-SE = []	
-for i,x in enumerate( phi_test):
-	x = x.reshape(1,-1)
-	ypred = np.dot( alpha, x.T )
-	y = targets_test[i]
-	err = y - ypred
-	SE.append( err[0]**2 )
+# train, one compiled NLMS pass (see online.py)
+reg = OnlineRegressor( phi_train.shape[1], eta=eta, eps=0., alpha=alpha )
+t0 = time()
+reg.partial_fit( phi_train, targets_train )
+print "Online training: %.2f M updates/s"%( phi_train.shape[0]/( time()-t0 )/1e6 )
 
+# test
+SE = ( targets_test - reg.predict( phi_test ) )**2
 
 print "Online MSE = ", np.mean( SE )
 
@@ -0,0 +1,226 @@
+
+import numpy as np
+
+from Fastfood import Fastfood, dim_constraints, issparse
+from bundle import save_bundle, load_bundle
+from cosine import cos_cycles
+
+"""
+Procedural Fastfood parameters
+    - every stack's B, G, P, S and U is a function of (seed, stack index)
+      only, drawn from a counter-based generator (Philox4x32-10, Salmon et
+      al. 2011): word j of stream s of stack i is Philox(counter=(j/4, i, s,
+      0), key=seed)
+    - stacks can be generated in any order, in parallel or again on demand:
+        ProceduralFastfood.transform regenerates each stack while
+        transforming, parameter memory is one stack (O(d))
+        Fastfood.fit(procedural=True) builds the usual arrays, stacks
+        optionally spread over a process pool
+        Fastfood.grow appends procedural stacks to a procedural model
+    - the bundle of a procedural model (save) is the header only, every
+      process that loads it gets the same parameters, including the
+      hardware matrices
+
+    numpy 1.16 has no Philox bit generator, so it is implemented here
+    (vectorised, checked against the Random123 known answers in philox).
+
+    Distributions per stack (d lanes):
+        B       +/-1, padding lanes zero
+        G       gType 0 N(0,1) (Box-Muller), 1 +/-1, 2 +/-1 with probability
+                density else 0
+        P       argsort of d uniforms
+        S       chi(d) (inverse CDF) / |G|, the same normalisation as fit
+        U       uniform [0, 2*pi), as in fit
+"""
+
+M0, M1 = 0xD2511F53, 0xCD9E8D57
+W0, W1 = 0x9E3779B9, 0xBB67AE85
+MASK = 0xFFFFFFFF
+
+STREAM = { 'B' : 0, 'G' : 1, 'Gsign' : 2, 'P' : 3, 'S' : 4, 'U' : 5 }
+
+
+def philox(counter, key, rounds=10):
+    """ Philox4x32: counter (N x 4), key (2,) -> N x 4 uint32 """
+    c = [ np.asarray(counter, dtype=np.uint64)[:, i] for i in xrange(4) ]
+    k0, k1 = np.uint64(key[0] & MASK), np.uint64(key[1] & MASK)
+    m0, m1, mask = np.uint64(M0), np.uint64(M1), np.uint64(MASK)
+    s32 = np.uint64(32)
+    for r in xrange(rounds):
+        p0 = m0 * c[0]
+        p1 = m1 * c[2]
+        c = [ (p1 >> s32) ^ c[1] ^ k0, p1 & mask,
+              (p0 >> s32) ^ c[3] ^ k1, p0 & mask ]
+        k0 = (k0 + np.uint64(W0)) & mask
+        k1 = (k1 + np.uint64(W1)) & mask
+    return np.vstack(c).T.astype(np.uint32)
+
+def words(seed, stack, stream, n):
+    """ n uint32 words of stream of stack """
+    blocks = (n + 3) // 4
+    counter = np.zeros((blocks, 4), dtype=np.uint64)
+    counter[:, 0] = np.arange(blocks)
+    counter[:, 1] = stack
+    counter[:, 2] = stream
+    return np.ravel(philox(counter, (seed & MASK, (seed >> 32) & MASK)))[:n]
+
+def uniforms(seed, stack, stream, n):
+    """ n doubles in [0, 1), 53 random bits each """
+    w = words(seed, stack, stream, 2*n).astype(np.float64).reshape(n, 2)
+    a = np.floor(w[:, 0] / 32.)
+    b = np.floor(w[:, 1] / 64.)
+    return (a*67108864. + b) / 9007199254740992.
+
+def chi_ppf(u, df):
+    """ inverse CDF of chi(df) """
+    from scipy.special import gammaincinv
+    return np.sqrt(2*gammaincinv(df / 2., u))
+
+
+class ProceduralFastfood( object ):
+
+    def __init__( self, seed, sigma=np.sqrt(1./2.), n_features=4, n_dicts=8,
+                  gType=1, sparsity=0.2, tradeoff='mem' ):
+        self.seed = int(seed)
+        self.sigma = sigma
+        self.d_orig = n_features
+        self.gType = gType
+        self.density = 1-sparsity
+        self.tradeoff = tradeoff
+        self.d, self.n, self.k = dim_constraints(d=n_features, n=n_dicts)
+        self.cosine = ('exact', 512, False)
+
+    @staticmethod
+    def from_model(ff, gType=None):
+        """ the procedural generator of Fastfood ff (seed ff.stack_seed()) """
+        return ProceduralFastfood(ff.stack_seed(), sigma=ff.sigma,
+                                  n_features=ff.d_orig, n_dicts=ff.n,
+                                  gType=ff.T if gType is None else gType,
+                                  sparsity=1-ff.density, tradeoff=ff.tradeoff)
+
+    def n_outputs(self):
+        return 2*self.n if self.tradeoff == 'accuracy' else self.n
+
+    def stack(self, i):
+        """
+        B, G, P, Pi, S and U of stack i, each of length d. P and Pi index
+        within the stack
+        """
+        d, seed = self.d, self.seed
+        B = (words(seed, i, STREAM['B'], d) & 1).astype(np.int64)*2 - 1
+        B[self.d_orig:] = 0
+
+        if self.gType == 0:
+            u = uniforms(seed, i, STREAM['G'], 2*d).reshape(2, d)
+            G = np.sqrt(-2*np.log1p(-u[0])) * np.cos(2*np.pi*u[1])
+        else:
+            G = (words(seed, i, STREAM['Gsign'], d) & 1).astype(np.int64)*2 - 1
+            if self.gType == 2:
+                G[uniforms(seed, i, STREAM['G'], d) >= self.density] = 0
+
+        P = np.argsort(uniforms(seed, i, STREAM['P'], d), kind='mergesort')
+        # the mapping the in-place take of apply_approximate_gaussian_matrix
+        # applies (see Fastfood.fit)
+        Pi = np.arange(d).reshape(1, -1)
+        np.take(Pi, P, axis=1, mode='wrap', out=Pi)
+
+        S = chi_ppf(uniforms(seed, i, STREAM['S'], d), d) / np.sqrt(np.sum(G**2))
+        U = uniforms(seed, i, STREAM['U'], d) * 2 * np.pi
+        return { 'B' : B, 'G' : G, 'P' : P, 'Pi' : np.ravel(Pi), 'S' : S, 'U' : U }
+
+    def stacks(self, lo, hi, n_jobs=None):
+        """ stacks [lo, hi), over a process pool if n_jobs > 1 """
+        if not n_jobs or n_jobs == 1:
+            return [ self.stack(i) for i in xrange(lo, hi) ]
+        import multiprocessing
+        pool = multiprocessing.Pool(n_jobs)
+        try:
+            return pool.map(_stack, [ (self, i) for i in xrange(lo, hi) ])
+        finally:
+            pool.close()
+            pool.join()
+
+    def fill(self, f, n_jobs=None):
+        """ set the parameters of Fastfood f (same shape) """
+        assert ((f.d, f.n, f.k) == (self.d, self.n, self.k))
+        stacks = self.stacks(0, self.k, n_jobs)
+        d = self.d
+        f.T = self.gType
+        f.B = np.vstack([ s['B'] for s in stacks ])
+        f.G = np.vstack([ s['G'] for s in stacks ])
+        f.P = np.hstack([ i*d + s['P'] for i, s in enumerate(stacks) ])
+        f.Pi = np.hstack([ i*d + s['Pi'] for i, s in enumerate(stacks) ])
+        f.S = np.vstack([ s['S'] for s in stacks ])
+        f.U = np.hstack([ s['U'] for s in stacks ])
+        f.S_hw = (1 / (f.sigma * np.sqrt(f.d)) ) * f.S
+        f.U_hw = 2*np.pi*f.U
+        f.A_hw = np.sqrt( 2./f.n )
+        f.procedural = True
+        f._hw = {}
+        f._sparse = None
+        return f
+
+    def materialize(self, n_jobs=None, verbose=False):
+        """ the dense Fastfood with these parameters """
+        f = Fastfood(sigma=self.sigma, n_features=self.d_orig, n_dicts=self.n,
+                     sparsity=1-self.density, random_state=self.seed,
+                     tradeoff=self.tradeoff, verbose=verbose)
+        return self.fill(f, n_jobs)
+
+    def transform(self, X, out=None):
+        """
+        transformSW(X), one stack at a time: the stack's parameters are
+        generated, its columns computed and the parameters dropped
+        """
+        assert (X.shape[1] == self.d_orig)
+        m, d, n = X.shape[0], self.d, self.n
+        if out is None:
+            out = np.empty((m, self.n_outputs()))
+        assert (out.shape == (m, self.n_outputs()))
+        if issparse(X):
+            X = X.toarray()
+        x = np.zeros((m, d))
+        x[:, :self.d_orig] = X
+
+        scale = 1 / (self.sigma * np.sqrt(self.d))
+        for i in xrange(self.k):
+            s = self.stack(i)
+            w = np.multiply(s['B'], x)
+            Fastfood.fast_walsh_hadamard(w)
+            w = np.take(w, s['Pi'], axis=1)
+            np.multiply(s['G'], w, out=w)
+            Fastfood.fast_walsh_hadamard(w)
+            vx = scale * np.multiply(s['S'], w)
+            cols = slice(i*d, (i+1)*d)
+            if self.tradeoff == 'accuracy':
+                out[:, cols] = np.cos(vx)
+                out[:, n + i*d:n + (i+1)*d] = np.sin(vx)
+            else:
+                out[:, cols] = cos_cycles(vx, s['U'], np.sqrt(2. / n), *self.cosine)
+        if self.tradeoff == 'accuracy':
+            out /= np.sqrt(n)
+        return out
+
+    def save(self, filename):
+        """ header only bundle, load regenerates the parameters """
+        save_bundle(filename, { 'PROC' : np.ones(1, dtype=np.uint8) },
+                    d=self.d, n=self.n, k=self.k, d_orig=self.d_orig,
+                    gType=self.gType, tradeoff=self.tradeoff, seed=self.seed,
+                    sigma=self.sigma, density=self.density)
+
+    @staticmethod
+    def from_meta(meta):
+        return ProceduralFastfood(meta['seed'], sigma=meta['sigma'],
+                                  n_features=meta['d_orig'], n_dicts=meta['n'],
+                                  gType=meta['gType'],
+                                  sparsity=1-meta['density'],
+                                  tradeoff=meta['tradeoff'])
+
+    @staticmethod
+    def load(filename):
+        return ProceduralFastfood.from_meta(load_bundle(filename)[0])
+
+
+def _stack(args):
+    p, i = args
+    return p.stack(i)
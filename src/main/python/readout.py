@@ -0,0 +1,240 @@
+
+import numpy as np
+
+from Fastfood import issparse
+from cosine import POLY, cos_cycles, cos_lut1, cos_poly1, table
+from hadamard import fwht, fwht2
+from lazyjit import jit, prange
+
+"""
+Fused feature map and linear readout
+    predict(X, alpha) = transformSW(X) . alpha^T, alpha is (outputs x
+    n_outputs), one row per output / model
+
+    phi is never materialised. Each row is taken through the stacks one at a
+    time (B, H, P, G, H, S, cos on d lanes), every feature is multiplied into
+    the outputs as soon as it is computed. The working set is two vectors of
+    d lanes per thread, memory traffic is X, alpha and the (m x outputs)
+    predictions. Rows are split over the cores in blocks.
+
+    The features are the ones of transformSW (same operations, including the
+    cosine backend), only the order of the sums in the dot product differs.
+    Without numba the same stack by stack scheme runs on row blocks in NumPy.
+"""
+
+BLOCK = 64  # rows per task
+
+SPARSE_ROWS = 4096  # sparse X is densified this many rows at a time
+
+COSINE = { 'exact' : 0, 'lut' : 1, 'poly' : 2 }
+
+F8 = np.dtype(np.float64)
+
+
+def _predict_numpy(X, B, Pi, G, S, U, scale, amp, accuracy, cosmode, tab,
+                   interpolate, poly, alpha, out):
+    m, d_orig = X.shape
+    k, d = B.shape
+    n = k*d
+    backend = ('exact', 'lut', 'poly')[cosmode]
+    out[:] = 0
+    for lo in xrange(0, m, BLOCK):
+        hi = min(lo + BLOCK, m)
+        x = np.zeros((hi - lo, d))
+        x[:, :d_orig] = X[lo:hi]
+        for i in xrange(k):
+            cols = slice(i*d, (i+1)*d)
+            w = np.multiply(B[i], x)
+            fwht2(w)
+            w = np.take(w, Pi[cols], axis=1)
+            np.multiply(G[i], w, out=w)
+            fwht2(w)
+            v = scale * np.multiply(S[cols], w)
+            if accuracy:
+                out[lo:hi] += np.dot(np.cos(v) / np.sqrt(n), alpha[cols])
+                out[lo:hi] += np.dot(np.sin(v) / np.sqrt(n),
+                                     alpha[n + i*d:n + (i+1)*d])
+            else:
+                cos_cycles(v, U[cols], amp, backend, tab.shape[0] - 1, interpolate)
+                out[lo:hi] += np.dot(v, alpha[cols])
+
+@jit(nopython=True)
+def _cos(t, cosmode, tab, interpolate, poly):
+    if cosmode == 1:
+        return cos_lut1(t, tab, interpolate)
+    if cosmode == 2:
+        return cos_poly1(t, poly)
+    return np.cos(2*np.pi*t)
+
+@jit(nopython=True)
+def predict_row(x, B, Pi, G, S, U, scale, amp, accuracy, cosmode, tab,
+                interpolate, poly, alpha, w0, w1, y):
+    """
+    y = phi(x) . alpha for one row, alpha is (n_outputs x outputs), w0 and w1
+    are d lanes of scratch
+    """
+    k, d = B.shape
+    n = k*d
+    d_orig = x.shape[0]
+    for o in xrange(y.shape[0]):
+        y[o] = 0.
+    for i in xrange(k):
+        # B (padding lanes zero), H
+        for j in xrange(d_orig):
+            w0[j] = B[i, j] * x[j]
+        for j in xrange(d_orig, d):
+            w0[j] = 0.
+        fwht(w0)
+        # P, G (zero lanes of ternary G are not gathered), H
+        for j in xrange(d):
+            g = G[i, j]
+            w1[j] = g * w0[Pi[i*d + j]] if g != 0 else 0.
+        fwht(w1)
+        # S, cos, readout
+        for j in xrange(d):
+            w1[j] = scale * (S[i*d + j] * w1[j])
+        if accuracy:
+            for j in xrange(d):
+                c = i*d + j
+                fc = np.cos(w1[j]) / np.sqrt(n)
+                fs = np.sin(w1[j]) / np.sqrt(n)
+                for o in xrange(y.shape[0]):
+                    y[o] += fc * alpha[c, o] + fs * alpha[n + c, o]
+            continue
+        if cosmode == 0:
+            for j in xrange(d):
+                w1[j] = amp * np.cos(2*np.pi*(w1[j] + U[i*d + j]))
+        else:
+            for j in xrange(d):
+                w1[j] = amp * _cos(w1[j] + U[i*d + j], cosmode, tab,
+                                   interpolate, poly)
+        for j in xrange(d):
+            for o in xrange(y.shape[0]):
+                y[o] += w1[j] * alpha[i*d + j, o]
+
+@jit(nopython=True, parallel=True, fallback=_predict_numpy)
+def _predict(X, B, Pi, G, S, U, scale, amp, accuracy, cosmode, tab,
+             interpolate, poly, alpha, out):
+    m = X.shape[0]
+    d = B.shape[1]
+    for b in prange((m + BLOCK - 1) // BLOCK):
+        w0 = np.empty(d)
+        w1 = np.empty(d)
+        for r in xrange(b*BLOCK, min((b + 1)*BLOCK, m)):
+            predict_row(X[r], B, Pi, G, S, U, scale, amp, accuracy, cosmode,
+                        tab, interpolate, poly, alpha, w0, w1, out[r])
+
+
+def kernel_args(ff, alpha):
+    """
+    The model as arrays for _predict / predict_row. alpha is transposed, the
+    outputs of one feature are then next to each other
+    """
+    d, k = ff.d, ff.k
+    alpha = np.ascontiguousarray(np.atleast_2d(alpha), dtype=np.float64)
+    assert (alpha.shape[1] == ff.n_outputs()), "Error: alpha has the wrong size"
+    backend, lut_size, interpolate = ff.cosine
+    # Pi within each stack
+    Pi = np.ravel(ff.Pi) - np.repeat(np.arange(k)*d, d)
+    return (np.ascontiguousarray(ff.B, dtype=np.float64),
+            np.ascontiguousarray(Pi, dtype=np.int64),
+            np.ascontiguousarray(ff.G, dtype=np.float64).reshape(k, d),
+            np.ascontiguousarray(np.ravel(ff.S), dtype=np.float64),
+            np.ascontiguousarray(np.ravel(ff.U), dtype=np.float64),
+            1 / (ff.sigma * np.sqrt(d)),
+            np.sqrt(2. / ff.n) if ff.tradeoff == 'mem' else 1 / np.sqrt(ff.n),
+            ff.tradeoff == 'accuracy', COSINE[backend], table(lut_size),
+            interpolate, POLY, np.ascontiguousarray(alpha.T))
+
+class Predictor( object ):
+
+    def __init__( self, ff, alpha ):
+        """ predict for a fixed (model, alpha), the kernel arrays are kept """
+        self.d_orig = ff.d_orig
+        self.args = kernel_args(ff, alpha)
+        self.n_outputs = self.args[-1].shape[1]
+
+    def __call__(self, X, out=None):
+        """
+        transformSW(X) . alpha^T without the feature matrix, (m x outputs).
+        scipy.sparse X is made dense SPARSE_ROWS rows at a time
+        """
+        assert (X.shape[1] == self.d_orig)
+        shape = (X.shape[0], self.n_outputs)
+        if out is None:
+            out = np.empty(shape)
+        assert (out.shape == shape)
+        if issparse(X):
+            X = X.tocsr()
+            for lo in xrange(0, X.shape[0], SPARSE_ROWS):
+                hi = min(lo + SPARSE_ROWS, X.shape[0])
+                x = np.ascontiguousarray(X[lo:hi].toarray(), dtype=np.float64)
+                _predict(x, *(self.args + (out[lo:hi],)))
+            return out
+        X = np.ascontiguousarray(X, dtype=np.float64)
+        _predict(X, *(self.args + (out,)))
+        return out
+
+def predict(ff, X, alpha, out=None):
+    """ transformSW(X) . alpha^T without the feature matrix, (m x outputs) """
+    return Predictor(ff, alpha)(X, out=out)
+
+
+@jit(nopython=True)
+def _predict_one(x, F, I, poly, W):
+    """
+    predict_row on the packed layout of RowPredictor, five array arguments
+    keep the call overhead low
+    """
+    k, d, n_out, n_y = I[0], I[1], I[2], I[3]
+    if x.shape[0] != I[8]:
+        raise ValueError('x is not a single row of the model\'s width')
+    cosmode, accuracy, interpolate, lut = I[4], I[5], I[6], I[7]
+    n = k*d
+    o = 2
+    B = F[o:o + n].reshape((k, d))
+    o += n
+    G = F[o:o + n].reshape((k, d))
+    o += n
+    S = F[o:o + n]
+    o += n
+    U = F[o:o + n]
+    o += n
+    alpha = F[o:o + n_out*n_y].reshape((n_out, n_y))
+    o += n_out*n_y
+    tab = F[o:o + lut + 1]
+    predict_row(x, B, I[9:9 + n], G, S, U, F[0], F[1], accuracy != 0, cosmode,
+                tab, interpolate != 0, poly, alpha, W[:d], W[d:2*d],
+                W[2*d:2*d + n_y])
+
+
+class RowPredictor( object ):
+
+    def __init__( self, ff, alpha ):
+        """
+        Single sample phi(x) . alpha^T for per-event scoring. The model is
+        packed into a few preallocated arrays and the kernel compiled here,
+        a call allocates nothing (the result is a reused buffer)
+        """
+        (B, Pi, G, S, U, scale, amp, accuracy, cosmode, tab, interpolate,
+         poly, alpha) = kernel_args(ff, alpha)
+        self.d_orig = ff.d_orig
+        self.F = np.concatenate([[scale, amp], np.ravel(B), np.ravel(G), S, U,
+                                 np.ravel(alpha), tab])
+        self.I = np.concatenate([[ff.k, ff.d, alpha.shape[0], alpha.shape[1],
+                                  cosmode, accuracy, interpolate,
+                                  tab.shape[0] - 1, ff.d_orig], Pi]).astype(np.int64)
+        self.poly = poly
+        self.W = np.zeros(2*ff.d + alpha.shape[1])
+        self.y = self.W[2*ff.d:]
+        self.x = np.zeros(ff.d_orig)
+        self.kernel = _predict_one.compile()
+        self(self.x)
+
+    def __call__(self, x):
+        """ predictions for one row x (d_orig), a view into the buffer """
+        if type(x) is not np.ndarray or x.dtype is not F8:
+            self.x[:] = np.ravel(x)
+            x = self.x
+        self.kernel(x, self.F, self.I, self.poly, self.W)
+        return self.y
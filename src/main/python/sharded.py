@@ -0,0 +1,157 @@
+
+import mmap
+import multiprocessing
+import os
+import tempfile
+
+import numpy as np
+
+from Fastfood import Fastfood
+
+"""
+Process-pool transformSW for datasets larger than one core can handle
+    - rows are split into shards of shard_size rows, each worker runs
+      transform_chunk over its shards, so every row goes through exactly the
+      same operations as in the serial path (results are identical)
+    - the parameters are written once to a bundle (see bundle.py) and every
+      worker memory-maps it, B/G/P/S/U live in the shared page cache instead
+      of being pickled per task. The cosine backend (set_cosine) is passed
+      to the workers with it
+    - input and output are memory-mapped files. np.memmap arrays are used in
+      place, anything else goes through a scratch file in /dev/shm. tasks
+      only carry file names and row ranges, workers write their rows
+      straight into the output
+
+    The pool is kept between calls, close() (or the with block) stops it.
+    numba's own threads should be limited in the workers, eg.
+    NUMBA_NUM_THREADS=1, to avoid oversubscription.
+
+    Python 2 has no multiprocessing.shared_memory, file mappings (tmpfs when
+    /dev/shm exists) serve the same purpose.
+"""
+
+SHM = '/dev/shm'
+
+_worker = {}
+
+
+def scratch_dir():
+    """ tmpfs if available, so scratch arrays never touch the disk """
+    if os.path.isdir(SHM) and os.access(SHM, os.W_OK):
+        return SHM
+    return tempfile.gettempdir()
+
+def _is_mapped(a):
+    """ a is a whole np.memmap (not a view), so workers can map it by name """
+    return (isinstance(a, np.memmap) and isinstance(a.base, mmap.mmap) and
+            a.flags.c_contiguous and a.filename is not None)
+
+def _spec(a):
+    return (a.filename, a.offset, a.dtype.str, a.shape)
+
+def _scratch(shape, dtype):
+    fd, fname = tempfile.mkstemp(suffix='.npy', dir=scratch_dir())
+    os.close(fd)
+    return np.memmap(fname, dtype=dtype, mode='w+', shape=shape)
+
+def _init(bundle, chunk_size, cosine):
+    f = Fastfood.load(bundle, mmap=True)
+    # not part of the bundle
+    f.set_cosine(*cosine)
+    _worker['ff'] = f
+    _worker['buf'] = f.chunk_buffers(chunk_size)
+
+def _map(spec, mode):
+    # mapped per task: scratch names can be reused once unlinked
+    filename, offset, dtype, shape = spec
+    return np.memmap(filename, dtype=dtype, mode=mode, offset=offset, shape=shape)
+
+def _run(task):
+    """ worker: transform rows [lo, hi) of the input into the output """
+    x_spec, out_spec, lo, hi = task
+    f = _worker['ff']
+    buf = _worker['buf']
+    X = _map(x_spec, 'r')
+    out = _map(out_spec, 'r+')
+    step = buf['X'].shape[0]
+    for row in xrange(lo, hi, step):
+        end = min(row + step, hi)
+        f.transform_chunk(X[row:end], buf, out=out[row:end])
+    return hi - lo
+
+
+class ShardedTransform( object ):
+
+    def __init__( self, ff, n_jobs=None, shard_size=16384, chunk_size=1024 ):
+        """
+        ff          - fitted Fastfood
+        n_jobs      - worker processes (all cores by default)
+        shard_size  - rows per task
+        chunk_size  - rows per transform_chunk call inside a task
+        """
+        self.ff = ff
+        self.n_jobs = n_jobs or multiprocessing.cpu_count()
+        self.shard_size = shard_size
+        self.chunk_size = chunk_size
+
+        fd, self.bundle = tempfile.mkstemp(suffix='.ffb', dir=scratch_dir())
+        os.close(fd)
+        ff.save(self.bundle, hw=False)
+        self.pool = multiprocessing.Pool(self.n_jobs, _init,
+                                         (self.bundle, chunk_size, ff.cosine))
+
+    def transform(self, X, out=None):
+        """
+        transformSW(X) computed by the pool. out can be an array or np.memmap
+        of shape (m, n_outputs). Without out, the result is a memmap on an
+        unlinked scratch file (freed with the array)
+        """
+        m = X.shape[0]
+        assert (X.shape[1] == self.ff.d_orig)
+        shape = (m, self.ff.n_outputs())
+        scratch = []
+
+        if not _is_mapped(X):
+            x = _scratch(X.shape, np.float64)
+            x[:] = X
+            x.flush()
+            scratch.append(x.filename)
+            X = x
+
+        if out is not None and _is_mapped(out) and out.mode in ['r+', 'w+']:
+            assert (out.shape == shape)
+            result = out
+        else:
+            result = _scratch(shape, np.float64)
+            scratch.append(result.filename)
+
+        try:
+            tasks = [ (_spec(X), _spec(result), lo, min(lo + self.shard_size, m))
+                      for lo in xrange(0, m, self.shard_size) ]
+            done = sum(self.pool.imap_unordered(_run, tasks))
+            assert (done == m)
+        finally:
+            # mapped arrays stay valid after the files are unlinked
+            for fname in scratch:
+                os.remove(fname)
+
+        if out is None:
+            return result
+        if result is not out:
+            out[...] = result
+        elif isinstance(out, np.memmap):
+            out.flush()
+        return out
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+            os.remove(self.bundle)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
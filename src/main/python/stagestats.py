@@ -0,0 +1,92 @@
+
+import json
+import os
+import threading
+from collections import OrderedDict
+from timeit import default_timer as clock
+
+"""
+Per-stage counters for the Fastfood transform
+    - Fastfood.enable_stats() attaches a StageStats, every transform then
+      records wall time, rows and bytes allocated for each stage:
+        pad, B, FWHT1, P, G, FWHT2, S, phi
+    - totals are aggregated across calls (and threads), the individual
+      events are kept up to max_events for the Chrome trace
+    - disabled (the default, stats is None) costs one test per stage
+
+    summary() / to_json() give the totals, to_chrome_trace() writes a file
+    for chrome://tracing or Perfetto.
+"""
+
+
+class StageStats( object ):
+
+    def __init__( self, max_events=100000 ):
+        self.max_events = max_events
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.stages = OrderedDict()
+            self.events = []
+            self.t0 = clock()
+
+    @staticmethod
+    def start():
+        return clock()
+
+    def lap(self, stage, t0, rows=0, nbytes=0):
+        """ record stage as running from t0 until now, returns now """
+        t1 = clock()
+        with self.lock:
+            s = self.stages.get(stage)
+            if s is None:
+                s = self.stages[stage] = { 'calls' : 0, 'seconds' : 0.,
+                                           'rows' : 0, 'bytes' : 0 }
+            s['calls'] += 1
+            s['seconds'] += t1 - t0
+            s['rows'] += rows
+            s['bytes'] += nbytes
+            if len(self.events) < self.max_events:
+                self.events.append((stage, t0, t1, rows, nbytes,
+                                    threading.current_thread().ident))
+        return t1
+
+    def summary(self):
+        """ per-stage totals, plus each stage's share of the total time """
+        with self.lock:
+            total = sum(s['seconds'] for s in self.stages.values())
+            out = OrderedDict()
+            for name, s in self.stages.items():
+                out[name] = dict(s, share=s['seconds'] / total if total else 0.,
+                                 ns_per_row=1e9 * s['seconds'] / s['rows'] if s['rows'] else 0.)
+            return out
+
+    def to_json(self, filename=None):
+        """ the summary as a JSON string, also written to filename if given """
+        data = json.dumps(self.summary(), indent=1)
+        if filename is not None:
+            with open(filename, 'w') as f:
+                f.write(data)
+        return data
+
+    def to_chrome_trace(self, filename):
+        """ recorded events in the Chrome trace event format """
+        with self.lock:
+            events = [ { 'name' : stage, 'cat' : 'fastfood', 'ph' : 'X',
+                         'ts' : 1e6 * (t0 - self.t0), 'dur' : 1e6 * (t1 - t0),
+                         'pid' : os.getpid(), 'tid' : tid,
+                         'args' : { 'rows' : rows, 'bytes' : nbytes } }
+                       for stage, t0, t1, rows, nbytes, tid in self.events ]
+        with open(filename, 'w') as f:
+            json.dump({ 'traceEvents' : events, 'displayTimeUnit' : 'ms' }, f)
+
+    def __str__(self):
+        lines = ["%-6s %8s %10s %10s %12s %6s"%("stage", "calls", "seconds",
+                                               "rows", "MB", "share")]
+        for name, s in self.summary().items():
+            lines.append("%-6s %8d %10.4f %10d %12.2f %5.1f%%"%(
+                name, s['calls'], s['seconds'], s['rows'], s['bytes'] / 1e6,
+                100 * s['share']))
+        return "\n".join(lines)
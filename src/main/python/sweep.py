@@ -0,0 +1,127 @@
+
+import numpy as np
+
+from Fastfood import iter_row_blocks
+from cosine import cos_cycles
+
+"""
+Sigma sweep on a fitted Fastfood
+    sigma only enters after HGPHBX:
+        VX  = 1/(sigma*sqrt(d)) * S*HGPHBX
+        phi = cos(2*pi*(VX + U))*sqrt(2/n)           tradeoff mem
+              [cos(VX) | sin(VX)]/sqrt(n)             tradeoff accuracy
+    so S*HGPHBX is computed once for the training and test sets, every sigma
+    (and both tradeoffs) is then a rescale and a cosine, done in chunks into
+    feature buffers that are reused for the whole grid. The features are the
+    ones transformSW gives for a Fastfood with that sigma (same seed).
+
+    sw = SigmaSweep(f, X_train, X_test)
+    results = sw.run(np.logspace(0, 2, 50), y_train, y_test,
+                     tradeoffs=['mem', 'accuracy'])
+    print sw.best(results)
+
+    The scorer is any callable (phi_train, y_train, phi_test, y_test) ->
+    float, lower is better. The default fits a LinearSVR and returns the
+    test MSE, as in onlineTraining.py.
+"""
+
+
+def svr_mse(phi_train, y_train, phi_test, y_test):
+    from sklearn import svm
+    from sklearn.metrics import mean_squared_error
+    model = svm.LinearSVR()
+    model.fit(phi_train, y_train)
+    return mean_squared_error(y_test, model.predict(phi_test))
+
+
+class SigmaSweep( object ):
+
+    def __init__( self, ff, X_train, X_test=None, chunk_size=4096 ):
+        """
+        ff          - fitted Fastfood (its sigma is not used)
+        X_train     - training inputs, X_test optional test inputs
+        chunk_size  - rows per rescale / cosine pass
+        """
+        self.ff = ff
+        self.chunk_size = chunk_size
+        self.SV = [ self._prescale(X_train) ]
+        if X_test is not None:
+            self.SV.append(self._prescale(X_test))
+        self._buf = {}
+
+    def _prescale(self, X):
+        """ S*HGPHBX, computed chunk by chunk """
+        f = self.ff
+        out = np.empty((X.shape[0], f.n))
+        row = 0
+        for block in iter_row_blocks(X, self.chunk_size):
+            m = block.shape[0]
+            HGPHBX = f.apply_approximate_gaussian_matrix(f.B, f.G, f.P,
+                                                         f.pad_with_zeros(block))
+            np.multiply(np.ravel(f.S), HGPHBX.reshape(m, f.n),
+                        out=out[row:row + m])
+            row += m
+        return out
+
+    @property
+    def nbytes(self):
+        return sum(sv.nbytes for sv in self.SV)
+
+    def _buffer(self, i, tradeoff):
+        key = (i, tradeoff)
+        if key not in self._buf:
+            m = self.SV[i].shape[0]
+            n = self.ff.n
+            self._buf[key] = np.empty((m, 2*n if tradeoff == 'accuracy' else n))
+        return self._buf[key]
+
+    def features(self, sigma, tradeoff='mem', which=0):
+        """
+        phi for sigma, which = 0 for the training set, 1 for the test set.
+        The result is a buffer reused by the next call with the same
+        (tradeoff, which), copy it if it has to be kept
+        """
+        f = self.ff
+        n = f.n
+        SV = self.SV[which]
+        phi = self._buffer(which, tradeoff)
+        scale = 1 / (sigma * np.sqrt(f.d))
+        step = self.chunk_size
+        for lo in xrange(0, SV.shape[0], step):
+            hi = min(lo + step, SV.shape[0])
+            out = phi[lo:hi]
+            if tradeoff == 'accuracy':
+                vx = out[:, n:]
+                np.multiply(scale, SV[lo:hi], out=vx)
+                np.cos(vx, out=out[:, :n])
+                np.sin(vx, out=vx)
+                out /= np.sqrt(n)
+            else:
+                np.multiply(scale, SV[lo:hi], out=out)
+                cos_cycles(out, np.ravel(f.U), np.sqrt(2. / n), *f.cosine)
+        return phi
+
+    def run(self, sigmas, y_train, y_test=None, scorer=svr_mse,
+            tradeoffs=('mem',), verbose=False):
+        """
+        Score every (sigma, tradeoff). Without a test set the scorer gets the
+        training features twice. Returns a list of dicts
+        """
+        test = 1 if len(self.SV) > 1 else 0
+        if y_test is None:
+            y_test = y_train
+        results = []
+        for tradeoff in tradeoffs:
+            for sigma in sigmas:
+                phi_train = self.features(sigma, tradeoff, 0)
+                phi_test = self.features(sigma, tradeoff, test)
+                score = scorer(phi_train, y_train, phi_test, y_test)
+                results.append({ 'sigma' : float(sigma), 'tradeoff' : tradeoff,
+                                 'score' : float(score) })
+                if verbose:
+                    print "sigma %10.4f  %-8s  %g"%(sigma, tradeoff, score)
+        return results
+
+    @staticmethod
+    def best(results):
+        return min(results, key=lambda r: r['score'])
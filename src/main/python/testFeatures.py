@@ -7,6 +7,7 @@ from sklearn import datasets, svm, pipeline
 from sklearn.kernel_approximation import (RBFSampler,
                                           Nystroem)
 from Fastfood import Fastfood
+from dataset import load_csv
 
 
 """
@@ -70,8 +71,8 @@ mod1 = svm.LinearSVC()
 mod1.fit( phi_train, targets_train )
 fastfood_score = mod1.score( phi_test, targets_test )
 
-phi_train = np.loadtxt("../../../chiselFF_train1810128.csv", delimiter=',')
-phi_test = np.loadtxt("../../../chiselFF_test1810128.csv", delimiter=',')
+phi_train = load_csv("../../../chiselFF_train1810128.csv")
+phi_test = load_csv("../../../chiselFF_test1810128.csv")
 mod2 = svm.LinearSVC()
 mod2.fit( phi_train, targets_train )
 fastfood_score2 = mod2.score( phi_test, targets_test )
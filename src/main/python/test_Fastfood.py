@@ -0,0 +1,232 @@
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+
+from Fastfood import (Fastfood, _gather_lanes_numpy, _scatter_B_numpy,
+                      gather_lanes, scatter_B, sparse_random_matrix)
+
+"""
+Fastfood: every path against transformSW and the reference constructions
+"""
+
+# (n_features, n_dicts): padded and unpadded d
+SHAPES = [(16, 64), (11, 40)]
+
+
+def fitted(n_features=16, n_dicts=64, gType=1, tradeoff='mem', seed=3,
+           sparsity=0.5):
+    f = Fastfood(sigma=2., n_features=n_features, n_dicts=n_dicts,
+                 sparsity=sparsity, random_state=seed, tradeoff=tradeoff)
+    f.fit(gType=gType)
+    return f
+
+def models():
+    for nf, nd in SHAPES:
+        for gType in [0, 1, 2]:
+            for tradeoff in ['mem', 'accuracy']:
+                yield fitted(nf, nd, gType, tradeoff)
+
+
+class TestPermutation( unittest.TestCase ):
+
+    def test_Pi_is_the_inplace_take(self):
+        f = fitted(16, 64)
+        x = np.random.RandomState(0).randn(3, f.n)
+        y = x.copy()
+        np.take(y, f.P, axis=1, mode='wrap', out=y)
+        np.testing.assert_array_equal(y, x[:, f.Pi])
+
+    def test_Pi_stays_within_stacks(self):
+        f = fitted(16, 64)
+        np.testing.assert_array_equal(f.Pi // f.d, np.repeat(np.arange(f.k), f.d))
+
+
+class TestTransforms( unittest.TestCase ):
+
+    def setUp(self):
+        self.rng = np.random.RandomState(1)
+
+    def test_chunked_paths_equal_transformSW(self):
+        for f in models():
+            X = self.rng.randn(37, f.d_orig)
+            ref = f.transformSW(X)
+            np.testing.assert_array_equal(f.transform(X), ref)
+            np.testing.assert_array_equal(
+                f.transform(X, workspace=f.chunk_buffers(8)), ref)
+            np.testing.assert_array_equal(f.transformSW_stream(X, chunk_size=10), ref)
+            np.testing.assert_array_equal(
+                np.vstack([ b.copy() for b in f.transformSW_iter(X, chunk_size=16) ]),
+                ref)
+
+    def test_iterator_input(self):
+        f = fitted()
+        X = self.rng.randn(20, f.d_orig)
+        out = np.empty((20, f.n_outputs()))
+        f.transformSW_stream(iter([X[:7], X[7:]]), out=out, chunk_size=4)
+        np.testing.assert_array_equal(out, f.transformSW(X))
+
+    def test_sparse_input(self):
+        import scipy.sparse as sp
+        for f in models():
+            X = self.rng.randn(25, f.d_orig) * (self.rng.rand(25, f.d_orig) < 0.3)
+            ref = f.transformSW(X)
+            for fmt in [sp.csr_matrix, sp.csc_matrix]:
+                np.testing.assert_array_equal(f.transformSW(fmt(X)), ref)
+                np.testing.assert_array_equal(f.transform(fmt(X)), ref)
+
+    def test_hardware_matrices(self):
+        for nf, nd in SHAPES:
+            for gType in [0, 1, 2]:
+                f = fitted(nf, nd, gType)
+                X = self.rng.randn(5, nf)
+                sw = f.transformSW(X)
+                for task in ['Vp', 'Vg', 'Vf']:
+                    np.testing.assert_allclose(f.transformHW(X, task=task), sw,
+                                               rtol=0, atol=1e-9)
+
+    def test_stats_do_not_change_the_output(self):
+        f = fitted()
+        X = self.rng.randn(10, f.d_orig)
+        ref = f.transformSW(X)
+        f.enable_stats()
+        np.testing.assert_array_equal(f.transformSW(X), ref)
+        np.testing.assert_array_equal(f.transform(X), ref)
+
+    def test_stats_with_sparse_input(self):
+        import scipy.sparse as sp
+        for gType in [0, 1, 2]:
+            f = fitted(11, 40, gType)
+            X = self.rng.randn(10, f.d_orig) * (self.rng.rand(10, f.d_orig) < 0.3)
+            ref = f.transformSW(X)
+            f.enable_stats()
+            for fmt in [sp.csr_matrix, sp.csc_matrix]:
+                np.testing.assert_array_equal(f.transformSW(fmt(X)), ref)
+                np.testing.assert_array_equal(f.transform(fmt(X)), ref)
+
+
+class TestKernels( unittest.TestCase ):
+
+    def setUp(self):
+        self.rng = np.random.RandomState(6)
+
+    def test_gather_lanes_fallback(self):
+        src = self.rng.randn(7, 64)
+        lanes = np.flatnonzero(self.rng.rand(64) < 0.4)
+        idx = self.rng.randint(0, 64, lanes.size)
+        g = self.rng.choice([-1., 1.], lanes.size)
+        a, b = np.empty_like(src), np.empty_like(src)
+        gather_lanes(src, idx, g, lanes, a, False)
+        _gather_lanes_numpy(src, idx, g, lanes, b, False)
+        np.testing.assert_array_equal(a, b)
+        c = src.copy()
+        _gather_lanes_numpy(c, idx, g, lanes, c, True)
+        np.testing.assert_array_equal(c, a)
+
+    def test_scatter_B_fallback(self):
+        import scipy.sparse as sp
+        B = self.rng.randn(3, 16)
+        X = sp.random(9, 16, density=0.3, format='csr', random_state=0)
+        # duplicate entries are summed
+        X = sp.csr_matrix((np.r_[X.data, 1.5, -.25], np.r_[X.indices, 2, 2],
+                           np.r_[X.indptr[:-1], X.indptr[-1] + 2]), shape=X.shape)
+        a, b = np.empty((9, 48)), np.empty((9, 48))
+        scatter_B(X.data, X.indices, X.indptr, B, a)
+        _scatter_B_numpy(X.data, X.indices, X.indptr, B, b)
+        np.testing.assert_array_equal(a, b)
+        np.testing.assert_allclose(
+            a, (B[np.newaxis] * X.toarray()[:, np.newaxis]).reshape((9, 48)),
+            rtol=0, atol=1e-12)
+
+
+class TestSparseRandomMatrix( unittest.TestCase ):
+
+    def test_values_and_density(self):
+        coeff, G = sparse_random_matrix(200, 64, density=0.25, random_state=0)
+        self.assertEqual(G.shape, (200, 64))
+        self.assertTrue(set(np.unique(G)) <= set([-1, 0, 1]))
+        self.assertAlmostEqual(np.mean(G != 0), 0.25, delta=0.02)
+        self.assertAlmostEqual(coeff, np.sqrt(1 / 0.25) / np.sqrt(200))
+
+    def test_seeded(self):
+        a = sparse_random_matrix(8, 32, density=0.5, random_state=5)[1]
+        b = sparse_random_matrix(8, 32, density=0.5, random_state=5)[1]
+        np.testing.assert_array_equal(a, b)
+
+    def test_no_scipy(self):
+        code = ('import sys; from Fastfood import sparse_random_matrix; '
+                'sparse_random_matrix(4, 16, density=0.3, random_state=0); '
+                'sys.exit(\'scipy\' in sys.modules)')
+        here = os.path.dirname(os.path.abspath(__file__))
+        self.assertEqual(subprocess.call([sys.executable, '-c', code], cwd=here), 0)
+
+
+class TestBundle( unittest.TestCase ):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_save_load(self):
+        X = np.random.RandomState(2).randn(9, 11)
+        for gType in [0, 1, 2]:
+            f = fitted(11, 40, gType)
+            name = os.path.join(self.tmp, 'ff%d.ffb'%gType)
+            f.save(name, extra={ 'ALPHA' : np.ones((1, f.n)) })
+            for mmap in [True, False]:
+                g = Fastfood.load(name, mmap=mmap)
+                self.assertEqual((g.d, g.n, g.k, g.d_orig, g.T, g.tradeoff),
+                                 (f.d, f.n, f.k, f.d_orig, f.T, f.tradeoff))
+                for name_ in ['B', 'G', 'P', 'Pi', 'S', 'U', 'Vp', 'Vg']:
+                    np.testing.assert_array_equal(getattr(g, name_),
+                                                  getattr(f, name_))
+                np.testing.assert_array_equal(g.transformSW(X), f.transformSW(X))
+
+
+class TestGrow( unittest.TestCase ):
+
+    def test_split_does_not_matter(self):
+        for gType in [0, 1, 2]:
+            a, b = fitted(11, 16, gType), fitted(11, 16, gType)
+            a.grow(1)
+            a.grow(2)
+            b.grow(3)
+            for name in ['B', 'G', 'P', 'Pi', 'S', 'U']:
+                np.testing.assert_array_equal(getattr(a, name), getattr(b, name))
+
+    def test_existing_stacks_kept(self):
+        f = fitted(11, 16)
+        B, S, U = f.B.copy(), f.S.copy(), f.U.copy()
+        self.assertEqual(f.grow(2), 1)
+        self.assertEqual((f.k, f.n), (3, 48))
+        np.testing.assert_array_equal(f.B[:1], B)
+        np.testing.assert_array_equal(f.S[:1], S)
+        np.testing.assert_array_equal(f.U[:16], U)
+
+    def test_extend_features(self):
+        X = np.random.RandomState(4).randn(12, 11)
+        for tradeoff in ['mem', 'accuracy']:
+            f = fitted(11, 32, tradeoff=tradeoff)
+            phi = f.transformSW(X)
+            k0 = f.grow(2)
+            np.testing.assert_allclose(f.extend_features(phi, X, k0),
+                                       f.transformSW(X), rtol=0, atol=1e-12)
+            n0 = k0*f.d
+            cols = f.transform_stacks(X, k0)
+            ref = f.transformSW(X)
+            if tradeoff == 'accuracy':
+                ref = np.hstack([ref[:, n0:f.n], ref[:, f.n + n0:]])
+            else:
+                ref = ref[:, n0:]
+            np.testing.assert_array_equal(cols, ref)
+
+
+if __name__ == "__main__":
+    unittest.main()
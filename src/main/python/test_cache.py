@@ -0,0 +1,59 @@
+
+import modulefinder
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+import cache
+from cache import ModelCache
+
+"""
+ModelCache entries and the source digest
+"""
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# reachable from make_params.py, but never part of what is cached
+NOT_CACHED = ['cache.py', 'readout.py', 'sharded.py', 'stagestats.py']
+
+
+class TestModelCache( unittest.TestCase ):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_fit(self):
+        c = ModelCache(self.tmp)
+        kwargs = dict(sigma=2., n_features=11, n_dicts=32, random_state=5)
+        a = c.fit(gType=2, **kwargs)
+        key = c.key(gType=2, **kwargs)
+        self.assertTrue(c.get(key) is not None)
+        b = c.fit(gType=2, **kwargs)
+        for name in ['B', 'G', 'P', 'S', 'U']:
+            np.testing.assert_array_equal(getattr(a, name), getattr(b, name))
+
+    def test_corrupt_entry_is_dropped(self):
+        c = ModelCache(self.tmp)
+        c.fit(gType=1, n_features=4, n_dicts=8, random_state=1)
+        key = c.key(gType=1, n_features=4, n_dicts=8, random_state=1)
+        with open(c.path(key), 'ab') as f:
+            f.write(b'x')
+        self.assertTrue(c.get(key) is None)
+        self.assertFalse(os.path.exists(c.path(key)))
+
+    def test_sources_cover_the_export(self):
+        finder = modulefinder.ModuleFinder(path=[HERE])
+        finder.run_script(os.path.join(HERE, 'make_params.py'))
+        local = set( os.path.basename(m.__file__) for m in finder.modules.values()
+                     if m.__file__ and os.path.dirname(os.path.abspath(m.__file__)) == HERE )
+        self.assertEqual(local - set(NOT_CACHED), set(cache.SOURCES))
+
+
+if __name__ == "__main__":
+    unittest.main()
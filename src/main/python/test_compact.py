@@ -0,0 +1,54 @@
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from Fastfood import Fastfood
+from compact import CompactFastfood, pack_signs, unpack_signs
+from test_Fastfood import models
+
+"""
+CompactFastfood: the packed kernel and the expanded model against transformSW
+"""
+
+
+class TestCompact( unittest.TestCase ):
+
+    def setUp(self):
+        self.rng = np.random.RandomState(5)
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_signs_round_trip(self):
+        x = self.rng.randint(2, size=(3, 21))*2 - 1
+        np.testing.assert_array_equal(unpack_signs(pack_signs(x), 21), x)
+
+    def test_transform_equals_transformSW(self):
+        for f in models():
+            X = self.rng.randn(19, f.d_orig)
+            np.testing.assert_array_equal(f.compact().transform(X),
+                                          f.transformSW(X))
+
+    def test_expand(self):
+        for f in models():
+            g = f.compact().expand()
+            for name in ['B', 'G', 'P', 'Pi', 'S', 'U']:
+                np.testing.assert_array_equal(getattr(g, name), getattr(f, name))
+
+    def test_bundle(self):
+        for i, f in enumerate(models()):
+            name = os.path.join(self.tmp, 'c%d.ffb'%i)
+            f.compact().save(name)
+            X = self.rng.randn(7, f.d_orig)
+            ref = f.transformSW(X)
+            np.testing.assert_array_equal(CompactFastfood.load(name).transform(X), ref)
+            np.testing.assert_array_equal(Fastfood.load(name).transformSW(X), ref)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,48 @@
+
+import unittest
+
+import numpy as np
+
+import cosine
+from test_Fastfood import fitted
+
+"""
+Cosine backends: error bounds of cosine.py and the features they give
+"""
+
+
+class TestCosine( unittest.TestCase ):
+
+    def test_error_bounds(self):
+        n = 1 << 16
+        self.assertEqual(cosine.error('exact', n_points=n)['max'], 0.)
+        self.assertLess(cosine.error('lut', 512, n_points=n)['max'], 1.3e-2)
+        self.assertLess(cosine.error('lut', 512, True, n_points=n)['max'], 2e-5)
+        self.assertLess(cosine.error('poly', n_points=n)['max'], 1e-6)
+
+    def test_exact_is_transformSW(self):
+        f = fitted()
+        X = np.random.RandomState(3).randn(10, f.d_orig)
+        ref = f.transformSW(X)
+        f.set_cosine('exact')
+        np.testing.assert_array_equal(f.transformSW(X), ref)
+
+    def test_backends_in_every_path(self):
+        X = np.random.RandomState(4).randn(20, 11)
+        amp = np.sqrt(2. / 40)
+        for backend, bound in [('lut', 1.3e-2), ('poly', 1e-6)]:
+            f = fitted(11, 40)
+            f.set_cosine(backend)
+            ref = f.transformSW(X)
+            np.testing.assert_array_equal(f.transform(X), ref)
+            np.testing.assert_array_equal(f.transformSW_stream(X, chunk_size=8), ref)
+            self.assertLess(f.phi_error(X)['max'], bound*amp)
+
+    def test_accuracy_tradeoff_rejected(self):
+        f = fitted(tradeoff='accuracy')
+        self.assertRaises(ValueError, f.set_cosine, 'lut')
+        self.assertRaises(ValueError, fitted().set_cosine, 'cordic')
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from dataset import iter_rows, load_csv, read_rows
+
+"""
+load_csv against np.loadtxt
+"""
+
+
+class TestLoadCSV( unittest.TestCase ):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.data = np.random.RandomState(13).randn(500, 6) * 1e3
+        self.csv = os.path.join(self.tmp, 'data.csv')
+        np.savetxt(self.csv, self.data, delimiter=',', fmt='%.17g')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_equals_loadtxt(self):
+        ref = np.loadtxt(self.csv, delimiter=',')
+        for n_jobs in [1, 2]:
+            x = load_csv(self.csv, n_jobs=n_jobs, chunk_bytes=4096)
+            np.testing.assert_array_equal(x, ref)
+            # the second load comes from the cache
+            np.testing.assert_array_equal(load_csv(self.csv), ref)
+            os.remove(x.filename)
+
+    def test_usecols(self):
+        ref = np.loadtxt(self.csv, delimiter=',', usecols=[1, 4])
+        np.testing.assert_array_equal(load_csv(self.csv, usecols=[1, 4]), ref)
+
+    def test_usecols_order(self):
+        for usecols in [[5, 2], [3, 0, 4], [2, 2]]:
+            ref = np.loadtxt(self.csv, delimiter=',', usecols=usecols)
+            np.testing.assert_array_equal(load_csv(self.csv, usecols=usecols), ref)
+
+    def test_loadtxt_shapes(self):
+        one = os.path.join(self.tmp, 'one.csv')
+        np.savetxt(one, self.data[:, :1], delimiter=',', fmt='%.17g')
+        row = os.path.join(self.tmp, 'row.csv')
+        np.savetxt(row, self.data[:1], delimiter=',', fmt='%.17g')
+        cases = [ (one, None), (row, None), (self.csv, [3]), (row, [1]) ]
+        for filename, usecols in cases:
+            ref = np.loadtxt(filename, delimiter=',', usecols=usecols)
+            x = load_csv(filename, usecols=usecols)
+            self.assertEqual(x.shape, ref.shape)
+            np.testing.assert_array_equal(x, ref)
+        np.testing.assert_array_equal(read_rows(one, 3, 9), self.data[3:9, 0])
+        np.testing.assert_array_equal(np.hstack(list(iter_rows(one, chunk_size=64))),
+                                      self.data[:, 0])
+
+    def test_read_only(self):
+        x = load_csv(self.csv)
+        self.assertFalse(x.flags.writeable)
+        self.assertRaises(ValueError, x.__setitem__, 0, 0.)
+        y = load_csv(self.csv, mmap=False)
+        y[0] = 0.
+        np.testing.assert_array_equal(load_csv(self.csv)[1:], self.data[1:])
+
+    def test_rows(self):
+        ref = np.loadtxt(self.csv, delimiter=',')
+        np.testing.assert_array_equal(read_rows(self.csv, 100, 130), ref[100:130])
+        np.testing.assert_array_equal(
+            np.vstack(list(iter_rows(self.csv, 10, 490, chunk_size=64))),
+            ref[10:490])
+
+    def test_changed_file_is_parsed_again(self):
+        load_csv(self.csv)
+        np.savetxt(self.csv, self.data[:20], delimiter=',', fmt='%.17g')
+        os.utime(self.csv, (0, 0))
+        np.testing.assert_array_equal(load_csv(self.csv), self.data[:20])
+
+
+if __name__ == "__main__":
+    unittest.main()
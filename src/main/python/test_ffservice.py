@@ -0,0 +1,33 @@
+
+import io
+import unittest
+
+from ffservice import read_frame, write_frame
+
+"""
+ffservice framing: the status prefix utils.ffService checks
+"""
+
+
+def frame(header, body=b''):
+    f = io.BytesIO()
+    write_frame(f, header, body)
+    f.seek(0)
+    return f
+
+
+class TestFrames( unittest.TestCase ):
+
+    def test_status_first(self):
+        f = frame({ 'shape' : [2, 3], 'dtype' : '<f8', 'status' : 'ok' }, b'x')
+        self.assertTrue(f.getvalue()[4:].startswith(b'{"status": "ok", "dtype"'))
+        self.assertEqual(read_frame(f), ({ 'status' : 'ok', 'shape' : [2, 3],
+                                           'dtype' : '<f8' }, b'x'))
+
+    def test_error_mentioning_ok(self):
+        f = frame({ 'message' : 'IOError: "status": "ok"', 'status' : 'error' })
+        self.assertTrue(f.getvalue()[4:].startswith(b'{"status": "error"'))
+
+
+if __name__ == "__main__":
+    unittest.main()
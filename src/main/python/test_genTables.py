@@ -0,0 +1,50 @@
+
+import unittest
+
+import numpy as np
+
+from genTables import formatC, formatCoe, formatMem, linesC, toFixed
+
+"""
+genTables: the character array formatting against per-element formatting
+"""
+
+
+def reference_C(name, q):
+    q = np.asarray(q)
+    return ''.join('%s%s = (PRECTYPE) %d\n'%(name, ''.join('[%d]'%i for i in idx), v)
+                   for idx, v in np.ndenumerate(q))
+
+
+class TestFormat( unittest.TestCase ):
+
+    def setUp(self):
+        self.rng = np.random.RandomState(8)
+
+    def test_toFixed_rounds_half_away_from_zero(self):
+        np.testing.assert_array_equal(toFixed([0.5, -0.5, 1.25, -1.25, 0.2], 1),
+                                      [1, -1, 3, -3, 0])
+
+    def test_formatC(self):
+        for shape in [(1,), (9,), (12, 5)]:
+            for scale in [1, 100, 1 << 40]:
+                q = self.rng.randint(-scale, scale + 1, size=shape)
+                self.assertEqual(formatC('B', q), reference_C('B', q))
+        q = np.array([0, -1, 9, -10, 99, -100, 1000])
+        self.assertEqual(formatC('G', q), reference_C('G', q))
+
+    def test_formatC_blocks(self):
+        q = self.rng.randint(-1000, 1000, size=(7, 6))
+        self.assertEqual(b''.join(linesC('S', q, block=5)), formatC('S', q))
+
+    def test_formatMem(self):
+        q = np.array([0, 1, -1, 5, -128])
+        self.assertEqual(formatMem(q, 8, 16), b'00\n01\nff\n05\n80\n')
+        self.assertEqual(formatMem(q[:3], 4, 2), b'0000\n0001\n1111\n')
+        self.assertEqual(formatCoe(q[:2], 8),
+                         b'memory_initialization_radix=16;\n'
+                         b'memory_initialization_vector=\n00,\n01;\n')
+
+
+if __name__ == "__main__":
+    unittest.main()
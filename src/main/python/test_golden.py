@@ -0,0 +1,89 @@
+
+import unittest
+
+import numpy as np
+
+from golden import ParallelFF, fromFixed, mul, wrap
+from test_Fastfood import fitted
+
+"""
+golden.ParallelFF against a one sample, one register at a time model of
+parallel/ff.scala, and the split of compare()
+"""
+
+
+def scalar(model, x):
+    """ one sample through GPHBx (out.direct), HAD, LUT and OUT """
+    ff, bw, fw = model.ff, model.bitWidth, model.fracWidth
+    xq = model.quantise(x.reshape(1, -1))[0]
+    acc = np.zeros(ff.n, dtype=np.int64)
+    for i in xrange(ff.n):
+        for j in xrange(ff.d_orig):
+            acc[i] = wrap(acc[i] + (xq[j] if model.ram[i, j] > 0 else -xq[j]), bw)
+    for s in xrange(ff.k):
+        v = acc[s*ff.d:(s+1)*ff.d]
+        h = ff.d // 2
+        while h >= 1:
+            for i in xrange(ff.d):
+                if i & h == 0:
+                    a, b = v[i], v[i | h]
+                    v[i], v[i | h] = wrap(a + b, bw), wrap(a - b, bw)
+            h //= 2
+    phi = np.zeros(ff.n, dtype=np.int64)
+    for i in xrange(ff.n):
+        t = mul(acc[i], model.S[i], bw, fw)
+        phi[i] = model.tab[i, (t >> model.shift) & (model.lutSize - 1)]
+    y = 0
+    for i in xrange(ff.n):
+        y = wrap(y + mul(phi[i], model.alpha[i], bw, fw), bw)
+    return y
+
+
+class TestGolden( unittest.TestCase ):
+
+    def setUp(self):
+        self.rng = np.random.RandomState(14)
+
+    def model(self, gType, **kwargs):
+        f = fitted(11, 32, gType)
+        alpha = self.rng.normal(size=(1, f.n))
+        return ParallelFF(f, alpha, **kwargs)
+
+    def test_matches_scalar_model(self):
+        for gType in [0, 1, 2]:
+            for bw, fw in [(24, 16), (18, 10)]:
+                m = self.model(gType, bitWidth=bw, fracWidth=fw)
+                X = self.rng.randn(4, 11)
+                y = m.forward(X)['ypred']
+                for x, yi in zip(X, y):
+                    self.assertEqual(scalar(m, x), yi)
+
+    def test_ram_is_the_tester_encoding(self):
+        m = self.model(2)
+        Vg = m.ff.Vg
+        np.testing.assert_array_equal(m.ram == 1, Vg == 1)
+        self.assertTrue(np.any(Vg == 0))
+
+    def test_binary_G_has_no_model_error(self):
+        m = self.model(1)
+        X = self.rng.randn(200, 11)
+        err = m.compare(X)
+        for key in ['HGPHBX', 'phi', 'ypred']:
+            self.assertLess(err['model'][key][0], 1e-9)
+        self.assertLess(err['quantisation']['ypred'][0], 5e-2)
+        np.testing.assert_allclose(m.reference(X)['ypred'], m.model(X)['ypred'],
+                                   rtol=0, atol=1e-9)
+
+    def test_quantisation_is_small_for_every_gType(self):
+        X = self.rng.randn(200, 11)
+        for gType in [0, 2]:
+            m = self.model(gType)
+            err = m.compare(X)
+            self.assertLess(err['quantisation']['ypred'][0], 5e-2)
+            self.assertGreater(err['model']['HGPHBX'][0], 1.)
+            e = np.abs(m.predict(X) - m.reference(X)['ypred'])
+            self.assertAlmostEqual(np.max(e), err['quantisation']['ypred'][0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,53 @@
+
+import unittest
+
+import numpy as np
+
+from Fastfood import fht2
+from hadamard import _fwht2_numpy, fwht, fwht2
+
+"""
+fwht/fwht2 against the fht2 reference, bit for bit
+"""
+
+
+class TestFWHT( unittest.TestCase ):
+
+    def setUp(self):
+        self.rng = np.random.RandomState(7)
+
+    def test_fwht2_equals_fht2(self):
+        # small, radix-8/4/2 tails and more than one cache block
+        for d in [2, 4, 8, 16, 32, 64, 512, 4096]:
+            x = self.rng.randn(9, d)
+            a, b = x.copy(), x.copy()
+            fht2(a)
+            fwht2(b)
+            np.testing.assert_array_equal(a, b)
+
+    def test_numpy_fallback_equals_fht2(self):
+        for d in [2, 8, 64, 4096]:
+            x = self.rng.randn(5, d)
+            a, b = x.copy(), x.copy()
+            fht2(a)
+            _fwht2_numpy(b)
+            np.testing.assert_array_equal(a, b)
+
+    def test_single_row(self):
+        x = self.rng.randn(1, 256)
+        a, b = x.copy(), x[0].copy()
+        fht2(a)
+        fwht(b)
+        np.testing.assert_array_equal(a[0], b)
+
+    def test_float32_stays_float32(self):
+        x = self.rng.randn(4, 64).astype(np.float32)
+        fwht2(x)
+        self.assertEqual(x.dtype, np.float32)
+
+    def test_not_power_of_two(self):
+        self.assertRaises(ValueError, fwht2, np.zeros((2, 12)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,122 @@
+
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+import numpy as np
+
+from inference import InferenceClient, MicroBatcher, load_model, make_server
+from test_Fastfood import fitted
+
+"""
+MicroBatcher and the inference server against Fastfood.predict
+"""
+
+
+class TestMicroBatcher( unittest.TestCase ):
+
+    def setUp(self):
+        self.rng = np.random.RandomState(12)
+        self.ff = fitted(11, 40)
+        self.alpha = self.rng.randn(2, self.ff.n)
+        self.batcher = MicroBatcher(self.ff, self.alpha, max_batch=16)
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self.batcher.close()
+        shutil.rmtree(self.tmp)
+
+    def test_concurrent_requests(self):
+        X = [ self.rng.randn(i % 5 + 1, 11) for i in xrange(60) ]
+        y = [None]*len(X)
+
+        def client(lo):
+            for i in xrange(lo, len(X), 4):
+                y[i] = self.batcher.predict(X[i])
+        threads = [ threading.Thread(target=client, args=(i,)) for i in xrange(4) ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        for x, p in zip(X, y):
+            np.testing.assert_allclose(p, self.ff.predict(x, self.alpha),
+                                       rtol=1e-12, atol=1e-12)
+        stats = self.batcher.stats()
+        self.assertEqual(stats['requests'], 60)
+        self.assertEqual(stats['rows'], sum(x.shape[0] for x in X))
+        self.assertEqual(stats['queue_rows'], 0)
+
+    def test_wrong_width(self):
+        self.assertRaises(ValueError, self.batcher.predict, np.zeros((1, 3)))
+
+    def predict(self, X, timeout=10.):
+        """ batcher.predict, failing instead of hanging on a dead worker """
+        result = []
+        t = threading.Thread(target=lambda: result.append(self.batcher.predict(X)))
+        t.daemon = True
+        t.start()
+        t.join(timeout)
+        self.assertTrue(result, 'no answer from the batching worker')
+        return result[0]
+
+    def test_empty_request(self):
+        self.assertRaises(ValueError, self.batcher.predict, np.zeros((0, 11)))
+        self.assertTrue(self.batcher.worker.is_alive())
+        X = self.rng.randn(2, 11)
+        np.testing.assert_allclose(self.predict(X),
+                                   self.ff.predict(X, self.alpha),
+                                   rtol=1e-12, atol=1e-12)
+
+    def test_worker_survives_errors(self):
+        record = self.batcher._record
+
+        def broken(*args):
+            self.batcher._record = record
+            raise OverflowError('stats')
+        self.batcher._record = broken
+        X = self.rng.randn(2, 11)
+        # answered before the stats fail
+        self.predict(X)
+        self.assertTrue(self.batcher.worker.is_alive())
+        np.testing.assert_allclose(self.predict(X),
+                                   self.ff.predict(X, self.alpha),
+                                   rtol=1e-12, atol=1e-12)
+
+    def test_swap(self):
+        g = fitted(11, 64, seed=4)
+        alpha = self.rng.randn(2, g.n)
+        path = os.path.join(self.tmp, 'g.ffb')
+        g.save(path, hw=False, extra={ 'ALPHA' : alpha })
+        self.batcher.swap(path)
+        X = self.rng.randn(3, 11)
+        np.testing.assert_allclose(self.batcher.predict(X), g.predict(X, alpha),
+                                   rtol=1e-12, atol=1e-12)
+        self.assertEqual(self.batcher.stats()['swaps'], 1)
+        self.assertEqual(load_model(path)[1].shape, alpha.shape)
+
+    def test_server(self):
+        address = os.path.join(self.tmp, 'sock')
+        server = make_server(address, self.batcher)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        try:
+            c = InferenceClient(address)
+            X = self.rng.randn(4, 11)
+            np.testing.assert_allclose(c.predict(X), self.ff.predict(X, self.alpha),
+                                       rtol=1e-12, atol=1e-12)
+            self.assertRaises(RuntimeError, c.predict, np.zeros((1, 3)))
+            self.assertRaises(RuntimeError, c.predict, np.zeros((0, 11)))
+            np.testing.assert_allclose(c.predict(X), self.ff.predict(X, self.alpha),
+                                       rtol=1e-12, atol=1e-12)
+            self.assertEqual(c.stats()['requests'], 2)
+            c.close()
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,62 @@
+
+import unittest
+
+import numpy as np
+
+from golden import fromFixed, mul, mulTrunc, toFixed, wrap
+from online import OnlineRegressor
+
+"""
+OnlineRegressor against per-sample reference loops: NLMS in float64, the
+TRAIN registers with golden.py's fixed-point helpers
+"""
+
+
+def nlms(phi, y, eta, eps):
+    w = np.zeros(phi.shape[1])
+    for x, t in zip(phi, y):
+        e = t - np.dot(w, x)
+        w = w + eta * e * x / (eps + np.dot(x, x))
+    return w
+
+def train(phi, y, eta, bw, fw):
+    """ parallel/train.scala, one sample per step """
+    w = np.zeros(phi.shape[1], dtype=np.int64)
+    errors = []
+    for x, t in zip(phi, y):
+        ypred = wrap(np.sum(mul(x, w, bw, fw)), bw)
+        err = wrap(t - ypred, bw)
+        etaError = mulTrunc(eta, err, bw, fw)
+        w = wrap(w + mulTrunc(etaError, x, bw, fw), bw)
+        errors.append(err)
+    return w, np.array(errors)
+
+
+class TestOnline( unittest.TestCase ):
+
+    def setUp(self):
+        rng = np.random.RandomState(10)
+        self.phi = rng.uniform(-0.1, 0.1, size=(200, 32))
+        self.y = rng.randn(200)
+
+    def test_float(self):
+        model = OnlineRegressor(32, eta=0.1).fit(self.phi, self.y)
+        np.testing.assert_allclose(model.alpha[0], nlms(self.phi, self.y, 0.1, 1e-8),
+                                   rtol=1e-12, atol=1e-12)
+
+    def test_fixed(self):
+        bw, fw = 18, 10
+        model = OnlineRegressor(32, eta=0.5, fixed=True, bitWidth=bw,
+                                fracWidth=fw)
+        model.partial_fit(self.phi[:80], self.y[:80])
+        errors = model.errors_
+        model.partial_fit(self.phi[80:], self.y[80:])
+        w, err = train(toFixed(self.phi, fw), toFixed(self.y, fw),
+                       toFixed(0.5, fw), bw, fw)
+        np.testing.assert_array_equal(model.w, w)
+        np.testing.assert_array_equal(np.hstack([errors, model.errors_]),
+                                      fromFixed(err, fw))
+
+
+if __name__ == "__main__":
+    unittest.main()
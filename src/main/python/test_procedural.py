@@ -0,0 +1,96 @@
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from Fastfood import Fastfood
+from procedural import ProceduralFastfood, philox
+
+"""
+Philox4x32-10 known answers (Random123 kat_vectors) and procedural models
+against their materialised parameters
+"""
+
+KAT = [ ([0, 0, 0, 0], [0, 0],
+         [0x6627e8d5, 0xe169c58d, 0xbc57ac4c, 0x9b00dbd8]),
+        ([0xffffffff]*4, [0xffffffff]*2,
+         [0x408f276d, 0x41c83b0e, 0xa20bc7c6, 0x6d5451fd]),
+        ([0x243f6a88, 0x85a308d3, 0x13198a2e, 0x03707344],
+         [0xa4093822, 0x299f31d0],
+         [0xd16cfe09, 0x94fdcceb, 0x5001e420, 0x24126ea1]) ]
+
+
+class TestPhilox( unittest.TestCase ):
+
+    def test_known_answers(self):
+        for ctr, key, expected in KAT:
+            out = philox(np.array([ctr], dtype=np.uint64), key)
+            self.assertEqual([ int(w) for w in out[0] ], expected)
+
+    def test_vectorised(self):
+        ctr = np.array([ c for c, _, _ in KAT[:2] ], dtype=np.uint64)
+        out = philox(ctr, KAT[0][1])
+        self.assertEqual([ int(w) for w in out[0] ], KAT[0][2])
+
+
+class TestProcedural( unittest.TestCase ):
+
+    def setUp(self):
+        self.rng = np.random.RandomState(6)
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def generators(self):
+        for nf, nd in [(16, 64), (11, 40)]:
+            for gType in [0, 1, 2]:
+                for tradeoff in ['mem', 'accuracy']:
+                    yield ProceduralFastfood(1234, sigma=2., n_features=nf,
+                                             n_dicts=nd, gType=gType,
+                                             sparsity=0.5, tradeoff=tradeoff)
+
+    def test_transform_equals_materialised(self):
+        for p in self.generators():
+            X = self.rng.randn(13, p.d_orig)
+            np.testing.assert_array_equal(p.transform(X),
+                                          p.materialize().transformSW(X))
+
+    def test_stacks_in_any_order(self):
+        p = ProceduralFastfood(99, n_features=16, n_dicts=64, gType=2)
+        a = p.stacks(0, p.k)
+        b = [ p.stack(i) for i in reversed(xrange(p.k)) ][::-1]
+        for s, t in zip(a, b):
+            for name in s:
+                np.testing.assert_array_equal(s[name], t[name])
+
+    def test_fit_procedural(self):
+        f = Fastfood(sigma=2., n_features=11, n_dicts=40, random_state=1234)
+        f.fit(gType=1, procedural=True)
+        p = ProceduralFastfood(1234, sigma=2., n_features=11, n_dicts=40)
+        X = self.rng.randn(5, 11)
+        np.testing.assert_array_equal(f.transformSW(X), p.transform(X))
+
+    def test_header_only_bundle(self):
+        for i, p in enumerate(self.generators()):
+            name = os.path.join(self.tmp, 'p%d.ffb'%i)
+            p.save(name)
+            f = Fastfood.load(name)
+            g = p.materialize()
+            for attr in ['B', 'G', 'P', 'Pi', 'S', 'U']:
+                np.testing.assert_array_equal(getattr(f, attr), getattr(g, attr))
+
+    def test_grow_procedural(self):
+        a = Fastfood(sigma=2., n_features=11, n_dicts=16, random_state=8)
+        a.fit(gType=1, procedural=True)
+        a.grow(2)
+        b = ProceduralFastfood(8, sigma=2., n_features=11, n_dicts=48).materialize()
+        for name in ['B', 'G', 'P', 'Pi', 'S', 'U']:
+            np.testing.assert_array_equal(getattr(a, name), getattr(b, name))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+
+import unittest
+
+import numpy as np
+
+import readout
+from test_Fastfood import fitted, models
+
+"""
+Fused predict against transformSW(X) . alpha^T, for every cosine backend
+"""
+
+
+def backends(f):
+    yield ('exact', 512, False)
+    if f.tradeoff == 'mem':
+        yield ('lut', 512, False)
+        yield ('lut', 256, True)
+        yield ('poly', 512, False)
+
+
+class TestPredict( unittest.TestCase ):
+
+    def setUp(self):
+        self.rng = np.random.RandomState(9)
+
+    def test_predict(self):
+        for f in models():
+            X = self.rng.randn(150, f.d_orig)
+            alpha = self.rng.randn(3, f.n_outputs())
+            for cosine in backends(f):
+                f.set_cosine(*cosine)
+                ref = np.dot(f.transformSW(X), alpha.T)
+                np.testing.assert_allclose(f.predict(X, alpha), ref,
+                                           rtol=1e-10, atol=1e-10)
+
+    def test_row_predictor(self):
+        for f in models():
+            X = self.rng.randn(6, f.d_orig)
+            alpha = self.rng.randn(2, f.n_outputs())
+            for cosine in backends(f):
+                f.set_cosine(*cosine)
+                p = f.row_predictor(alpha)
+                ref = np.dot(f.transformSW(X), alpha.T)
+                for x, r in zip(X, ref):
+                    np.testing.assert_allclose(p(x), r, rtol=1e-10, atol=1e-10)
+                # lists and float32 go through the input buffer
+                np.testing.assert_allclose(p(list(X[0])), ref[0],
+                                           rtol=1e-10, atol=1e-10)
+
+    def test_sparse_input(self):
+        import scipy.sparse as sp
+        f = fitted(11, 40)
+        X = self.rng.randn(70, 11) * (self.rng.rand(70, 11) < 0.3)
+        alpha = self.rng.randn(1, f.n)
+        ref = f.predict(X, alpha)
+        rows = readout.SPARSE_ROWS
+        try:
+            # densified in several row blocks, the last one partial
+            readout.SPARSE_ROWS = 16
+            for fmt in [sp.csr_matrix, sp.csc_matrix]:
+                np.testing.assert_array_equal(f.predict(fmt(X), alpha), ref)
+        finally:
+            readout.SPARSE_ROWS = rows
+
+    def test_out(self):
+        f = fitted()
+        X = self.rng.randn(5, f.d_orig)
+        alpha = self.rng.randn(1, f.n)
+        out = np.empty((5, 1))
+        self.assertTrue(f.predict(X, alpha, out=out) is out)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from sharded import ShardedTransform
+from test_Fastfood import fitted
+
+"""
+ShardedTransform against the serial transformSW
+"""
+
+
+class TestSharded( unittest.TestCase ):
+
+    def setUp(self):
+        self.rng = np.random.RandomState(11)
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_equals_serial(self):
+        for tradeoff in ['mem', 'accuracy']:
+            f = fitted(11, 40, tradeoff=tradeoff)
+            X = self.rng.randn(101, 11)
+            ref = f.transformSW(X)
+            with ShardedTransform(f, n_jobs=2, shard_size=16, chunk_size=5) as st:
+                np.testing.assert_array_equal(st.transform(X), ref)
+                out = np.empty_like(ref)
+                self.assertTrue(st.transform(X, out=out) is out)
+                np.testing.assert_array_equal(out, ref)
+
+    def test_cosine_backends(self):
+        X = self.rng.randn(60, 11)
+        for cosine in [('exact', 512, False), ('lut', 512, False),
+                       ('lut', 256, True), ('poly', 512, False)]:
+            f = fitted(11, 40)
+            f.set_cosine(*cosine)
+            np.testing.assert_array_equal(
+                f.transformSW_parallel(X, n_jobs=2, shard_size=16),
+                f.transformSW(X))
+
+    def test_memmaps(self):
+        f = fitted(11, 40)
+        X = np.memmap(os.path.join(self.tmp, 'x'), dtype=np.float64, mode='w+',
+                      shape=(50, 11))
+        X[:] = self.rng.randn(50, 11)
+        X.flush()
+        out = np.memmap(os.path.join(self.tmp, 'out'), dtype=np.float64,
+                        mode='w+', shape=(50, f.n))
+        f.transformSW_parallel(X, out=out, n_jobs=2, shard_size=8)
+        np.testing.assert_array_equal(out, f.transformSW(np.array(X)))
+
+
+if __name__ == "__main__":
+    unittest.main()
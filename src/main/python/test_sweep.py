@@ -0,0 +1,48 @@
+
+import unittest
+
+import numpy as np
+
+from Fastfood import Fastfood
+from sweep import SigmaSweep
+
+"""
+SigmaSweep features against transformSW of a model fitted with that sigma
+"""
+
+
+def model(sigma, tradeoff='mem'):
+    f = Fastfood(sigma=sigma, n_features=11, n_dicts=40, random_state=2,
+                 tradeoff=tradeoff)
+    f.fit(gType=1)
+    return f
+
+
+class TestSweep( unittest.TestCase ):
+
+    def test_features(self):
+        rng = np.random.RandomState(0)
+        X_train, X_test = rng.randn(30, 11), rng.randn(12, 11)
+        sw = SigmaSweep(model(1.), X_train, X_test, chunk_size=8)
+        for sigma in [0.5, 3., 20.]:
+            for tradeoff in ['mem', 'accuracy']:
+                f = model(sigma, tradeoff)
+                np.testing.assert_array_equal(sw.features(sigma, tradeoff, 0),
+                                              f.transformSW(X_train))
+                np.testing.assert_array_equal(sw.features(sigma, tradeoff, 1),
+                                              f.transformSW(X_test))
+
+    def test_run(self):
+        rng = np.random.RandomState(1)
+        X, y = rng.randn(20, 11), rng.randn(20)
+        sw = SigmaSweep(model(1.), X)
+        scores = iter(range(4, 0, -1))
+        results = sw.run([1., 2.], y, scorer=lambda *args: next(scores),
+                         tradeoffs=['mem', 'accuracy'])
+        self.assertEqual(len(results), 4)
+        self.assertEqual(SigmaSweep.best(results),
+                         { 'sigma' : 2., 'tradeoff' : 'accuracy', 'score' : 1. })
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -126,6 +126,117 @@ object preprocess
 
 
 
+/*
+reads the binary parameter bundle written by make_params.py (see bundle.py for
+the layout). returns each array flattened, with its shape
+*/
+object ffBundle
+{
+  def ascii( buf : java.nio.ByteBuffer, pos : Int, len : Int ) : String = {
+    new String( (0 until len).map( x => buf.get( pos + x ) ).takeWhile( _ != 0 ).toArray, "US-ASCII" )
+  }
+
+  def apply( filename : String ) : Map[String, (List[Int], Array[Double])] = {
+
+    val ch = new java.io.RandomAccessFile( filename, "r" ).getChannel
+    val buf = ch.map( java.nio.channels.FileChannel.MapMode.READ_ONLY, 0, ch.size )
+    buf.order( java.nio.ByteOrder.LITTLE_ENDIAN )
+    ch.close()
+
+    Predef.assert( ascii( buf, 0, 8 ) == "FFBUNDLE", "Error: "+filename+" is not a parameter bundle" )
+    Predef.assert( buf.getInt( 8 ) == 1, "Error: unsupported bundle version" )
+
+    val n_arrays = buf.getInt( 12 )
+    (0 until n_arrays).map( ix => {
+      val e = 128 + 64*ix
+      val name = ascii( buf, e, 16 )
+      val dtype = ascii( buf, e+16, 8 )
+      val offset = buf.getLong( e+24 ).toInt
+      val ndim = buf.getInt( e+32 )
+      val shape = (0 until ndim).map( iy => buf.getLong( e+40+8*iy ).toInt ).toList
+      val size = shape.product
+      val data = dtype match {
+        case "<f8" => Array.tabulate( size )( iy => buf.getDouble( offset + 8*iy ) )
+        case "<f4" => Array.tabulate( size )( iy => buf.getFloat( offset + 4*iy ).toDouble )
+        case "<i8" => Array.tabulate( size )( iy => buf.getLong( offset + 8*iy ).toDouble )
+        case "<i4" => Array.tabulate( size )( iy => buf.getInt( offset + 4*iy ).toDouble )
+        case "<i2" => Array.tabulate( size )( iy => buf.getShort( offset + 2*iy ).toDouble )
+        case "|i1" => Array.tabulate( size )( iy => buf.get( offset + iy ).toDouble )
+        case "|u1" => Array.tabulate( size )( iy => ( buf.get( offset + iy ) & 0xff ).toDouble )
+        case "<u2" => Array.tabulate( size )( iy => ( buf.getShort( offset + 2*iy ) & 0xffff ).toDouble )
+        case "<u4" => Array.tabulate( size )( iy => ( buf.getInt( offset + 4*iy ) & 0xffffffffL ).toDouble )
+        case _ => throw new Exception("Error: unsupported dtype "+dtype+" in "+filename)
+      }
+      ( name, ( shape, data ) )
+    }).toMap
+  }
+}
+
+
+/*
+client for the long-lived parameter service (ffservice.py). one python process
+is started on first use and shared by every tester in the JVM, so a test
+session pays the python start-up once. set FASTFOOD_SERVICE=0 to run
+make_params.py per tester instead
+*/
+object ffService
+{
+  val enabled = sys.env.getOrElse( "FASTFOOD_SERVICE", "1" ) != "0"
+
+  lazy val proc = {
+    val pb = new ProcessBuilder( "python", "src/main/python/ffservice.py", "--stdio" )
+    pb.redirectError( ProcessBuilder.Redirect.INHERIT )
+    pb.start()
+  }
+  lazy val out = new java.io.BufferedOutputStream( proc.getOutputStream )
+  lazy val in = new java.io.DataInputStream( new java.io.BufferedInputStream( proc.getInputStream ) )
+
+  def le( n : Int ) : java.nio.ByteBuffer = {
+    java.nio.ByteBuffer.allocate( n ).order( java.nio.ByteOrder.LITTLE_ENDIAN )
+  }
+
+  // one framed request, returns the response header (JSON) and body
+  def request( header : String, body : Array[Byte] = Array[Byte]() ) : (String, Array[Byte]) = synchronized {
+    val head = header.getBytes( "UTF-8" )
+    out.write( le( 4 ).putInt( head.length ).array )
+    out.write( head )
+    out.write( le( 8 ).putLong( body.length ).array )
+    out.write( body )
+    out.flush()
+
+    val hb = new Array[Byte]( 4 )
+    in.readFully( hb )
+    val resp = new Array[Byte]( le( 4 ).put( hb ).getInt( 0 ) )
+    in.readFully( resp )
+    val bb = new Array[Byte]( 8 )
+    in.readFully( bb )
+    val data = new Array[Byte]( le( 8 ).put( bb ).getLong( 0 ).toInt )
+    in.readFully( data )
+
+    // ffservice.py writes status as the first key
+    val reply = new String( resp, "UTF-8" )
+    Predef.assert( reply.startsWith( "{\"status\": \"ok\"" ), "Error: ffservice: "+reply )
+    (reply, data)
+  }
+
+  // s as a JSON string literal
+  def quote( s : String ) : String = {
+    "\"" + s.flatMap {
+      case '"'  => "\\\""
+      case '\\' => "\\\\"
+      case c if c < ' ' => "\\" + "u%04x".format( c.toInt )
+      case c => c.toString
+    } + "\""
+  }
+
+  // writes the bundle make_params.py would write to filename
+  def params( n_dicts : Int, n_features : Int, gType : Int, filename : String ) = {
+    val path = new java.io.File( filename ).getAbsolutePath
+    request( f"""{"op": "params", "n_dicts": $n_dicts, "n_features": $n_features, "gType": $gType, "path": ${quote( path )}}""" )
+  }
+}
+
+
 class FastFoodTest( var n_dicts : Int, var n_features : Int, 
                     var gType : String = "binary", var n_examples : Int = 10 )
 {
@@ -142,6 +253,16 @@ class FastFoodTest( var n_dicts : Int, var n_features : Int,
 
   }
 
+  // binary bundle from make_params.py. the CSVs are only written with "csv"
+  lazy val bundle = ffBundle( ".tmp/params.ffb" )
+
+  // matrix rows as doubles. 1-D arrays give one row per entry, like np.savetxt
+  def table( name : String ) : List[List[Double]] = {
+    val (shape, data) = bundle( name )
+    if ( shape.length == 2 ) data.grouped( shape(1) ).map( x => x.toList ).toList
+    else data.map( x => List( x ) ).toList
+  }
+
   // this is where the data is made
   // could accept a dataset param, an rng param, and n_examples param
   def make() = {
@@ -158,51 +279,56 @@ class FastFoodTest( var n_dicts : Int, var n_features : Int,
       throw new Exception("select either binary/ternary/normal")
     }
 
-    var cmd = "python src/main/python/make_params.py "+
-              f"$n_dicts $n_features $g /.tmp"
-    cmd !
+    if ( ffService.enabled ){
+      new java.io.File( ".tmp" ).mkdirs()
+      ffService.params( n_dicts, n_features, g, ".tmp/params.ffb" )
+    } else {
+      var cmd = "python src/main/python/make_params.py "+
+                f"$n_dicts $n_features $g /.tmp"
+      cmd !
+    }
 
   }
 
   def S( fracWidth : Int ): List[List[BigInt]] = {
     try{
-        openCSV( ".tmp/S.csv" ).map(x => x.map(y => toFixed(y.trim.toDouble, fracWidth)))
+        table( "S_hw" ).map(x => x.map(y => toFixed(y, fracWidth)))
       } catch{
-          case x:Exception => throw new Exception("Error: .tmp/S.csv")
+          case x:Exception => throw new Exception("Error: S_hw in .tmp/params.ffb")
       }
     
   }
 
   def U(): List[List[Double]] = {
     try{
-        openCSV( ".tmp/U.csv" ).map(x => x.map(y => y.trim.toDouble ) )
+        table( "U_hw" )
       } catch{
-          case x:Exception => throw new Exception("Error: .tmp/U.csv")
+          case x:Exception => throw new Exception("Error: U_hw in .tmp/params.ffb")
       }
     
   }
 
   def B(): List[List[Int]] = {
     try{
-        openCSV( ".tmp/B.csv" ).map(x => x.map(y => ((y.toDouble+1)/2.0).toInt ) )
+        table( "B" ).map(x => x.map(y => ((y+1)/2.0).toInt ) )
       } catch{
-          case x:Exception => throw new Exception("Error: .tmp/B.csv")
+          case x:Exception => throw new Exception("Error: B in .tmp/params.ffb")
       }
   }
 
   def H(): List[List[Int]] = {
     try{
-        openCSV( ".tmp/H.csv" ).map(x => x.map(y => ((y.toDouble+1)/2.0).toInt ) )
+        table( "H" ).map(x => x.map(y => ((y+1)/2.0).toInt ) )
       } catch{
-          case x:Exception => throw new Exception("Error: .tmp/H.csv")
+          case x:Exception => throw new Exception("Error: H in .tmp/params.ffb")
       }
   }
 
   def G( fracWidth : Int ): List[List[BigInt]] = {
     try{
-        openCSV( ".tmp/G.csv" ).map(x => x.map(y => toFixed(y.trim.toDouble, fracWidth)))
+        table( "G" ).map(x => x.map(y => toFixed(y, fracWidth)))
       } catch{
-          case x:Exception => throw new Exception("Error: .tmp/G.csv")
+          case x:Exception => throw new Exception("Error: G in .tmp/params.ffb")
       }
   }
 
@@ -217,38 +343,38 @@ class FastFoodTest( var n_dicts : Int, var n_features : Int,
       //2. if none equal 0 - just do binarised
       //3. else - to ternary 
 
-      openCSV( ".tmp/GPHB.csv" )
-        .map(x => x.map(y => if (y.toDouble.toInt==0) List(0,0) else List((y.toDouble+1/2.0).toInt,1) )
+      table( "Vg" )
+        .map(x => x.map(y => if (y.toInt==0) List(0,0) else List((y+1/2.0).toInt,1) )
         .flatten)
 
     } else{
       // converts -1, +1 to 0 and 1
-      openCSV( ".tmp/GPHB.csv" )
-      .map(x => x.map(y => ((y.toDouble+1)/2.0).toInt ) )
+      table( "Vg" )
+      .map(x => x.map(y => ((y+1)/2.0).toInt ) )
     } 
   }
 
   def PHB(): List[List[Int]] = {
     try{
-        openCSV( ".tmp/PHB.csv" ).map(x => x.map(y => ((y.toDouble+1)/2.0).toInt ) )
+        table( "Vp" ).map(x => x.map(y => ((y+1)/2.0).toInt ) )
       } catch{
-          case x:Exception => throw new Exception("Error: .tmp/PHB.csv")
+          case x:Exception => throw new Exception("Error: Vp in .tmp/params.ffb")
       }
   }
 
   def X( fracWidth : Int ): List[List[BigInt]] = {
     try{
-        openCSV( ".tmp/X.csv" ).map(x => x.map(y => toFixed(y.trim.toDouble, fracWidth)))
+        table( "X" ).map(x => x.map(y => toFixed(y, fracWidth)))
       } catch{
-          case x:Exception => throw new Exception("Error: .tmp/X.csv")
+          case x:Exception => throw new Exception("Error: X in .tmp/params.ffb")
       }
   }
 
   def ALPHA(): List[List[Double]] = {
     try{
-        openCSV( ".tmp/ALPHA.csv" ).map( x => x.map(y => y.trim.toDouble) )
+        table( "ALPHA" )
       } catch{
-          case x:Exception => throw new Exception("Error: .tmp/ALPHA.csv")
+          case x:Exception => throw new Exception("Error: ALPHA in .tmp/params.ffb")
       }
   }
 